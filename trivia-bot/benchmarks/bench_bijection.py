@@ -0,0 +1,89 @@
+"""
+Микро-бенчмарк сохранения и восстановления состояний бота через BotStateToDictBijection.
+Запуск из директории trivia-bot: python -m benchmarks.bench_bijection
+"""
+import argparse
+import timeit
+from typing import List, Sequence
+from core.bot_state import BotState
+from core.bot_state_logging_wrapper import BotStateLoggingWrapper
+from core.random import RandomImpl, T
+from core.utils import JsonDict
+from trivia.bijection import BotStateToDictBijection
+from trivia.bot_config import GameConfig
+from trivia.bot_state import BotStateFactory, GreetingState
+from trivia.question_storage import Question, QuestionStorage, InMemoryQuestionStorage
+from benchmarks.bench_game_start import make_questions
+
+
+class CountingQuestionStorage(QuestionStorage):
+    """
+    Хранилище вопросов, которое считает количество чтений
+    """
+    def __init__(self, inner: QuestionStorage):
+        self.inner = inner
+        self.load_count = 0
+
+    def load_questions(self) -> List[Question]:
+        self.load_count += 1
+        return self.inner.load_questions()
+
+
+class CountingRandom(RandomImpl):
+    """
+    Random, который считает количество вызовов
+    """
+    def __init__(self):
+        self.call_count = 0
+
+    def shuffle(self, data: list) -> None:
+        self.call_count += 1
+        super().shuffle(data)
+
+    def sample(self, data: Sequence[T], k: int) -> List[T]:
+        self.call_count += 1
+        return super().sample(data, k)
+
+
+def legacy_backward(state_factory: BotStateFactory, obj: JsonDict) -> BotState:
+    """
+    Прежний способ восстановления InGameState: создать новую игру и загрузить в нее сохраненные данные
+    """
+    bot_state = state_factory.create_in_game_state()
+    bot_state.load(obj["bot_state_data"])
+    return BotStateLoggingWrapper(bot_state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк BotStateToDictBijection")
+    parser.add_argument("-repeat", type=int, default=10000, help="Количество повторов для каждого состояния")
+    parser.add_argument("-questions", type=int, default=10000, help="Количество вопросов в каталоге")
+    args = parser.parse_args()
+
+    storage = CountingQuestionStorage(InMemoryQuestionStorage(make_questions(args.questions)))
+    random = CountingRandom()
+    state_factory = BotStateFactory(storage, random, GameConfig.make(5, 5, 5))
+    bijection = BotStateToDictBijection(state_factory)
+    states = {
+        "GreetingState": BotStateLoggingWrapper(GreetingState(state_factory)),
+        "IdleState": BotStateLoggingWrapper(state_factory.create_idle_state()),
+        "InGameState": BotStateLoggingWrapper(state_factory.create_in_game_state()),
+    }
+
+    print(f"{'state':>14} {'forward, us':>12} {'backward, us':>13} {'storage loads':>14} {'random calls':>13}")
+    for name, state in states.items():
+        encoded = bijection.forward(state)
+        forward_time = timeit.timeit(lambda: bijection.forward(state), number=args.repeat) / args.repeat
+        load_count = storage.load_count
+        random_calls = random.call_count
+        backward_time = timeit.timeit(lambda: bijection.backward(encoded), number=args.repeat) / args.repeat
+        print(f"{name:>14} {forward_time * 1e6:>12.2f} {backward_time * 1e6:>13.2f} "
+              f"{storage.load_count - load_count:>14} {random.call_count - random_calls:>13}")
+
+    encoded = bijection.forward(states["InGameState"])
+    legacy_time = timeit.timeit(lambda: legacy_backward(state_factory, encoded), number=args.repeat) / args.repeat
+    print(f"InGameState backward through a new game (legacy): {legacy_time * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Бенчмарк создания новой игры в зависимости от размера каталога вопросов.
+Запуск из директории trivia-bot: python -m benchmarks.bench_game_start
+"""
+import argparse
+import random
+import timeit
+from typing import List
+from core.random import RandomImpl
+from trivia.bot_config import GameConfig
+from trivia.bot_state import BotStateFactory
+from trivia.question_storage import Question, InMemoryQuestionStorage
+
+
+CATALOG_SIZES = [1_000, 10_000, 100_000, 300_000]
+
+
+def make_questions(count: int) -> List[Question]:
+    """
+    Создает `count` вопросов, равномерно распределенных по сложности
+    """
+    difficulties = list(Question.Difficulty)
+    return [
+        Question(f"Вопрос {i}", [f"Ответ {j}" for j in range(4)], 1, difficulties[i % len(difficulties)], 0)
+        for i in range(count)
+    ]
+
+
+def legacy_select(questions: List[Question], config: GameConfig) -> List[Question]:
+    """
+    Прежний способ выбора вопросов: перемешать весь каталог и найти нужные вопросы линейным проходом
+    """
+    all_questions = list(questions)
+    random.shuffle(all_questions)
+    counts = {
+        Question.Difficulty.EASY: config.easy_question_count,
+        Question.Difficulty.MEDIUM: config.medium_question_count,
+        Question.Difficulty.HARD: config.hard_question_count
+    }
+    selected = []
+    for question in all_questions:
+        if counts[question.difficulty] > 0:
+            selected.append(question)
+            counts[question.difficulty] -= 1
+        if not any(counts.values()):
+            break
+    return sorted(selected, key=lambda q: q.difficulty)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк создания новой игры")
+    parser.add_argument("-repeat", type=int, default=200, help="Количество созданий игры для каждого размера")
+    args = parser.parse_args()
+
+    config = GameConfig.make(5, 5, 5)
+    print(f"{'questions':>10} {'game start, us':>15} {'legacy select, us':>18}")
+    for size in CATALOG_SIZES:
+        questions = make_questions(size)
+        state_factory = BotStateFactory(InMemoryQuestionStorage(questions), RandomImpl(), config)
+        start_time = timeit.timeit(state_factory.create_in_game_state, number=args.repeat) / args.repeat
+        legacy_repeat = max(1, args.repeat // 20)
+        legacy_time = timeit.timeit(lambda: legacy_select(questions, config), number=legacy_repeat) / legacy_repeat
+        print(f"{size:>10} {start_time * 1e6:>15.1f} {legacy_time * 1e6:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
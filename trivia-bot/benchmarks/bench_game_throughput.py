@@ -0,0 +1,193 @@
+"""
+Бенчмарк пропускной способности бота. Имитирует `-chats` чатов, которые одновременно играют по `-games` полных игр:
+приветствие, /start, ответы на вопросы кнопками до конца игры. Update передаются в Bot.process_update, одновременно
+обрабатывается не больше `-workers` update, как в UpdateDispatcher. Сообщения отправляются в RecordingTelegramApi,
+а состояния чатов хранятся в RedisChatStateStorage поверх Redis в памяти. Задержка update считается с момента,
+когда обработчик взял его в работу. Выводит количество update и игр в секунду и задержку обработки update каждого типа.
+Запуск из директории trivia-bot: python -m benchmarks.bench_game_throughput
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List
+from core.bot import Bot
+from core.chat_state_storage import RedisChatStateStorage
+from core.random import RandomImpl
+from core.state_cache import StateCache
+from core.utils import JsonDict
+from trivia.bijection import BotStateToDictBijection
+from trivia.bot_config import GameConfig
+from trivia.bot_state import BotStateFactory, GreetingState
+from trivia.question_storage import InMemoryQuestionStorage
+from trivia.state_codec import make_state_codec
+from trivia.telegram_models import Update
+from benchmarks.bench_game_start import make_questions
+from benchmarks.fakes import RecordingTelegramApi, InMemoryRedisApi
+
+
+def make_message_update(update_id: int, chat_id: int, text: str) -> JsonDict:
+    """
+        Создает update с сообщением пользователя в формате Telegram
+    """
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "from": make_user(chat_id),
+            "chat": make_chat(chat_id),
+            "date": 1600000000,
+            "text": text
+        }
+    }
+
+
+def make_callback_query_update(update_id: int, chat_id: int, data: str) -> JsonDict:
+    """
+        Создает update с нажатием пользователем кнопки с данными `data`
+    """
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": make_user(chat_id),
+            "message": {
+                "message_id": update_id,
+                "chat": make_chat(chat_id),
+                "date": 1600000000,
+                "text": "Вопрос"
+            },
+            "data": data
+        }
+    }
+
+
+def make_user(chat_id: int) -> JsonDict:
+    return {
+        "id": chat_id,
+        "is_bot": False,
+        "first_name": f"Player {chat_id}"
+    }
+
+
+def make_chat(chat_id: int) -> JsonDict:
+    return {
+        "id": chat_id,
+        "first_name": f"Player {chat_id}",
+        "type": "private"
+    }
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """
+        Возвращает перцентиль отсортированных значений методом ближайшего ранга
+    """
+    index = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Stats:
+    """
+    Задержки обработки update по типам и количество сыгранных игр
+    """
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.games = 0
+
+    def update_count(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+
+async def play_games(bot: Bot,
+                     telegram_api: RecordingTelegramApi,
+                     chat_id: int,
+                     game_count: int,
+                     update_ids: Iterator[int],
+                     rng: random.Random,
+                     workers: asyncio.Semaphore,
+                     stats: Stats
+                     ) -> None:
+    """
+        Играет `game_count` игр в чате `chat_id`: здоровается с ботом, начинает игру командой /start и нажимает
+        случайные кнопки, пока бот присылает новые вопросы
+    """
+    async def send(update_type: str, data: JsonDict) -> None:
+        update = Update.parse_obj(data)
+        async with workers:
+            start = time.perf_counter()
+            await bot.process_update(update)
+            stats.latencies[update_type].append(time.perf_counter() - start)
+
+    await send("message", make_message_update(next(update_ids), chat_id, "Привет"))
+    for _ in range(game_count):
+        await send("command", make_message_update(next(update_ids), chat_id, "/start"))
+        while True:
+            keyboard = telegram_api.keyboards[chat_id]
+            button = rng.choice([button for row in keyboard.buttons for button in row])
+            await send("callback_query", make_callback_query_update(next(update_ids), chat_id, button.callback_data))
+            # Если бот не прислал новую клавиатуру, то это был последний вопрос
+            if telegram_api.keyboards[chat_id] is keyboard:
+                break
+        stats.games += 1
+
+
+async def run(args) -> None:
+    storage = InMemoryQuestionStorage(make_questions(args.questions))
+    config = GameConfig(easy_question_count=args.questions_per_difficulty,
+                        medium_question_count=args.questions_per_difficulty,
+                        hard_question_count=args.questions_per_difficulty,
+                        edit_in_place=args.edit_in_place
+                        )
+    state_factory = BotStateFactory(storage, RandomImpl(), config)
+    bijection = BotStateToDictBijection(state_factory)
+    telegram_api = RecordingTelegramApi(args.telegram_delay_ms / 1000)
+    chat_state_storage = RedisChatStateStorage(InMemoryRedisApi(),
+                                               bijection,
+                                               StateCache(args.state_cache_size, 300),
+                                               make_state_codec(args.codec)
+                                               )
+    bot = Bot(telegram_api, lambda: GreetingState(state_factory), bijection, chat_state_storage)
+
+    stats = Stats()
+    update_ids = itertools.count(1)
+    rng = random.Random(args.seed)
+    workers = asyncio.Semaphore(args.workers)
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        play_games(bot, telegram_api, chat_id, args.games, update_ids, rng, workers, stats)
+        for chat_id in range(1, args.chats + 1)
+    ])
+    elapsed = time.perf_counter() - start
+
+    update_count = stats.update_count()
+    print(f"chats: {args.chats}, games: {stats.games}, updates: {update_count}, time: {elapsed:.2f} s")
+    print(f"updates/s: {update_count / elapsed:.0f}, games/s: {stats.games / elapsed:.1f}")
+    print(f"telegram calls: {dict(telegram_api.calls)}")
+    print(f"{'update':>15} {'count':>8} {'p50, ms':>8} {'p95, ms':>8} {'p99, ms':>8}")
+    for update_type, latencies in stats.latencies.items():
+        latencies.sort()
+        print(f"{update_type:>15} {len(latencies):>8} {percentile(latencies, 50) * 1000:>8.3f} "
+              f"{percentile(latencies, 95) * 1000:>8.3f} {percentile(latencies, 99) * 1000:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пропускной способности бота")
+    parser.add_argument("-chats", type=int, default=1000, help="Количество одновременно играющих чатов")
+    parser.add_argument("-games", type=int, default=3, help="Количество игр в каждом чате")
+    parser.add_argument("-workers", type=int, default=8, help="Сколько update обрабатывается одновременно")
+    parser.add_argument("-questions", type=int, default=1000, help="Размер каталога вопросов")
+    parser.add_argument("-questions_per_difficulty", type=int, default=2,
+                        help="Количество вопросов каждой сложности в игре")
+    parser.add_argument("-telegram_delay_ms", type=float, default=0, help="Время одного вызова Telegram")
+    parser.add_argument("-codec", choices=["json", "msgpack"], default="msgpack", help="Формат хранения состояний")
+    parser.add_argument("-state_cache_size", type=int, default=10000, help="Размер кеша состояний, 0 - без кеша")
+    parser.add_argument("-edit_in_place", action="store_true", help="Показывать следующий вопрос в том же сообщении")
+    parser.add_argument("-seed", type=int, default=0, help="Начальное значение генератора нажатий кнопок")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
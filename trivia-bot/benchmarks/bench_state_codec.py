@@ -0,0 +1,54 @@
+"""
+Бенчмарк кодирования состояний бота для хранения в Redis: время кодирования, декодирования и размер в байтах
+для каждого кодека и типа состояния.
+Запуск из директории trivia-bot: python -m benchmarks.bench_state_codec
+"""
+import argparse
+import timeit
+from core.bot_state_logging_wrapper import BotStateLoggingWrapper
+from core.random import RandomImpl
+from trivia.bijection import BotStateToDictBijection
+from trivia.bot_config import GameConfig
+from trivia.bot_state import BotStateFactory, GreetingState
+from trivia.question_storage import InMemoryQuestionStorage
+from trivia.state_codec import JsonStateCodec, MsgpackStateCodec
+from benchmarks.bench_game_start import make_questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк кодеков состояния бота")
+    parser.add_argument("-repeat", type=int, default=10000, help="Количество повторов для каждого состояния")
+    args = parser.parse_args()
+
+    storage = InMemoryQuestionStorage(make_questions(1000))
+    state_factory = BotStateFactory(storage, RandomImpl(), GameConfig.make(5, 5, 5))
+    full_questions_factory = BotStateFactory(storage, RandomImpl(), GameConfig(easy_question_count=5,
+                                                                               medium_question_count=5,
+                                                                               hard_question_count=5,
+                                                                               save_question_ids=False
+                                                                               ))
+    states = {
+        "GreetingState": (state_factory, BotStateLoggingWrapper(GreetingState(state_factory))),
+        "IdleState": (state_factory, BotStateLoggingWrapper(state_factory.create_idle_state())),
+        "InGameState": (state_factory, BotStateLoggingWrapper(state_factory.create_in_game_state())),
+        "InGameState (full)": (full_questions_factory,
+                               BotStateLoggingWrapper(full_questions_factory.create_in_game_state())),
+    }
+    codecs = {
+        "json": JsonStateCodec(),
+        "msgpack": MsgpackStateCodec(),
+    }
+
+    print(f"{'state':>18} {'codec':>8} {'encode, us':>11} {'decode, us':>11} {'bytes':>6}")
+    for name, (factory, state) in states.items():
+        bijection = BotStateToDictBijection(factory)
+        for codec_name, codec in codecs.items():
+            data = codec.encode(bijection.forward(state))
+            encode_time = timeit.timeit(lambda: codec.encode(bijection.forward(state)), number=args.repeat)
+            decode_time = timeit.timeit(lambda: bijection.backward(codec.decode(data)), number=args.repeat)
+            print(f"{name:>18} {codec_name:>8} {encode_time / args.repeat * 1e6:>11.2f} "
+                  f"{decode_time / args.repeat * 1e6:>11.2f} {len(data):>6}")
+
+
+if __name__ == "__main__":
+    main()
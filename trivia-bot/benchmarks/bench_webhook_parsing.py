@@ -0,0 +1,109 @@
+"""
+Бенчмарк webhook: количество запросов в секунду, которые приложение обрабатывает в одном потоке с валидацией update
+через pydantic и с быстрым разбором через parse_update. Запросы передаются приложению напрямую через ASGI, без сети
+и uvicorn, а бот работает с состояниями в памяти, поэтому разница между вариантами определяется разбором update.
+Запуск из директории trivia-bot: python -m benchmarks.bench_webhook_parsing
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+from core.bot import Bot
+from core.chat_state_storage import DictChatStateStorage
+from core.random import RandomImpl
+from core.webhook_app import make_webhook_app
+from trivia.bijection import BotStateToDictBijection
+from trivia.bot_config import GameConfig
+from trivia.bot_state import BotStateFactory, GreetingState
+from trivia.question_storage import InMemoryQuestionStorage
+from benchmarks.bench_game_start import make_questions
+from benchmarks.fakes import NullTelegramApi
+
+PATH = "/webhook"
+
+
+def make_update_body(update_id: int, chat_id: int) -> bytes:
+    user = {
+        "id": chat_id,
+        "is_bot": False,
+        "first_name": "Ivan",
+        "username": "ivan"
+    }
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "from": user,
+            "chat": {
+                "id": chat_id,
+                "first_name": "Ivan",
+                "username": "ivan",
+                "type": "private"
+            },
+            "date": 1600000000,
+            "text": "/help"
+        }
+    }).encode()
+
+
+async def post(app, body: bytes) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": PATH,
+        "raw_path": PATH.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 10000),
+        "server": ("127.0.0.1", 8000),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(fast_update_parsing: bool, bodies: List[bytes]) -> float:
+    storage = InMemoryQuestionStorage(make_questions(100))
+    state_factory = BotStateFactory(storage, RandomImpl(), GameConfig.make(1, 1, 1))
+    bot = Bot(NullTelegramApi(),
+              lambda: GreetingState(state_factory),
+              BotStateToDictBijection(state_factory),
+              DictChatStateStorage()
+              )
+    app = make_webhook_app(bot, PATH, fast_update_parsing=fast_update_parsing)
+    start = time.perf_counter()
+    for body in bodies:
+        status = await post(app, body)
+        assert status == 200, status
+    return len(bodies) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора update в webhook")
+    parser.add_argument("-requests", type=int, default=10000, help="Количество запросов для каждого варианта")
+    parser.add_argument("-chats", type=int, default=100, help="Количество разных чатов")
+    args = parser.parse_args()
+
+    bodies = [make_update_body(i, i % args.chats) for i in range(args.requests)]
+    print(f"{'route':>10} {'requests/s':>11}")
+    for name, fast_update_parsing in [("pydantic", False), ("fast", True)]:
+        rps = asyncio.run(measure(fast_update_parsing, bodies))
+        print(f"{name:>10} {rps:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
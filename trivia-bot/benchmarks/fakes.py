@@ -0,0 +1,129 @@
+"""
+Реализации TelegramApi и RedisApi в памяти для бенчмарков
+"""
+import asyncio
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+from core.keyboard import Keyboard
+from core.live_redis_api import LockException
+from core.redis_api import RedisApi
+from core.telegram_api import TelegramApi
+from trivia.telegram_models import UpdatesResponse
+
+
+class NullTelegramApi(TelegramApi):
+    """
+    Telegram api, который ничего не отправляет
+    """
+    async def get_updates(self,
+                          offset: int,
+                          limit: int = 100,
+                          timeout: int = 10,
+                          allowed_updates: Optional[List[str]] = None
+                          ) -> UpdatesResponse:
+        return UpdatesResponse(ok=True, result=[])
+
+    async def send_message(self,
+                           chat_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        pass
+
+    async def answer_callback_query(self, callback_query_id: str) -> None:
+        pass
+
+    async def edit_message(self,
+                           chat_id: int,
+                           message_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        pass
+
+    async def set_webhook(self, url: str, cert_filepath: Optional[Path] = None) -> None:
+        pass
+
+    async def delete_webhook(self, drop_pending_updates: bool) -> None:
+        pass
+
+
+class RecordingTelegramApi(NullTelegramApi):
+    """
+    Telegram api, который считает вызовы по методам и запоминает последнюю клавиатуру, отправленную в каждый чат,
+    чтобы имитированный игрок мог нажать на кнопку. Каждый вызов занимает `delay_sec` секунд, как запрос к Telegram
+    """
+    def __init__(self, delay_sec: float = 0):
+        """
+        :param delay_sec: сколько секунд занимает один вызов
+        """
+        self.delay_sec = delay_sec
+        self.calls: Counter = Counter()
+        self.keyboards: Dict[int, Keyboard] = {}
+
+    async def send_message(self,
+                           chat_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        await self._call("sendMessage", chat_id, keyboard)
+
+    async def answer_callback_query(self, callback_query_id: str) -> None:
+        await self._call("answerCallbackQuery")
+
+    async def edit_message(self,
+                           chat_id: int,
+                           message_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        await self._call("editMessageText", chat_id, keyboard)
+
+    async def _call(self, method: str, chat_id: Optional[int] = None, keyboard: Optional[Keyboard] = None) -> None:
+        if self.delay_sec > 0:
+            await asyncio.sleep(self.delay_sec)
+        self.calls[method] += 1
+        if chat_id is not None and keyboard is not None:
+            self.keyboards[chat_id] = keyboard
+
+
+class InMemoryRedisApi(RedisApi):
+    """
+    RedisApi, который хранит значения в словаре. Mutex не ждет освобождения: если он занят, сразу бросается
+    LockException
+    """
+    def __init__(self):
+        self.values: Dict[str, bytes] = {}
+        self.lock_count = 0
+
+    async def lock(self, key: str) -> str:
+        if key in self.values:
+            raise LockException(key, 1)
+        self.lock_count += 1
+        token = f"token_{self.lock_count}"
+        self.values[key] = token.encode()
+        return token
+
+    async def unlock(self, key: str, token: str) -> None:
+        if self.values.get(key) == token.encode():
+            del self.values[key]
+
+    async def set_key(self, key: str, value: bytes):
+        self.values[key] = value
+
+    async def get_key(self, key: str) -> Optional[bytes]:
+        return self.values.get(key)
+
+    async def set_key_if_absent(self, key: str, value: bytes, expire_sec: int) -> bool:
+        if key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    async def delete_key(self, key: str) -> None:
+        self.values.pop(key, None)
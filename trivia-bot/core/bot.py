@@ -1,5 +1,5 @@
 import logging
-from typing import Optional, Callable
+from typing import Optional, Callable, List, Tuple
 from core.telegram_api import TelegramApi
 from core.bot_state import BotState, BotResponse
 from core.message import Message
@@ -9,9 +9,12 @@ from core.bot_state_logging_wrapper import BotStateLoggingWrapper
 from trivia.bijection import Bijection
 from core.utils import JsonDict
 from trivia.telegram_models import Update
-from core.redis_api import RedisApi
 from core.chat_state_storage import ChatStateStorage
 from core.bot_exeption import InvalidUpdateException
+from core.update_deduplicator import UpdateDeduplicator
+from core.telegram_action import TelegramAction, SendMessageAction, EditMessageAction, AnswerCallbackQueryAction
+from core.telegram_action import send_actions
+from core.metrics import BotMetrics
 
 
 class Bot:
@@ -20,16 +23,28 @@ class Bot:
     """
     def __init__(self,
                  telegram_api: TelegramApi,
-                 redis_api: RedisApi,
                  create_initial_state: Callable[[], BotState],
                  state_to_dict_bijection: Bijection[BotState, JsonDict],
-                 chat_state_storage: ChatStateStorage
+                 chat_state_storage: ChatStateStorage,
+                 update_deduplicator: Optional[UpdateDeduplicator] = None,
+                 metrics: Optional[BotMetrics] = None,
+                 reply_messages_in_webhook: bool = True
                  ):
+        """
+        :param update_deduplicator: если передан, то повторно доставленные update пропускаются до получения mutex и
+            загрузки состояния
+        :param metrics: метрики, в которые записывается время этапов обработки update
+        :param reply_messages_in_webhook: возвращать в ответе на webhook не только ответ на callback query, но и
+            сообщение. Вызов из ответа на webhook обходит RateLimitedTelegramApi, а Telegram не сообщает об ошибках
+            таких вызовов, поэтому при ограничении частоты сообщений сообщения отправляются только через очередь
+        """
         self.telegram_api = telegram_api
-        self.redis_api = redis_api
         self.create_initial_state = create_initial_state
         self.state_to_dict_bijection = state_to_dict_bijection
         self.chat_state_storage = chat_state_storage
+        self.update_deduplicator = update_deduplicator
+        self.metrics = metrics if metrics is not None else BotMetrics()
+        self.reply_messages_in_webhook = reply_messages_in_webhook
 
     def __eq__(self, other):
         if type(other) is type(self):
@@ -43,7 +58,6 @@ class Bot:
         return f"""
                 Bot:
                     telegram_api = {self.telegram_api}
-                    redis_api = {self.redis_api}
                     state_to_dict_bijection = {self.state_to_dict_bijection}
                     state = {self.chat_state_storage}
                 """
@@ -53,47 +67,124 @@ class Bot:
            Обрабатывает полученные команды и сообщения от пользователя
         :return: None
         """
+        await self._process_update_and_send(update, False)
+
+    async def process_webhook_update(self, update: Update) -> Optional[JsonDict]:
+        """
+            Обрабатывает update, полученный через webhook. Один из исходящих вызовов не отправляется, а возвращается,
+            чтобы его можно было передать Telegram в ответе на webhook и сэкономить один HTTP запрос. Telegram выполнит
+            этот вызов уже после всех остальных вызовов бота
+        :return: тело ответа на webhook или None, если подходящего вызова нет
+        """
+        webhook_reply = await self._process_update_and_send(update, True)
+        return webhook_reply.as_webhook_reply() if webhook_reply is not None else None
+
+    async def _process_update_and_send(self, update: Update, reply_in_webhook: bool) -> Optional[TelegramAction]:
+        update_type = "message" if update.message else "callback_query" if update.callback_query else "other"
+        if self.update_deduplicator is not None and not await self.update_deduplicator.mark_seen(update.update_id):
+            logging.info("Skipping duplicate update %s", update.update_id)
+            self.metrics.updates.labels(update_type, "duplicate").inc()
+            return None
+
         chat_id = update.get_chat_id(update)
-        await self.redis_api.lock(f"lock_{chat_id}")
-        state = self.chat_state_storage.get_state(chat_id)
+        try:
+            lock_token, new_state, actions = await self._lock_and_process(chat_id, update)
+        except BaseException:
+            # Ни один вызов Telegram еще не отправлен, поэтому update можно обработать заново
+            if self.update_deduplicator is not None:
+                await self.update_deduplicator.forget(update.update_id)
+            self.metrics.updates.labels(update_type, "error").inc()
+            raise
+
+        # Вызовы отправляются под mutex чата, чтобы ответы на update одного чата приходили по порядку. Очередь
+        # RateLimitedTelegramApi держит вызов не дольше max_wait_sec, поэтому mutex не истекает во время ожидания
+        webhook_reply = select_webhook_reply(actions, self.reply_messages_in_webhook) if reply_in_webhook else None
+        try:
+            with self.metrics.time_stage("send"):
+                await send_actions(self.telegram_api, [action for action in actions if action is not webhook_reply])
+            with self.metrics.time_stage("save"):
+                await self.chat_state_storage.set_state_and_unlock(chat_id, new_state, lock_token)
+        except BaseException:
+            self.chat_state_storage.discard_state(chat_id)
+            await self.chat_state_storage.unlock(chat_id, lock_token)
+            # Часть вызовов уже могла дойти до пользователя, а повторная обработка отправила бы их еще раз
+            logging.warning("Update %s won't be processed again: it failed after sending Telegram calls started",
+                            update.update_id
+                            )
+            self.metrics.updates.labels(update_type, "error").inc()
+            raise
+        self.metrics.updates.labels(update_type, "ok").inc()
+        return webhook_reply
+
+    async def _lock_and_process(self, chat_id: int, update: Update) -> Tuple[str, BotState, List[TelegramAction]]:
+        """
+            Получает mutex чата и обрабатывает update. Если обработка завершилась ошибкой, mutex освобождается
+        :return: токен mutex, новое состояние и исходящие вызовы Telegram в порядке отправки
+        """
+        with self.metrics.time_stage("lock_and_load"):
+            lock_token, state = await self.chat_state_storage.lock_and_get_state(chat_id)
+        try:
+            actions: List[TelegramAction] = []
+            with self.metrics.time_stage("process"):
+                new_state = await self._process_locked_update(chat_id, update, state, actions)
+        except BaseException:
+            self.chat_state_storage.discard_state(chat_id)
+            await self.chat_state_storage.unlock(chat_id, lock_token)
+            raise
+        return lock_token, new_state, actions
+
+    async def _process_locked_update(self,
+                                     chat_id: int,
+                                     update: Update,
+                                     state: Optional[BotState],
+                                     actions: List[TelegramAction]
+                                     ) -> BotState:
+        """
+            Обрабатывает update под mutex чата. Исходящие вызовы Telegram не отправляются, а добавляются в `actions`
+        :return: состояние, которое нужно сохранить. Хранилище само не сохраняет состояние, если оно не изменилось
+        """
         if not state:
             state = self.create_initial_state()
-        bot_response = await self._process_update(update, state)
+        bot_response = await self._process_update(update, state, actions)
         if bot_response is not None:
             if bot_response.message is not None:
-                await self.telegram_api.send_message(bot_response.message.chat_id,
-                                                     bot_response.message.text,
-                                                     bot_response.message.parse_mode,
-                                                     bot_response.message.keyboard
-                                                     )
+                actions.append(SendMessageAction(bot_response.message.chat_id,
+                                                 bot_response.message.text,
+                                                 bot_response.message.parse_mode,
+                                                 bot_response.message.keyboard
+                                                 ))
 
             if bot_response.message_edit is not None:
-                await self.telegram_api.edit_message(bot_response.message_edit.chat_id,
-                                                     bot_response.message_edit.message_id,
-                                                     bot_response.message_edit.text,
-                                                     bot_response.message_edit.parse_mode
-                                                     )
+                actions.append(EditMessageAction(bot_response.message_edit.chat_id,
+                                                 bot_response.message_edit.message_id,
+                                                 bot_response.message_edit.text,
+                                                 bot_response.message_edit.parse_mode,
+                                                 bot_response.message_edit.keyboard
+                                                 ))
 
             if bot_response.new_state is not None:
                 state = BotStateLoggingWrapper(bot_response.new_state)
                 first_message = state.on_enter(chat_id)
                 if first_message is not None:
-                    await self.telegram_api.send_message(first_message.chat_id,
-                                                         first_message.text,
-                                                         first_message.parse_mode,
-                                                         first_message.keyboard
-                                                         )
-        self.chat_state_storage.set_state(chat_id, state)
-        self.redis_api.unlock(f"lock_{chat_id}")
-
-    async def _process_update(self, update: Update, state: BotState) -> Optional[BotResponse]:
+                    actions.append(SendMessageAction(first_message.chat_id,
+                                                     first_message.text,
+                                                     first_message.parse_mode,
+                                                     first_message.keyboard
+                                                     ))
+        return state
+
+    async def _process_update(self,
+                              update: Update,
+                              state: BotState,
+                              actions: List[TelegramAction]
+                              ) -> Optional[BotResponse]:
         if update.message:
             if not update.message.text:
                 raise InvalidUpdateException("Message text is not found")
 
             chat_id = update.get_chat_id(update)
             message_text = update.message.text
-            logging.info(f"chat_id : {chat_id}. text: {message_text} ")
+            logging.info("chat_id : %s. text: %s ", chat_id, message_text)
 
             if message_text.startswith("/"):
                 user_command = Command(chat_id, message_text)
@@ -120,10 +211,27 @@ class Bot:
             callback_query_data = update.callback_query.data
             message_id = update.callback_query.message.message_id
             callback_query = CallbackQuery(callback_query_data, message, message_id)
-            await self.telegram_api.answer_callback_query(callback_query_id)
+            actions.append(AnswerCallbackQueryAction(callback_query_id))
             bot_response = state.process_callback_query(callback_query)
             return bot_response
         else:
             logging.info("skipping update")
             return None
 
+
+def select_webhook_reply(actions: List[TelegramAction], include_messages: bool = True) -> Optional[TelegramAction]:
+    """
+        Выбирает вызов, который можно вернуть в ответе на webhook. Telegram выполнит его после остальных вызовов,
+        поэтому подходит ответ на callback query, порядок которого не важен, или последнее отправляемое сообщение
+    :param actions: исходящие вызовы в порядке отправки
+    :param include_messages: можно ли вернуть сообщение, если ответа на callback query нет
+    :return: вызов для ответа на webhook или None
+    """
+    for action in actions:
+        if isinstance(action, AnswerCallbackQueryAction):
+            return action
+
+    if include_messages and actions and isinstance(actions[-1], SendMessageAction):
+        return actions[-1]
+
+    return None
@@ -11,10 +11,13 @@ from core.message_edit import MessageEdit
 class BotResponse:
     """
         Ответ бота
+        :param state_changed: текущее состояние изменилось, хотя `new_state` не задан. Сохранение от этого не зависит:
+            хранилище само сравнивает состояние с загруженным
     """
     message: Optional[Message] = None
     message_edit: Optional[MessageEdit] = None
     new_state: Optional["BotState"] = None
+    state_changed: bool = False
 
 
 class BotState(metaclass=ABCMeta):
@@ -26,17 +26,17 @@ class BotStateLoggingWrapper(BotState):
         return self.__repr__()
 
     def process_message(self, message: Message) -> BotResponse:
-        logging.info(f"{type(self.inner).__name__} process_message is called")
+        logging.info("%s process_message is called", type(self.inner).__name__)
         return self.inner.process_message(message)
 
     def process_command(self, command: Command) -> BotResponse:
-        logging.info(f"{type(self.inner).__name__} process_command is called")
+        logging.info("%s process_command is called", type(self.inner).__name__)
         return self.inner.process_command(command)
 
     def on_enter(self, chat_id: int) -> Optional[Message]:
-        logging.info(f"{type(self.inner).__name__} on_enter is called")
+        logging.info("%s on_enter is called", type(self.inner).__name__)
         return self.inner.on_enter(chat_id)
 
     def process_callback_query(self, callback_query: CallbackQuery) -> Optional[BotResponse]:
-        logging.info(f"{type(self.inner).__name__} callback_query is called")
+        logging.info("%s callback_query is called", type(self.inner).__name__)
         return self.inner.process_callback_query(callback_query)
@@ -1,10 +1,12 @@
-import json
+import hashlib
 from abc import ABCMeta, abstractmethod
 from trivia.bijection import BotStateToDictBijection
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 from core.bot_state import BotState
 from core.redis_api import RedisApi
-from trivia.question_storage import JSONEncoder, JSONDecoder
+from core.state_cache import StateCache
+from trivia.state_codec import StateCodec, MsgpackStateCodec
+from core.metrics import BotMetrics
 
 
 class ChatStateStorage(metaclass=ABCMeta):
@@ -13,7 +15,7 @@ class ChatStateStorage(metaclass=ABCMeta):
     """
 
     @abstractmethod
-    def set_state(self, chat_id: int, state: BotState):
+    async def set_state(self, chat_id: int, state: BotState):
         """
         Сохраняет состояние бота
         :param chat_id: Идентификатор чата
@@ -21,46 +23,201 @@ class ChatStateStorage(metaclass=ABCMeta):
         """
         pass
 
-    def get_state(self, chat_id: int) -> Optional[BotState]:
+    @abstractmethod
+    async def get_state(self, chat_id: int) -> Optional[BotState]:
         """
         Получает состояние бота
         :return: вернет None, если chat_id не найдет
         """
         pass
 
+    @abstractmethod
+    async def lock_and_get_state(self, chat_id: int) -> Tuple[str, Optional[BotState]]:
+        """
+        Получает mutex на состояние чата и само состояние
+        :param chat_id: Идентификатор чата
+        :return: токен владельца mutex и состояние бота. Состояние будет None, если chat_id не найдет
+        """
+        pass
+
+    @abstractmethod
+    async def set_state_and_unlock(self, chat_id: int, state: BotState, lock_token: str):
+        """
+        Сохраняет состояние бота и убирает mutex, полученный в lock_and_get_state. Хранилище может не сохранять
+        состояние, если оно не изменилось с момента lock_and_get_state
+        :param chat_id: Идентификатор чата
+        :param state: состояние бота
+        :param lock_token: токен владельца mutex
+        """
+        pass
+
+    @abstractmethod
+    async def unlock(self, chat_id: int, lock_token: str):
+        """
+        Убирает mutex, полученный в lock_and_get_state, не сохраняя состояние
+        :param chat_id: Идентификатор чата
+        :param lock_token: токен владельца mutex
+        """
+        pass
+
+    def discard_state(self, chat_id: int):
+        """
+        Забывает состояние, полученное в lock_and_get_state. Вызывается, если обработка update завершилась ошибкой и
+        полученное состояние могло остаться частично измененным
+        :param chat_id: Идентификатор чата
+        """
+        pass
+
 
 class DictChatStateStorage(ChatStateStorage):
     """
-    Класс для хранения состояний бота в словаре
+    Класс для хранения состояний бота в словаре. Не блокирует состояния чатов
     """
     def __init__(self):
         self.chat_states: Dict[int, BotState] = {}
 
-    def set_state(self, chat_id: int, state: BotState):
+    async def set_state(self, chat_id: int, state: BotState):
         self.chat_states[chat_id] = state
 
-    def get_state(self, chat_id: int) -> Optional[BotState]:
+    async def get_state(self, chat_id: int) -> Optional[BotState]:
         return self.chat_states.get(chat_id)
 
+    async def lock_and_get_state(self, chat_id: int) -> Tuple[str, Optional[BotState]]:
+        return "", await self.get_state(chat_id)
+
+    async def set_state_and_unlock(self, chat_id: int, state: BotState, lock_token: str):
+        await self.set_state(chat_id, state)
+
+    async def unlock(self, chat_id: int, lock_token: str):
+        pass
+
 
 class RedisChatStateStorage(ChatStateStorage):
     """
-    Класс для хранения состояний бота в Redis
+    Класс для хранения состояний бота в Redis. Получение mutex вместе с загрузкой состояния и сохранение состояния
+    вместе с освобождением mutex выполняются через комбинированные операции RedisApi. Состояния сохраняются через
+    `state_codec`, по умолчанию в бинарном формате MsgpackStateCodec, который читает и сохраненные раньше в JSON
+    состояния.
+
+    Каждое сохранение увеличивает версию состояния в Redis. Если передан `state_cache`, то декодированные состояния
+    хранятся в нем вместе с версией, и состояние не читается и не декодируется, пока его версия в Redis не изменится.
+    Версия меняется при любом сохранении, поэтому кеш остается корректным, когда с Redis работают несколько ботов.
+
+    set_state_and_unlock кодирует состояние и сравнивает хеш результата с хешем значения, загруженного в
+    lock_and_get_state. Если они совпали, то состояние не изменилось и только освобождается mutex.
+    Если переданы `metrics`, то в них записывается время декодирования загруженных состояний
     """
-    def __init__(self, redis_api: RedisApi, bot_state_to_dict_bijection: BotStateToDictBijection):
+    def __init__(self,
+                 redis_api: RedisApi,
+                 bot_state_to_dict_bijection: BotStateToDictBijection,
+                 state_cache: Optional[StateCache] = None,
+                 state_codec: Optional[StateCodec] = None,
+                 metrics: Optional[BotMetrics] = None
+                 ):
         self.redis_api = redis_api
         self.bot_state_to_dict_bijection = bot_state_to_dict_bijection
+        self.state_cache = state_cache
+        self.state_codec = state_codec or MsgpackStateCodec()
+        self.metrics = metrics
+        self._loaded_digests: Dict[int, bytes] = {}
+
+    async def set_state(self, chat_id: int, state: BotState):
+        lock_token = await self.redis_api.lock(_lock_key(chat_id))
+        await self.set_state_and_unlock(chat_id, state, lock_token)
+
+    async def get_state(self, chat_id: int) -> Optional[BotState]:
+        bytes_state = await self.redis_api.get_key(_state_key(chat_id))
+        return self._decode(bytes_state)
+
+    async def lock_and_get_state(self, chat_id: int) -> Tuple[str, Optional[BotState]]:
+        cached = self.state_cache.get(chat_id) if self.state_cache is not None else None
+        known_version = cached[0] if cached else None
+        lock_key = _lock_key(chat_id)
+        lock_token, version, bytes_state = await self.redis_api.lock_and_get_versioned_key(lock_key,
+                                                                                         _state_key(chat_id),
+                                                                                         _version_key(chat_id),
+                                                                                         known_version
+                                                                                         )
+        if cached and version == known_version:
+            self._loaded_digests[chat_id] = cached[2]
+            return lock_token, cached[1]
+
+        try:
+            if self.metrics is not None:
+                with self.metrics.time_stage("decode"):
+                    state = self._decode(bytes_state)
+            else:
+                state = self._decode(bytes_state)
+        except BaseException:
+            await self.redis_api.unlock(lock_key, lock_token)
+            raise
+
+        if bytes_state:
+            digest = _digest(bytes_state)
+            self._loaded_digests[chat_id] = digest
+        if self.state_cache is not None:
+            if state is not None and version is not None and bytes_state:
+                self.state_cache.put(chat_id, version, state, digest)
+            else:
+                self.state_cache.discard(chat_id)
+        return lock_token, state
+
+    async def set_state_and_unlock(self, chat_id: int, state: BotState, lock_token: str):
+        loaded_digest = self._loaded_digests.pop(chat_id, None)
+        try:
+            bytes_state = self._encode(state)
+            digest = _digest(bytes_state)
+            if digest == loaded_digest:
+                await self.redis_api.unlock(_lock_key(chat_id), lock_token)
+                return
 
-    def set_state(self, chat_id: int, state: BotState):
+            version = await self.redis_api.set_versioned_key_and_unlock(_state_key(chat_id),
+                                                                        bytes_state,
+                                                                        _version_key(chat_id),
+                                                                        _lock_key(chat_id),
+                                                                        lock_token
+                                                                        )
+        except BaseException:
+            self.discard_state(chat_id)
+            await self.unlock(chat_id, lock_token)
+            raise
+
+        if self.state_cache is not None:
+            self.state_cache.put(chat_id, version, state, digest)
+
+    async def unlock(self, chat_id: int, lock_token: str):
+        self._loaded_digests.pop(chat_id, None)
+        await self.redis_api.unlock(_lock_key(chat_id), lock_token)
+
+    def discard_state(self, chat_id: int):
+        self._loaded_digests.pop(chat_id, None)
+        if self.state_cache is not None:
+            self.state_cache.discard(chat_id)
+
+    def _encode(self, state: BotState) -> bytes:
         dict_state = self.bot_state_to_dict_bijection.forward(state)
-        str_state = json.dumps(dict_state, cls=JSONEncoder, ensure_ascii=False)
-        self.redis_api.set_key(f"state_{chat_id}", str_state)
+        return self.state_codec.encode(dict_state)
 
-    def get_state(self, chat_id: int) -> Optional[BotState]:
-        str_state = self.redis_api.get_key(f"state_{chat_id}")
-        if str_state:
-            dict_state = json.loads(str_state, cls=JSONDecoder)
+    def _decode(self, bytes_state: Optional[bytes]) -> Optional[BotState]:
+        if bytes_state:
+            dict_state = self.state_codec.decode(bytes_state)
             state = self.bot_state_to_dict_bijection.backward(dict_state)
             return state
 
         return None
+
+
+def _digest(bytes_state: bytes) -> bytes:
+    return hashlib.blake2b(bytes_state, digest_size=16).digest()
+
+
+def _state_key(chat_id: int) -> str:
+    return f"state_{chat_id}"
+
+
+def _lock_key(chat_id: int) -> str:
+    return f"lock_{chat_id}"
+
+
+def _version_key(chat_id: int) -> str:
+    return f"version_{chat_id}"
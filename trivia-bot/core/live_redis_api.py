@@ -1,9 +1,12 @@
 from core.redis_api import RedisApi
-import redis
+import redis.asyncio as redis
 import asyncio
-from contextlib import contextmanager
+import logging
+import uuid
+from contextlib import asynccontextmanager, contextmanager
 from trivia.bot_config import LiveRedisApiConfig
-from typing import Optional
+from core.metrics import BotMetrics
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, Union
 
 
 class RedisException(Exception):
@@ -26,57 +29,267 @@ class LockException(RedisException):
         return f"Failed to lock {self.key} after {self.max_attempts} attempts"
 
 
+# Канал, в который публикуются имена освобожденных mutex
+RELEASED_CHANNEL = "lock_released"
+
+# Удаляет mutex, только если он принадлежит владельцу токена, и публикует его имя в канал ARGV[2], чтобы сразу
+# разбудить ожидающих
+UNLOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    redis.call("del", KEYS[1])
+    redis.call("publish", ARGV[2], KEYS[1])
+    return 1
+end
+return 0
+"""
+
+# Получает mutex KEYS[1] с токеном ARGV[1] на ARGV[2] секунд и, если mutex получен, возвращает версию из KEYS[3] и
+# значение KEYS[2]. Значение не возвращается, если версия совпала с известной вызывающему версией ARGV[3]
+LOCK_AND_GET_VERSIONED_SCRIPT = """
+if redis.call("set", KEYS[1], ARGV[1], "NX", "EX", ARGV[2]) then
+    local version = redis.call("get", KEYS[3])
+    if version and version == ARGV[3] then
+        return {1, version}
+    end
+    return {1, version, redis.call("get", KEYS[2])}
+end
+return {0}
+"""
+
+# Сохраняет значение ARGV[1] в KEYS[1], увеличивает версию KEYS[2] и освобождает mutex KEYS[3], только если mutex
+# принадлежит владельцу токена ARGV[2]. Имя освобожденного mutex публикуется в канал ARGV[3].
+# Возвращает новую версию или false, если mutex уже не принадлежит владельцу токена
+SET_VERSIONED_AND_UNLOCK_SCRIPT = """
+if redis.call("get", KEYS[3]) == ARGV[2] then
+    redis.call("set", KEYS[1], ARGV[1])
+    local version = redis.call("incr", KEYS[2])
+    redis.call("del", KEYS[3])
+    redis.call("publish", ARGV[3], KEYS[3])
+    return version
+end
+return false
+"""
+
+
+class LockLostException(RedisException):
+    """
+    Класс вызова исключения для Redis, когда mutex истек и перестал принадлежать владельцу до сохранения значения
+    """
+    def __init__(self, key: str):
+        super().__init__()
+        self.key = key
+
+    def __str__(self):
+        return f"Lock {self.key} expired before the value was saved"
+
+
 class LiveRedisApi(RedisApi):
-    def __init__(self, config: LiveRedisApiConfig):
+    """
+    Асинхронный клиент Redis. Команды выполняются через пул соединений ограниченного размера и не блокируют event
+    loop. Если все соединения пула заняты, команда ждет освобождения соединения не дольше `pool_timeout_sec`.
+
+    Mutex хранит токен владельца. Освобождая mutex, владелец публикует его имя в канал RELEASED_CHANNEL. Клиент
+    слушает канал через отдельное соединение вне пула и будит всех, кто ждет этот mutex. Если владелец не освободил
+    mutex и он истек по `expire_sec`, ожидающий повторяет попытку не позже чем через `delay_ms`. Ожидающие не занимают
+    соединения пула, а повторные попытки одновременно делают не больше `max_lock_waiters` из них, поэтому владельцу
+    mutex всегда остаются свободные соединения, чтобы его освободить.
+    Если переданы `metrics`, то в них считаются повторные попытки получить mutex и ошибки получения mutex
+    """
+    def __init__(self,
+                 config: LiveRedisApiConfig,
+                 metrics: Optional[BotMetrics] = None,
+                 connection_class: Type[redis.Connection] = redis.Connection,
+                 **connection_kwargs: Any
+                 ):
+        """
+        :param connection_class: класс соединения с Redis, например, соединение fakeredis в тестах
+        :param connection_kwargs: дополнительные параметры соединения
+        """
         self._config = config
-        self._redis = redis.Redis(host=config.host, port=config.port, db=0)
+        self._metrics = metrics
+        self._pool = redis.BlockingConnectionPool(host=config.host,
+                                                  port=config.port,
+                                                  db=0,
+                                                  max_connections=config.max_connections,
+                                                  timeout=config.pool_timeout_sec,
+                                                  connection_class=connection_class,
+                                                  **connection_kwargs
+                                                  )
+        self._redis = redis.Redis(connection_pool=self._pool)
+        self._unlock_script = self._redis.register_script(UNLOCK_SCRIPT)
+        self._lock_and_get_versioned_script = self._redis.register_script(LOCK_AND_GET_VERSIONED_SCRIPT)
+        self._set_versioned_and_unlock_script = self._redis.register_script(SET_VERSIONED_AND_UNLOCK_SCRIPT)
+        self._lock_waiters = asyncio.Semaphore(config.max_lock_waiters)
+        self._released_events: Dict[str, asyncio.Event] = {}
+        self._released_waiter_counts: Dict[str, int] = {}
+        self._subscriber_pool = redis.ConnectionPool(host=config.host,
+                                                     port=config.port,
+                                                     db=0,
+                                                     connection_class=connection_class,
+                                                     **connection_kwargs
+                                                     )
+        self._subscriber = redis.Redis(connection_pool=self._subscriber_pool)
+        self._pubsub = self._subscriber.pubsub(ignore_subscribe_messages=True)
+        self._listener: Optional[asyncio.Task] = None
 
-    def close(self):
-        self._redis.close()
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        await self._pubsub.close()
+        await self._subscriber.close()
+        await self._subscriber_pool.disconnect()
+        await self._redis.close()
+        await self._pool.disconnect()
 
-    async def lock(self, key: str) -> None:
-        for _ in range(self._config.max_attempts):
-            was_set = self._redis.set(key, "1", ex=self._config.expire_sec, nx=True)
-            if was_set:
+    async def lock(self, key: str) -> str:
+        token = uuid.uuid4().hex
+        if await self._redis.set(key, token, ex=self._config.expire_sec, nx=True):
+            return token
 
-                return
-            await asyncio.sleep(self._config.delay_ms / 1000)
+        async with self._lock_waiters:
+            for _ in range(self._config.max_attempts - 1):
+                with self._watch_released(key) as released:
+                    if await self._redis.set(key, token, ex=self._config.expire_sec, nx=True):
+                        return token
+                    await self._wait_released(released)
 
-        raise LockException(key, self._config.max_attempts)
+        raise self._lock_failed(key)
 
-    def unlock(self, key: str) -> None:
-        self._redis.delete(key)
+    async def unlock(self, key: str, token: str) -> None:
+        await self._unlock_script(keys=[key], args=[token, RELEASED_CHANNEL])
 
-    def set_key(self, key: str, value: str):
-        self._redis.set(key, value)
+    async def lock_and_get_versioned_key(self,
+                                         lock_key: str,
+                                         key: str,
+                                         version_key: str,
+                                         known_version: Optional[str]
+                                         ) -> Tuple[str, Optional[str], Optional[bytes]]:
+        token = uuid.uuid4().hex
+        args: List[Union[str, int]] = [token, self._config.expire_sec, known_version or ""]
+        result = await self._lock_and_get_versioned_script(keys=[lock_key, key, version_key], args=args)
+        if result[0] == 1:
+            return token, _decode(result[1]), result[2] if len(result) > 2 else None
 
-    def get_key(self, key: str) -> Optional[str]:
-        bytes_state: bytes = self._redis.get(key)   # type: ignore
-        if bytes_state:
-            str_state = bytes_state.decode()
-            return str_state
+        async with self._lock_waiters:
+            for _ in range(self._config.max_attempts - 1):
+                with self._watch_released(lock_key) as released:
+                    result = await self._lock_and_get_versioned_script(keys=[lock_key, key, version_key], args=args)
+                    if result[0] == 1:
+                        return token, _decode(result[1]), result[2] if len(result) > 2 else None
+                    await self._wait_released(released)
 
-        return None
+        raise self._lock_failed(lock_key)
 
+    async def set_versioned_key_and_unlock(self,
+                                           key: str,
+                                           value: bytes,
+                                           version_key: str,
+                                           lock_key: str,
+                                           token: str
+                                           ) -> str:
+        version = await self._set_versioned_and_unlock_script(
+            keys=[key, version_key, lock_key],
+            args=[value, token, RELEASED_CHANNEL]
+        )
+        if version is None:
+            raise LockLostException(lock_key)
+        return str(version)
 
-@contextmanager
-def make_live_redis_api(config: LiveRedisApiConfig):
-    live_redis = LiveRedisApi(config)
-    try:
-        yield live_redis
-    finally:
-        live_redis.close()
+    async def set_key(self, key: str, value: bytes):
+        await self._redis.set(key, value)
+
+    async def get_key(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(key)
+
+    async def set_key_if_absent(self, key: str, value: bytes, expire_sec: int) -> bool:
+        return bool(await self._redis.set(key, value, ex=expire_sec, nx=True))
+
+    async def delete_key(self, key: str) -> None:
+        await self._redis.delete(key)
+
+    @contextmanager
+    def _watch_released(self, lock_key: str) -> Iterator[asyncio.Event]:
+        """
+            Возвращает событие, которое наступит, когда mutex освободят. Событие нужно получить до попытки взять
+            mutex, чтобы не пропустить освобождение между попыткой и ожиданием
+        """
+        event = self._released_events.get(lock_key)
+        if event is None:
+            event = self._released_events[lock_key] = asyncio.Event()
+        self._released_waiter_counts[lock_key] = self._released_waiter_counts.get(lock_key, 0) + 1
+        try:
+            yield event
+        finally:
+            count = self._released_waiter_counts.pop(lock_key) - 1
+            if count > 0:
+                self._released_waiter_counts[lock_key] = count
+            elif self._released_events.get(lock_key) is event:
+                del self._released_events[lock_key]
+
+    async def _wait_released(self, released: asyncio.Event) -> None:
+        """
+            Ждет освобождения mutex не дольше `delay_ms` перед повторной попыткой его получить
+        """
+        if self._metrics is not None:
+            self._metrics.lock_retries.inc()
+        self._ensure_listening()
+        try:
+            await asyncio.wait_for(released.wait(), self._config.delay_ms / 1000)
+        except asyncio.TimeoutError:
+            pass
 
+    def _ensure_listening(self) -> None:
+        """
+            Запускает слушателя канала RELEASED_CHANNEL. Задача создается без await, поэтому одновременные ожидающие
+            не запустят второго слушателя того же соединения
+        """
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen_released())
 
-class DoNothingRedisApi(RedisApi):
-    async def lock(self, key: str) -> None:
-        pass
+    async def _listen_released(self) -> None:
+        """
+            Подписывается на канал RELEASED_CHANNEL и будит ожидающих освобожденного mutex. Если соединение с Redis
+            пропало, ожидающие повторяют попытки по `delay_ms`, пока слушатель не переподключится
+        """
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    await self._pubsub.subscribe(RELEASED_CHANNEL)
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        event = self._released_events.pop(message["data"].decode(), None)
+                        if event is not None:
+                            event.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Failed to read released locks")
+                await asyncio.sleep(self._config.delay_ms / 1000)
 
-    def unlock(self, key: str) -> None:
-        pass
+    def _lock_failed(self, lock_key: str) -> LockException:
+        if self._metrics is not None:
+            self._metrics.lock_failures.inc()
+        return LockException(lock_key, self._config.max_attempts)
 
-    def set_key(self, key: str, state: str):
-        pass
 
-    def get_key(self, key: str) -> Optional[str]:
-        return None
+def _decode(value: Optional[bytes]) -> Optional[str]:
+    """
+    Декодирует строку, полученную от Redis
+    """
+    if value:
+        return value.decode()
+
+    return None
+
+
+@asynccontextmanager
+async def make_live_redis_api(config: LiveRedisApiConfig, metrics: Optional[BotMetrics] = None):
+    live_redis = LiveRedisApi(config, metrics)
+    try:
+        yield live_redis
+    finally:
+        await live_redis.close()
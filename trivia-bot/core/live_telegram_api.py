@@ -1,38 +1,91 @@
 from core.keyboard import Keyboard
-from typing import Optional
+from typing import List, Optional
 import logging
-from core.telegram_api import TelegramApi
+from core.telegram_api import TelegramApi, TooManyRequestsException
 from trivia.telegram_models import UpdatesResponse
+from core.utils import JsonDict
+from core.telegram_action import make_send_message_body, make_edit_message_body, make_answer_callback_query_body
 import json
 import aiohttp
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from trivia.bot_config import TelegramHttpConfig
+from core.metrics import BotMetrics
 from pathlib import Path
 
 
+@dataclass
+class ConnectionPoolStats:
+    """
+    Счетчики пула соединений с Telegram.
+    created - сколько соединений открыто
+    reused - сколько запросов отправлено через уже открытое соединение
+    queued - сколько запросов ждали свободное соединение, потому что все соединения пула были заняты
+    """
+    created: int = 0
+    reused: int = 0
+    queued: int = 0
+
+
 class LiveTelegramApi(TelegramApi):
-    def __init__(self, token: str):
+    METHODS = ["getUpdates", "sendMessage", "answerCallbackQuery", "editMessageText", "setWebhook", "deleteWebhook"]
+
+    def __init__(self,
+                 token: str,
+                 config: TelegramHttpConfig = TelegramHttpConfig(),
+                 metrics: Optional[BotMetrics] = None
+                 ):
+        """
+        :param token: токен бота
+        :param config: настройки HTTP клиента
+        :param metrics: метрики, в которых считаются вызовы Telegram по методу и статусу ответа
+        """
         self.token = token
-        self.session = aiohttp.ClientSession()
+        self.config = config
+        self.urls = {method: f"{config.base_url}/bot{token}/{method}" for method in self.METHODS}
+        self.pool_stats = ConnectionPoolStats()
+        connector = aiohttp.TCPConnector(limit=config.pool_size,
+                                         keepalive_timeout=config.keepalive_timeout_sec,
+                                         ttl_dns_cache=config.dns_cache_ttl_sec
+                                         )
+        self.timeout = aiohttp.ClientTimeout(total=config.request_timeout_sec, connect=config.connect_timeout_sec)
+        trace_configs = [make_trace_config(self.pool_stats)]
+        if metrics is not None:
+            trace_configs.append(make_metrics_trace_config(metrics))
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, trace_configs=trace_configs)
 
     async def close(self):
+        logging.info("Telegram connection pool: %s", self.pool_stats)
         await self.session.close()
 
-    async def get_updates(self, offset: int) -> UpdatesResponse:
+    async def get_updates(self,
+                          offset: int,
+                          limit: int = 100,
+                          timeout: int = 10,
+                          allowed_updates: Optional[List[str]] = None
+                          ) -> UpdatesResponse:
         """
-            Получает входящее обновление
+            Получает входящие обновления
         :param offset: числовой номер обновления
         :return: Response
         """
 
-        url = f"https://api.telegram.org/bot{self.token}/getUpdates"
-        logging.info(f"Listen to telegram. offset: {offset}")
-        body = {
+        logging.info("Listen to telegram. offset: %s", offset)
+        body: JsonDict = {
             "offset": offset,
-            "timeout": 10
+            "limit": limit,
+            "timeout": timeout
         }
-        response = await self.session.get(url, json=body)
-        logging.info(f"Status code get_update {response.status}")
-        response_body = await response.text()
+        if allowed_updates is not None:
+            body["allowed_updates"] = allowed_updates
+
+        # Telegram держит запрос открытым до `timeout` секунд, поэтому к нему добавляется обычный таймаут запроса
+        long_poll_timeout = aiohttp.ClientTimeout(total=self.config.request_timeout_sec + timeout,
+                                                  connect=self.config.connect_timeout_sec
+                                                  )
+        async with self.session.get(self.urls["getUpdates"], json=body, timeout=long_poll_timeout) as response:
+            logging.info("Status code get_update %s", response.status)
+            response_body = await response.text()
         response_json = json.loads(response_body)
         update_data = UpdatesResponse.parse_obj(response_json)
         return update_data
@@ -44,73 +97,122 @@ class LiveTelegramApi(TelegramApi):
                            keyboard: Optional[Keyboard] = None,
                            ) -> None:
 
-        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
-        body = {
-            "text": text,
-            "chat_id": chat_id
-        }
-        if parse_mode is not None:
-            body["parse_mode"] = parse_mode
-
-        if keyboard is not None:
-            body["reply_markup"] = {
-                "inline_keyboard": keyboard.as_json()
-            }
-
-        response = await self.session.post(url, json=body)
-        logging.info(f"Send message status code: {response.status} ")
-        if response.status != 200:
-            response_text = await response.text()
-            logging.info(f"TelegramAPI: Unexpected status code: {response.status}. Response body: {response_text}")
+        body = make_send_message_body(chat_id, text, parse_mode, keyboard)
+        async with self.session.post(self.urls["sendMessage"], json=body) as response:
+            logging.info("Send message status code: %s ", response.status)
+            await _check_response("sendMessage", response)
 
     async def answer_callback_query(self, callback_query_id: str) -> None:
-        url = f"https://api.telegram.org/bot{self.token}/answerCallbackQuery"
-        body = {
-            "callback_query_id": callback_query_id
-        }
-        response = await self.session.post(url, json=body)
-        logging.info(f"TelegramAPI answer_callback_query status code: {response.status}")
+        body = make_answer_callback_query_body(callback_query_id)
+        async with self.session.post(self.urls["answerCallbackQuery"], json=body) as response:
+            logging.info("TelegramAPI answer_callback_query status code: %s", response.status)
+            await _check_response("answerCallbackQuery", response)
 
-    async def edit_message(self, chat_id: int, message_id: int, text: str, parse_mode: Optional[str] = None) -> None:
-        url = f"https://api.telegram.org/bot{self.token}/editMessageText"
-        body = {
-            "chat_id": chat_id,
-            "message_id": message_id,
-            "text": text
-        }
-        if parse_mode is not None:
-            body["parse_mode"] = parse_mode
-
-        response = await self.session.post(url, json=body)
-        logging.info(f"TelegramAPI message_edit status code: {response.status}")
+    async def edit_message(self,
+                           chat_id: int,
+                           message_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        body = make_edit_message_body(chat_id, message_id, text, parse_mode, keyboard)
+        async with self.session.post(self.urls["editMessageText"], json=body) as response:
+            logging.info("TelegramAPI message_edit status code: %s", response.status)
+            await _check_response("editMessageText", response)
 
     async def set_webhook(self, https_url: str, cert_filepath: Optional[Path] = None) -> None:
-        url = f"https://api.telegram.org/bot{self.token}/setWebhook"
+        url = self.urls["setWebhook"]
         if not cert_filepath:
             logging.info("Setting hook without certificate")
             body = {
                 "url": https_url,
             }
-            response = await self.session.post(url, json=body)
+            async with self.session.post(url, json=body) as response:
+                logging.info("TelegramAPI set_webhook status code: %s", response.status)
         else:
-            logging.info(f"Setting hook with certificate from {cert_filepath}")
+            logging.info("Setting hook with certificate from %s", cert_filepath)
             with open(cert_filepath, 'r') as cert:
                 files = {'certificate': cert, 'url': https_url}
-                response = await self.session.post(url, data=files)
-        logging.info(f"TelegramAPI set_webhook status code: {response.status}")
+                async with self.session.post(url, data=files) as response:
+                    logging.info("TelegramAPI set_webhook status code: %s", response.status)
 
     async def delete_webhook(self, drop_pending_updates: bool) -> None:
-        url = f"https://api.telegram.org/bot{self.token}/deleteWebhook"
         body = {
             "drop_pending_updates": drop_pending_updates
         }
-        response = await self.session.post(url, json=body)
-        logging.info(f"TelegramAPI delete_webhook status code: {response.status}")
+        async with self.session.post(self.urls["deleteWebhook"], json=body) as response:
+            logging.info("TelegramAPI delete_webhook status code: %s", response.status)
+
+
+def make_trace_config(pool_stats: ConnectionPoolStats) -> aiohttp.TraceConfig:
+    """
+        Создает TraceConfig, который считает открытые, повторно использованные и ожидаемые соединения в `pool_stats`
+    """
+    async def on_connection_create_end(session, context, params):
+        pool_stats.created += 1
+
+    async def on_connection_reuseconn(session, context, params):
+        pool_stats.reused += 1
+
+    async def on_connection_queued_start(session, context, params):
+        pool_stats.queued += 1
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_connection_queued_start.append(on_connection_queued_start)
+    return trace_config
+
+
+def make_metrics_trace_config(metrics: BotMetrics) -> aiohttp.TraceConfig:
+    """
+        Создает TraceConfig, который считает запросы к Telegram в `metrics` по методу и статусу ответа. Запросы,
+        которые не получили ответа, считаются со статусом error
+    """
+    async def on_request_end(session, context, params):
+        metrics.telegram_calls.labels(_method_name(params.url), str(params.response.status)).inc()
+
+    async def on_request_exception(session, context, params):
+        metrics.telegram_calls.labels(_method_name(params.url), "error").inc()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+def _method_name(url) -> str:
+    """
+        Возвращает название метода Telegram Bot API из адреса запроса
+    """
+    return url.path.rsplit("/", 1)[-1]
+
+
+async def _check_response(method: str, response: aiohttp.ClientResponse) -> None:
+    """
+        Выбрасывает TooManyRequestsException, если Telegram ответил 429, и логирует остальные неожиданные ответы
+    :param method: название метода Telegram Bot API
+    :param response: ответ Telegram
+    """
+    if response.status == 200:
+        return
+
+    response_text = await response.text()
+    if response.status == 429:
+        try:
+            retry_after = json.loads(response_text)["parameters"]["retry_after"]
+        except (ValueError, KeyError, TypeError):
+            retry_after = 1
+        raise TooManyRequestsException(method, retry_after)
+    logging.info("TelegramAPI: Unexpected status code: %s. Response body: %s", response.status, response_text)
 
 
 @asynccontextmanager
-async def make_live_telegram_api(token: str):
-    telegram = LiveTelegramApi(token)
+async def make_live_telegram_api(token: str,
+                                 config: TelegramHttpConfig = TelegramHttpConfig(),
+                                 metrics: Optional[BotMetrics] = None
+                                 ):
+    telegram = LiveTelegramApi(token, config, metrics)
     try:
         yield telegram
     finally:
@@ -0,0 +1,102 @@
+import copy
+import logging
+import queue
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Dict, Mapping, Optional
+from trivia.bot_config import LoggingConfig
+
+
+LOG_FORMAT = "%(asctime)s - %(message)s"
+LOG_DATE_FORMAT = "%d-%b-%y %H:%M:%S"
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только каждую N-ю запись уровня INFO и ниже из модулей `sample_every`. Записи уровня WARNING и выше,
+    а также записи остальных модулей пропускаются всегда
+    """
+    def __init__(self, sample_every: Dict[str, int]):
+        """
+        :param sample_every: имя модуля -> N
+        """
+        super().__init__()
+        self.sample_every = sample_every
+        self.counts: Dict[str, int] = {module: 0 for module in sample_every}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        every = self.sample_every.get(record.module)
+        if every is None or every <= 1:
+            return True
+
+        count = self.counts[record.module]
+        self.counts[record.module] = count + 1
+        return count % every == 0
+
+
+PRIMITIVE_TYPES = (str, int, float, bool, type(None))
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler, который кладет запись в очередь без форматирования, если все аргументы сообщения - неизменяемые
+    примитивы. Тогда их подставляет в сообщение поток записи, а не поток, который логирует. Остальные объекты, например
+    состояние чата, могут измениться до того, как поток записи возьмет запись из очереди, поэтому такое сообщение
+    форматируется сразу в копии записи
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        values = args.values() if isinstance(args, Mapping) else args or ()
+        if all(isinstance(value, PRIMITIVE_TYPES) for value in values):
+            return record
+
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def make_file_handler(file_name: str, config: LoggingConfig) -> logging.Handler:
+    """
+        Создает обработчик, который пишет лог в `file_name` и начинает новый файл по размеру или по времени
+    """
+    if config.rotation == "time":
+        return TimedRotatingFileHandler(file_name, when=config.when, backupCount=config.backup_count, encoding="utf-8")
+    return RotatingFileHandler(file_name, maxBytes=config.max_bytes, backupCount=config.backup_count, encoding="utf-8")
+
+
+@contextmanager
+def make_logging_pipeline(file_name: Optional[str], config: LoggingConfig = LoggingConfig()):
+    """
+        Настраивает корневой logger так, что записи передаются через очередь в отдельный поток, который форматирует
+        их и пишет в файл `file_name` или в stderr, если файл не задан. При выходе дописывает все записи из очереди
+        и возвращает прежние обработчики
+    """
+    if file_name is not None:
+        handler = make_file_handler(file_name, config)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(records)
+    if config.sample_every:
+        queue_handler.addFilter(SamplingFilter(config.sample_every))
+    listener = QueueListener(records, handler)
+
+    root = logging.getLogger()
+    previous_handlers = root.handlers[:]
+    previous_level = root.level
+    root.handlers = [queue_handler]
+    root.setLevel(config.level)
+    listener.start()
+    try:
+        yield listener
+    finally:
+        listener.stop()
+        root.handlers = previous_handlers
+        root.setLevel(previous_level)
+        handler.close()
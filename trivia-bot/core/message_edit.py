@@ -1,5 +1,6 @@
 from typing import Optional
 from dataclasses import dataclass
+from core.keyboard import Keyboard
 
 
 @dataclass
@@ -12,8 +13,10 @@ class MessageEdit:
         message_id: идентификатор сообщения для редактирования
         text: новый текст редактируемого сообщения
         parse_mode: режим форматирования текста сообщения
+        keyboard: встроенная клавиатура, которая заменит клавиатуру сообщения. Без нее клавиатура удаляется
     """
     chat_id: int
     message_id: int
     text: str
     parse_mode: Optional[str] = None
+    keyboard: Optional[Keyboard] = None
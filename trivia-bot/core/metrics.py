@@ -0,0 +1,69 @@
+from typing import Optional
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.context_managers import Timer
+
+
+# Этапы обработки update, время которых измеряется
+STAGES = ["lock_and_load", "decode", "process", "send", "save"]
+
+# Границы интервалов гистограммы времени этапа в секундах
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class BotMetrics:
+    """
+    Метрики обработки update в формате Prometheus. Время этапов обработки update:
+    lock_and_load - получение mutex чата вместе с загрузкой состояния, включая ожидание mutex и декодирование
+    decode - декодирование состояния, загруженного из Redis
+    process - обработка update состоянием бота
+    send - исходящие вызовы Telegram, включая ожидание в очереди ограничения частоты
+    save - сохранение состояния вместе с освобождением mutex
+    Кроме времени этапов считаются обработанные update, повторные попытки получить mutex, ошибки получения mutex
+    и исходящие вызовы Telegram по статусам ответа.
+
+    Метрики дешевые: измерение этапа - два вызова time.perf_counter и обновление гистограммы под mutex потока,
+    поэтому их можно не выключать под нагрузкой
+    """
+    def __init__(self, registry: Optional[CollectorRegistry] = None):
+        """
+        :param registry: реестр метрик. По умолчанию создается отдельный реестр
+        """
+        self.registry = registry if registry is not None else CollectorRegistry()
+        self.stage_seconds = Histogram("trivia_bot_stage_seconds",
+                                       "Время этапа обработки update",
+                                       ["stage"],
+                                       registry=self.registry,
+                                       buckets=STAGE_BUCKETS
+                                       )
+        self.updates = Counter("trivia_bot_updates",
+                               "Полученные update по типу и результату обработки",
+                               ["type", "result"],
+                               registry=self.registry
+                               )
+        self.lock_retries = Counter("trivia_bot_lock_retries",
+                                    "Повторные попытки получить mutex чата",
+                                    registry=self.registry
+                                    )
+        self.lock_failures = Counter("trivia_bot_lock_failures",
+                                     "Mutex чата не получен за максимальное количество попыток",
+                                     registry=self.registry
+                                     )
+        self.telegram_calls = Counter("trivia_bot_telegram_calls",
+                                      "Исходящие вызовы Telegram по методу и статусу ответа",
+                                      ["method", "status"],
+                                      registry=self.registry
+                                      )
+        self._stages = {stage: self.stage_seconds.labels(stage) for stage in STAGES}
+
+    def time_stage(self, stage: str) -> Timer:
+        """
+            Возвращает контекстный менеджер, который измеряет время этапа
+        :param stage: этап из STAGES
+        """
+        return self._stages[stage].time()
+
+    def generate(self) -> bytes:
+        """
+            Возвращает метрики в текстовом формате Prometheus
+        """
+        return generate_latest(self.registry)
@@ -1,5 +1,8 @@
 from abc import ABCMeta, abstractmethod
-from random import shuffle
+from random import shuffle, sample
+from typing import Sequence, List, TypeVar
+
+T = TypeVar('T')
 
 
 class Random(metaclass=ABCMeta):
@@ -17,8 +20,21 @@ class Random(metaclass=ABCMeta):
         """
         pass
 
+    @abstractmethod
+    def sample(self, data: Sequence[T], k: int) -> List[T]:
+        """
+        Выбирает k различных элементов из переданной последовательности. Последовательность не изменяется
+        :param data: последовательность
+        :param k: количество элементов
+        :return: список выбранных элементов
+        """
+        pass
+
 
 class RandomImpl(Random):
 
     def shuffle(self, data: list) -> None:
         shuffle(data)
+
+    def sample(self, data: Sequence[T], k: int) -> List[T]:
+        return sample(data, k)
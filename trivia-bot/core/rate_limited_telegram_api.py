@@ -0,0 +1,356 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from core.keyboard import Keyboard
+from core.telegram_api import SendTimeoutException, TelegramApi, TooManyRequestsException
+from trivia.bot_config import TelegramRateLimitConfig
+from trivia.telegram_models import UpdatesResponse
+
+
+class TokenBucket:
+    """
+    Ведро токенов: пополняется со скоростью `rate` токенов в секунду и вмещает не больше `capacity` токенов.
+    Каждый вызов забирает один токен. Выдачу токенов можно приостановить до заданного времени
+    """
+    def __init__(self, rate: float, capacity: float, now: float):
+        """
+        :param rate: сколько токенов добавляется в секунду
+        :param capacity: максимальное количество токенов
+        :param now: текущее время в секундах
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+        self.paused_until = now
+
+    def delay(self, now: float) -> float:
+        """
+            Возвращает, через сколько секунд в ведре появится токен
+        :param now: текущее время в секундах
+        :return: 0, если токен есть уже сейчас
+        """
+        self._refill(now)
+        pause = max(self.paused_until - now, 0.0)
+        if self.tokens >= 1:
+            return pause
+        return max(pause, (1 - self.tokens) / self.rate)
+
+    def pause(self, until: float) -> None:
+        """
+            Не выдает токены до времени `until`
+        :param until: время в секундах
+        """
+        self.paused_until = max(self.paused_until, until)
+
+    def take(self, now: float) -> None:
+        """
+            Забирает токен. Перед этим нужно проверить, что delay вернул 0
+        :param now: текущее время в секундах
+        """
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        """
+            Проверяет, что ведро заполнено и его можно удалить без изменения поведения ограничения
+        :param now: текущее время в секундах
+        """
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class RateLimitedTelegramApi(TelegramApi):
+    """
+    Очередь исходящих вызовов перед TelegramApi. Сообщения отправляются не чаще `global_rate` в секунду во все чаты
+    и не чаще `chat_rate` в секунду в один чат. Ответы на callback query не ограничены по чату и отправляются раньше
+    сообщений, потому что пользователь видит индикатор загрузки на кнопке, пока бот не ответит.
+
+    Если Telegram ответил 429 на сообщение, отправка в этот чат приостанавливается на `retry_after` секунд, а если
+    на вызов без чата, то приостанавливается отправка всех вызовов. Вызов возвращается в начало очереди и повторяется
+    до `max_retries` раз. Вызовы одного чата отправляются по одному в порядке добавления: следующий вызов чата
+    отправляется только после ответа Telegram на предыдущий, поэтому повтор после 429 не обгоняют более поздние вызовы.
+    Вызов, который не удалось отправить за `max_wait_sec` секунд, завершается SendTimeoutException: Bot отправляет
+    вызовы под mutex чата, и ожидание в очереди не должно пережить mutex.
+    Получение update и настройка webhook не ограничиваются
+    """
+    ANSWER_PRIORITY = 0
+    MESSAGE_PRIORITY = 1
+
+    @dataclass
+    class Request:
+        priority: int
+        chat_id: Optional[int]
+        call: Callable[[TelegramApi], Awaitable[None]]
+        result: "asyncio.Future[None]"
+        deadline: float
+        attempt: int = 0
+
+    def __init__(self,
+                 telegram_api: TelegramApi,
+                 global_rate: float,
+                 chat_rate: float,
+                 chat_burst: int,
+                 max_retries: int,
+                 max_wait_sec: float,
+                 clock: Callable[[], float] = time.monotonic
+                 ):
+        """
+        :param telegram_api: api, через которое отправляются вызовы
+        :param global_rate: сколько сообщений в секунду можно отправить во все чаты
+        :param chat_rate: сколько сообщений в секунду можно отправить в один чат
+        :param chat_burst: сколько сообщений подряд можно отправить в один чат без ожидания
+        :param max_retries: сколько раз повторять вызов после ответа 429
+        :param max_wait_sec: сколько секунд вызов может ждать отправки, включая паузы после ответов 429
+        :param clock: источник времени в секундах
+        """
+        self.telegram_api = telegram_api
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_wait_sec = max_wait_sec
+        self.clock = clock
+        self._global_bucket = TokenBucket(global_rate, 1, clock())
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._prune_size = _MIN_PRUNE_SIZE
+        self._paused_until = 0.0
+        self._queues: List[Deque[RateLimitedTelegramApi.Request]] = [deque(), deque()]
+        self._wakeup = asyncio.Event()
+        self._sender: Optional["asyncio.Task[None]"] = None
+        self._in_flight: Set["asyncio.Task[None]"] = set()
+        self._sending_chats: Set[int] = set()
+
+    def start(self) -> None:
+        """
+            Запускает отправку вызовов из очереди
+        """
+        self._sender = asyncio.create_task(self._send_loop())
+
+    async def close(self) -> None:
+        """
+            Останавливает отправку. Неотправленные вызовы отменяются
+        """
+        tasks = list(self._in_flight)
+        if self._sender is not None:
+            tasks.append(self._sender)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._sender = None
+        for queue in self._queues:
+            for request in queue:
+                request.result.cancel()
+            queue.clear()
+
+    async def get_updates(self,
+                          offset: int,
+                          limit: int = 100,
+                          timeout: int = 10,
+                          allowed_updates: Optional[List[str]] = None
+                          ) -> UpdatesResponse:
+        return await self.telegram_api.get_updates(offset, limit, timeout, allowed_updates)
+
+    async def send_message(self,
+                           chat_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        await self._enqueue(self.MESSAGE_PRIORITY,
+                            chat_id,
+                            lambda api: api.send_message(chat_id, text, parse_mode, keyboard)
+                            )
+
+    async def answer_callback_query(self, callback_query_id: str) -> None:
+        await self._enqueue(self.ANSWER_PRIORITY,
+                            None,
+                            lambda api: api.answer_callback_query(callback_query_id)
+                            )
+
+    async def edit_message(self,
+                           chat_id: int,
+                           message_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        await self._enqueue(self.MESSAGE_PRIORITY,
+                            chat_id,
+                            lambda api: api.edit_message(chat_id, message_id, text, parse_mode, keyboard)
+                            )
+
+    async def set_webhook(self, url: str, cert_filepath: Optional[Path] = None) -> None:
+        await self.telegram_api.set_webhook(url, cert_filepath)
+
+    async def delete_webhook(self, drop_pending_updates: bool) -> None:
+        await self.telegram_api.delete_webhook(drop_pending_updates)
+
+    async def _enqueue(self,
+                       priority: int,
+                       chat_id: Optional[int],
+                       call: Callable[[TelegramApi], Awaitable[None]]
+                       ) -> None:
+        result: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        deadline = self.clock() + self.max_wait_sec
+        self._queues[priority].append(RateLimitedTelegramApi.Request(priority, chat_id, call, result, deadline))
+        self._wakeup.set()
+        await result
+
+    async def _send_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            request, delay = self._take_next_request(self.clock())
+            if request is not None:
+                task = asyncio.create_task(self._send(request))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _take_next_request(self, now: float) -> Tuple[Optional["RateLimitedTelegramApi.Request"], Optional[float]]:
+        """
+            Забирает из очереди первый вызов, который можно отправить сейчас
+        :param now: текущее время в секундах
+        :return: вызов или None и через сколько секунд стоит проверить очередь еще раз. None - ждать новых вызовов
+        """
+        next_deadline = self._drop_expired_requests(now)
+        if next_deadline is None:
+            return None, None
+
+        delay = max(self._paused_until - now, self._global_bucket.delay(now))
+        if delay > 0:
+            return None, min(delay, next_deadline - now)
+
+        for queue in self._queues:
+            for index, request in enumerate(queue):
+                if request.chat_id is not None:
+                    if request.chat_id in self._sending_chats:
+                        continue
+
+                    chat_bucket = self._get_chat_bucket(request.chat_id, now)
+                    chat_delay = chat_bucket.delay(now)
+                    if chat_delay > 0:
+                        delay = chat_delay if delay == 0 else min(delay, chat_delay)
+                        continue
+                    chat_bucket.take(now)
+                    self._sending_chats.add(request.chat_id)
+
+                del queue[index]
+                self._global_bucket.take(now)
+                return request, 0.0
+
+        return None, min(delay, next_deadline - now) if delay > 0 else next_deadline - now
+
+    def _drop_expired_requests(self, now: float) -> Optional[float]:
+        """
+            Убирает из очереди отмененные вызовы и завершает SendTimeoutException вызовы, которые ждут дольше
+            `max_wait_sec`
+        :param now: текущее время в секундах
+        :return: ближайший срок оставшихся вызовов или None, если очередь пуста
+        """
+        next_deadline: Optional[float] = None
+        for priority, queue in enumerate(self._queues):
+            if not queue:
+                continue
+
+            waiting: Deque[RateLimitedTelegramApi.Request] = deque()
+            for request in queue:
+                if request.result.done():
+                    continue
+                if request.deadline <= now:
+                    _set_exception(request.result, SendTimeoutException(self.max_wait_sec))
+                    continue
+                waiting.append(request)
+                if next_deadline is None or request.deadline < next_deadline:
+                    next_deadline = request.deadline
+            self._queues[priority] = waiting
+        return next_deadline
+
+    def _get_chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self._prune_size:
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_full(now)
+                }
+                self._prune_size = max(_MIN_PRUNE_SIZE, 2 * len(self._chat_buckets))
+            bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _send(self, request: "RateLimitedTelegramApi.Request") -> None:
+        try:
+            await self._call(request)
+        finally:
+            if request.chat_id is not None:
+                self._sending_chats.discard(request.chat_id)
+                self._wakeup.set()
+
+    async def _call(self, request: "RateLimitedTelegramApi.Request") -> None:
+        try:
+            await request.call(self.telegram_api)
+        except TooManyRequestsException as e:
+            if request.attempt >= self.max_retries:
+                _set_exception(request.result, e)
+                return
+
+            logging.warning("%s. Attempt %s of %s", e, request.attempt + 1, self.max_retries)
+            request.attempt += 1
+            now = self.clock()
+            if request.chat_id is None:
+                self._paused_until = max(self._paused_until, now + e.retry_after)
+            else:
+                self._get_chat_bucket(request.chat_id, now).pause(now + e.retry_after)
+            self._queues[request.priority].appendleft(request)
+            self._wakeup.set()
+            return
+        except Exception as e:
+            _set_exception(request.result, e)
+            return
+
+        if not request.result.done():
+            request.result.set_result(None)
+
+
+_MIN_PRUNE_SIZE = 1000
+
+
+def _set_exception(result: "asyncio.Future[None]", exception: Exception) -> None:
+    if not result.done():
+        result.set_exception(exception)
+
+
+@asynccontextmanager
+async def make_rate_limited_telegram_api(telegram_api: TelegramApi, config: TelegramRateLimitConfig):
+    """
+        Оборачивает `telegram_api` в RateLimitedTelegramApi, если ограничение включено в настройках
+    """
+    if not config.enabled:
+        yield telegram_api
+        return
+
+    rate_limited_api = RateLimitedTelegramApi(telegram_api,
+                                              config.global_rate_per_sec,
+                                              config.chat_rate_per_sec,
+                                              config.chat_burst,
+                                              config.max_retries,
+                                              config.max_wait_sec
+                                              )
+    rate_limited_api.start()
+    try:
+        yield rate_limited_api
+    finally:
+        await rate_limited_api.close()
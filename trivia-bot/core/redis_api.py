@@ -1,5 +1,5 @@
 from abc import ABCMeta, abstractmethod
-from typing import Optional
+from typing import Optional, Tuple
 
 
 class RedisApi(metaclass=ABCMeta):
@@ -8,29 +8,90 @@ class RedisApi(metaclass=ABCMeta):
     """
 
     @abstractmethod
-    async def lock(self, key: str) -> None:
+    async def lock(self, key: str) -> str:
         """
         Получает mutex на переданный ключ
+        :return: токен владельца mutex, который нужно передать в unlock
         """
         pass
 
     @abstractmethod
-    def unlock(self, key: str) -> None:
+    async def unlock(self, key: str, token: str) -> None:
         """
-        Убирает mutex на переданный ключ
+        Убирает mutex на переданный ключ, если он принадлежит владельцу переданного токена
         """
         pass
 
     @abstractmethod
-    def set_key(self, key: str, value: str):
+    async def set_key(self, key: str, value: bytes):
         """
         Сохраняет состояние на переданные ключ и значение
         """
         pass
 
     @abstractmethod
-    def get_key(self, key: str) -> Optional[str]:
+    async def get_key(self, key: str) -> Optional[bytes]:
         """
         Получает состояние на переданные ключ и значение
         """
         return None
+
+    @abstractmethod
+    async def set_key_if_absent(self, key: str, value: bytes, expire_sec: int) -> bool:
+        """
+        Сохраняет значение ключа на `expire_sec` секунд, только если ключа еще нет
+        :return: True, если значение сохранено
+        """
+        pass
+
+    @abstractmethod
+    async def delete_key(self, key: str) -> None:
+        """
+        Удаляет ключ
+        """
+        pass
+
+    async def lock_and_get_versioned_key(self,
+                                         lock_key: str,
+                                         key: str,
+                                         version_key: str,
+                                         known_version: Optional[str]
+                                         ) -> Tuple[str, Optional[str], Optional[bytes]]:
+        """
+        Получает mutex на `lock_key`, версию значения из `version_key` и значение ключа `key`. Значение не читается,
+        если версия совпала с `known_version`. Реализация по умолчанию выполняет отдельные операции, реализации могут
+        переопределить метод, чтобы выполнить его за одно обращение к Redis
+        :return: токен владельца mutex, версия значения и значение ключа. Значение будет None, если версия совпала с
+            `known_version`, версия будет None, если значение еще ни разу не сохранялось с версией
+        """
+        token = await self.lock(lock_key)
+        try:
+            bytes_version = await self.get_key(version_key)
+            version = bytes_version.decode() if bytes_version else None
+            if version is not None and version == known_version:
+                return token, version, None
+            return token, version, await self.get_key(key)
+        except BaseException:
+            await self.unlock(lock_key, token)
+            raise
+
+    async def set_versioned_key_and_unlock(self,
+                                           key: str,
+                                           value: bytes,
+                                           version_key: str,
+                                           lock_key: str,
+                                           token: str
+                                           ) -> str:
+        """
+        Сохраняет значение ключа `key`, увеличивает версию в `version_key` и убирает mutex на `lock_key`. Реализация
+        по умолчанию выполняет отдельные операции, реализации могут переопределить метод, чтобы выполнить его за одно
+        обращение к Redis
+        :return: новая версия значения
+        """
+        try:
+            version = str(int(await self.get_key(version_key) or 0) + 1)
+            await self.set_key(key, value)
+            await self.set_key(version_key, version.encode())
+            return version
+        finally:
+            await self.unlock(lock_key, token)
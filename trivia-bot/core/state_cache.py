@@ -0,0 +1,77 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+from core.bot_state import BotState
+
+
+class StateCache:
+    """
+    LRU кеш декодированных состояний чатов. Хранит не больше `max_size` состояний, каждое не дольше `ttl_sec` секунд.
+    Вместе с состоянием хранится его версия в Redis, по которой хранилище проверяет, что состояние в кеше актуально,
+    и хеш сохраненного значения, по которому хранилище проверяет, что состояние изменилось
+    """
+    @dataclass
+    class Entry:
+        version: str
+        state: BotState
+        digest: bytes
+        expires_at: float
+
+    def __init__(self, max_size: int, ttl_sec: float, clock: Callable[[], float] = time.monotonic):
+        """
+        :param max_size: максимальное количество состояний в кеше
+        :param ttl_sec: сколько секунд состояние хранится в кеше
+        :param clock: источник времени в секундах
+        """
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.clock = clock
+        self.entries: "OrderedDict[int, StateCache.Entry]" = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"StateCache: size = {len(self.entries)}, max_size = {self.max_size}, ttl_sec = {self.ttl_sec}"
+
+    def get(self, chat_id: int) -> Optional[Tuple[str, BotState, bytes]]:
+        """
+            Возвращает состояние чата из кеша
+        :param chat_id: идентификатор чата
+        :return: версия, состояние и хеш сохраненного значения. Вернет None, если состояния нет в кеше или оно
+            устарело по времени
+        """
+        entry = self.entries.get(chat_id)
+        if entry is None:
+            return None
+
+        if entry.expires_at <= self.clock():
+            del self.entries[chat_id]
+            return None
+
+        self.entries.move_to_end(chat_id)
+        return entry.version, entry.state, entry.digest
+
+    def put(self, chat_id: int, version: str, state: BotState, digest: bytes) -> None:
+        """
+            Сохраняет состояние чата в кеш. Если кеш заполнен, вытесняет дольше всех не использованное состояние
+        :param chat_id: идентификатор чата
+        :param version: версия состояния в Redis
+        :param state: состояние бота
+        :param digest: хеш значения состояния в Redis
+        """
+        if self.max_size <= 0:
+            return
+
+        self.entries[chat_id] = StateCache.Entry(version, state, digest, self.clock() + self.ttl_sec)
+        self.entries.move_to_end(chat_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def discard(self, chat_id: int) -> None:
+        """
+            Удаляет состояние чата из кеша
+        :param chat_id: идентификатор чата
+        """
+        self.entries.pop(chat_id, None)
@@ -0,0 +1,160 @@
+import asyncio
+from abc import ABCMeta, abstractmethod
+from dataclasses import dataclass
+from typing import ClassVar, List, Optional
+from core.keyboard import Keyboard
+from core.telegram_api import TelegramApi
+from core.utils import JsonDict
+
+
+class TelegramAction(metaclass=ABCMeta):
+    """
+        Исходящий вызов Telegram Bot API, результат которого боту не нужен. Вызов можно отправить через TelegramApi
+        или вернуть Telegram в ответе на webhook
+        Telegram Api documentation ( https://core.telegram.org/bots/api#making-requests-when-getting-updates )
+        ordered - вызов нужно отправить после предыдущих вызовов с `ordered`, иначе нарушится порядок сообщений в чате
+    """
+    ordered: ClassVar[bool] = False
+
+    @abstractmethod
+    async def send(self, telegram_api: TelegramApi) -> None:
+        """
+            Отправляет вызов через TelegramApi
+        :param telegram_api: api для отправки
+        """
+        pass
+
+    @abstractmethod
+    def as_webhook_reply(self) -> JsonDict:
+        """
+            Возвращает тело ответа на webhook, которое выполнит этот вызов
+        :return: JSON с названием метода и его параметрами
+        """
+        pass
+
+
+@dataclass
+class SendMessageAction(TelegramAction):
+    ordered: ClassVar[bool] = True
+    chat_id: int
+    text: str
+    parse_mode: Optional[str] = None
+    keyboard: Optional[Keyboard] = None
+
+    async def send(self, telegram_api: TelegramApi) -> None:
+        await telegram_api.send_message(self.chat_id, self.text, self.parse_mode, self.keyboard)
+
+    def as_webhook_reply(self) -> JsonDict:
+        return {
+            "method": "sendMessage",
+            **make_send_message_body(self.chat_id, self.text, self.parse_mode, self.keyboard)
+        }
+
+
+@dataclass
+class EditMessageAction(TelegramAction):
+    chat_id: int
+    message_id: int
+    text: str
+    parse_mode: Optional[str] = None
+    keyboard: Optional[Keyboard] = None
+
+    async def send(self, telegram_api: TelegramApi) -> None:
+        await telegram_api.edit_message(self.chat_id, self.message_id, self.text, self.parse_mode, self.keyboard)
+
+    def as_webhook_reply(self) -> JsonDict:
+        return {
+            "method": "editMessageText",
+            **make_edit_message_body(self.chat_id, self.message_id, self.text, self.parse_mode, self.keyboard)
+        }
+
+
+@dataclass
+class AnswerCallbackQueryAction(TelegramAction):
+    callback_query_id: str
+
+    async def send(self, telegram_api: TelegramApi) -> None:
+        await telegram_api.answer_callback_query(self.callback_query_id)
+
+    def as_webhook_reply(self) -> JsonDict:
+        return {
+            "method": "answerCallbackQuery",
+            **make_answer_callback_query_body(self.callback_query_id)
+        }
+
+
+async def send_actions(telegram_api: TelegramApi, actions: List[TelegramAction]) -> None:
+    """
+        Отправляет вызовы. Вызовы с `ordered` отправляются по очереди, а остальные, например ответ на callback query или
+        редактирование сообщения, одновременно с ними. Если вызовы завершились ошибкой, то после завершения всех вызовов
+        выбрасывается первая ошибка
+    :param telegram_api: api для отправки
+    :param actions: вызовы в порядке отправки
+    """
+    async def send_ordered(ordered_actions: List[TelegramAction]) -> None:
+        for action in ordered_actions:
+            await action.send(telegram_api)
+
+    ordered_actions = [action for action in actions if action.ordered]
+    results = await asyncio.gather(send_ordered(ordered_actions),
+                                   *[action.send(telegram_api) for action in actions if not action.ordered],
+                                   return_exceptions=True
+                                   )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+def make_send_message_body(chat_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> JsonDict:
+    """
+        Создает параметры метода sendMessage
+    """
+    body: JsonDict = {
+        "text": text,
+        "chat_id": chat_id
+    }
+    if parse_mode is not None:
+        body["parse_mode"] = parse_mode
+
+    if keyboard is not None:
+        body["reply_markup"] = {
+            "inline_keyboard": keyboard.as_json()
+        }
+    return body
+
+
+def make_edit_message_body(chat_id: int,
+                           message_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> JsonDict:
+    """
+        Создает параметры метода editMessageText
+    """
+    body: JsonDict = {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "text": text
+    }
+    if parse_mode is not None:
+        body["parse_mode"] = parse_mode
+
+    if keyboard is not None:
+        body["reply_markup"] = {
+            "inline_keyboard": keyboard.as_json()
+        }
+    return body
+
+
+def make_answer_callback_query_body(callback_query_id: str) -> JsonDict:
+    """
+        Создает параметры метода answerCallbackQuery
+    """
+    return {
+        "callback_query_id": callback_query_id
+    }
@@ -1,19 +1,62 @@
 from core.keyboard import Keyboard
 from abc import ABCMeta, abstractmethod
-from typing import Optional
+from typing import List, Optional
 from trivia.telegram_models import UpdatesResponse
 from pathlib import Path
 
 
+class TelegramException(Exception):
+    """
+    Ошибка вызова Telegram Bot API
+    """
+    pass
+
+
+class TooManyRequestsException(TelegramException):
+    """
+    Telegram ответил 429: превышен лимит запросов, повторить вызов можно через `retry_after` секунд
+    Telegram Api documentation ( https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this )
+    """
+    def __init__(self, method: str, retry_after: float):
+        super().__init__()
+        self.method = method
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return f"Too many requests to {self.method}. Retry after {self.retry_after} seconds"
+
+
+class SendTimeoutException(TelegramException):
+    """
+    Вызов не дождался своей очереди на отправку за `max_wait_sec` секунд
+    """
+    def __init__(self, max_wait_sec: float):
+        super().__init__()
+        self.max_wait_sec = max_wait_sec
+
+    def __str__(self):
+        return f"Telegram call was not sent within {self.max_wait_sec} seconds"
+
+
 class TelegramApi(metaclass=ABCMeta):
     """
         Интерфейс получение входящих обновлений и отправки сообщений в телеграм
     """
 
     @abstractmethod
-    async def get_updates(self, offset: int) -> UpdatesResponse:
+    async def get_updates(self,
+                          offset: int,
+                          limit: int = 100,
+                          timeout: int = 10,
+                          allowed_updates: Optional[List[str]] = None
+                          ) -> UpdatesResponse:
         """
-            Получение входящего обновления
+            Получение входящих обновлений через long polling.
+            Telegram Api documentation ( https://core.telegram.org/bots/api#getupdates ).
+        :param offset: идентификатор первого обновления. Обновления с меньшим идентификатором подтверждаются
+        :param limit: максимальное количество обновлений в ответе
+        :param timeout: сколько секунд Telegram ждет новые обновления, прежде чем вернуть пустой ответ
+        :param allowed_updates: типы обновлений, которые нужно получать. None - оставить настройку без изменений
         """
         pass
 
@@ -43,7 +86,13 @@ class TelegramApi(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    async def edit_message(self, chat_id: int, message_id: int, text: str, parse_mode: Optional[str] = None) -> None:
+    async def edit_message(self,
+                           chat_id: int,
+                           message_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
         """
             Метод для редактирования существующего сообщения в истории сообщений, вместо отправления нового сообщения.
             Telegram Api documentation ( https://core.telegram.org/bots/api#editmessagetext )
@@ -51,6 +100,8 @@ class TelegramApi(metaclass=ABCMeta):
         :param message_id: идентификатор сообщения для редактирования
         :param text: новый текст редактируюмого сообщения
         :param parse_mode: режим для форматирования текста сообщения
+        :param keyboard: опциональная встроенная клавиатура, которая заменит клавиатуру сообщения. Без нее
+            клавиатура удаляется
         :return: None
         """
         pass
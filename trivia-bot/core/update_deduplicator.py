@@ -0,0 +1,79 @@
+from abc import ABCMeta, abstractmethod
+from collections import deque
+from typing import Deque, Set
+from core.redis_api import RedisApi
+
+
+class UpdateDeduplicator(metaclass=ABCMeta):
+    """
+    Запоминает идентификаторы полученных update, чтобы не обрабатывать повторно update, которые Telegram доставил
+    еще раз
+    """
+
+    @abstractmethod
+    async def mark_seen(self, update_id: int) -> bool:
+        """
+            Запоминает update
+        :param update_id: идентификатор update
+        :return: False, если update с таким идентификатором уже был получен
+        """
+        pass
+
+    @abstractmethod
+    async def forget(self, update_id: int) -> None:
+        """
+            Забывает update, например, если его обработка завершилась ошибкой и Telegram должен доставить его еще раз
+        :param update_id: идентификатор update
+        """
+        pass
+
+
+class InMemoryUpdateDeduplicator(UpdateDeduplicator):
+    """
+    Хранит в памяти идентификаторы последних `window_size` update. Подходит, если работает один экземпляр бота
+    """
+    def __init__(self, window_size: int):
+        """
+        :param window_size: сколько последних идентификаторов помнить
+        """
+        self.window: Deque[int] = deque(maxlen=window_size)
+        self.seen: Set[int] = set()
+
+    async def mark_seen(self, update_id: int) -> bool:
+        if update_id in self.seen:
+            return False
+
+        if len(self.window) == self.window.maxlen:
+            self.seen.discard(self.window[0])
+        self.window.append(update_id)
+        self.seen.add(update_id)
+        return True
+
+    async def forget(self, update_id: int) -> None:
+        if update_id in self.seen:
+            self.seen.remove(update_id)
+            self.window.remove(update_id)
+
+
+class RedisUpdateDeduplicator(UpdateDeduplicator):
+    """
+    Хранит идентификаторы update в Redis ключами `update_<id>`, которые живут `ttl_sec` секунд. Подходит, если с одним
+    Redis работают несколько экземпляров бота
+    """
+    def __init__(self, redis_api: RedisApi, ttl_sec: int):
+        """
+        :param redis_api: api для доступа к Redis
+        :param ttl_sec: сколько секунд помнить update
+        """
+        self.redis_api = redis_api
+        self.ttl_sec = ttl_sec
+
+    async def mark_seen(self, update_id: int) -> bool:
+        return await self.redis_api.set_key_if_absent(_update_key(update_id), b"1", self.ttl_sec)
+
+    async def forget(self, update_id: int) -> None:
+        await self.redis_api.delete_key(_update_key(update_id))
+
+
+def _update_key(update_id: int) -> str:
+    return f"update_{update_id}"
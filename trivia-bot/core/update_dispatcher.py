@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, List
+from trivia.telegram_models import Update
+
+
+class UpdateDispatcher:
+    """
+    Раздает update пулу из `worker_count` обработчиков. Update разных чатов обрабатываются параллельно, а update
+    одного чата строго по очереди в порядке получения. Одновременно ожидают обработки не больше `max_pending`
+    update: dispatch ждет, пока освободится место, а try_dispatch сразу отказывает.
+
+    Для каждого чата хранится очередь его update. Чат, у которого есть необработанные update и которого сейчас никто
+    не обрабатывает, стоит в общей очереди готовых чатов. Обработчик берет из нее чат, обрабатывает один update и,
+    если у чата остались update, возвращает чат в конец общей очереди, чтобы активный чат не занимал обработчик
+    """
+    def __init__(self,
+                 process_update: Callable[[Update], Awaitable[None]],
+                 worker_count: int,
+                 max_pending: int
+                 ):
+        """
+        :param process_update: функция обработки одного update
+        :param worker_count: количество обработчиков
+        :param max_pending: максимальное количество update, ожидающих обработки
+        """
+        self.process_update = process_update
+        self.worker_count = worker_count
+        self._pending = asyncio.Semaphore(max_pending)
+        self._chat_updates: Dict[int, Deque[Update]] = {}
+        self._ready_chats: "asyncio.Queue[int]" = asyncio.Queue()
+        self._workers: List["asyncio.Task[None]"] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def start(self) -> None:
+        """
+            Запускает обработчиков
+        """
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+
+    async def close(self) -> None:
+        """
+            Останавливает обработчиков. Необработанные update отбрасываются
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def dispatch(self, update: Update) -> None:
+        """
+            Ставит update в очередь его чата. Ждет, если в обработке уже `max_pending` update
+        :param update: update от Telegram
+        """
+        await self._pending.acquire()
+        self._idle.clear()
+        chat_id = update.get_chat_id(update)
+        updates = self._chat_updates.get(chat_id)
+        if updates is None:
+            self._chat_updates[chat_id] = deque([update])
+            self._ready_chats.put_nowait(chat_id)
+        else:
+            updates.append(update)
+
+    async def try_dispatch(self, update: Update) -> bool:
+        """
+            Ставит update в очередь его чата, если в обработке меньше `max_pending` update
+        :param update: update от Telegram
+        :return: False, если очередь заполнена и update не принят
+        """
+        if self._pending.locked():
+            return False
+
+        await self.dispatch(update)
+        return True
+
+    async def join(self) -> None:
+        """
+            Ждет, пока все поставленные в очередь update будут обработаны
+        """
+        await self._idle.wait()
+
+    async def _work(self) -> None:
+        while True:
+            chat_id = await self._ready_chats.get()
+            updates = self._chat_updates[chat_id]
+            update = updates.popleft()
+            try:
+                await self.process_update(update)
+            except Exception:
+                logging.exception("Failed to process update")
+            finally:
+                self._pending.release()
+                if updates:
+                    self._ready_chats.put_nowait(chat_id)
+                else:
+                    del self._chat_updates[chat_id]
+                    if not self._chat_updates:
+                        self._idle.set()
+
+
+@asynccontextmanager
+async def make_update_dispatcher(process_update: Callable[[Update], Awaitable[None]],
+                                 worker_count: int,
+                                 max_pending: int
+                                 ):
+    dispatcher = UpdateDispatcher(process_update, worker_count, max_pending)
+    dispatcher.start()
+    try:
+        yield dispatcher
+    finally:
+        await dispatcher.close()
@@ -0,0 +1,67 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+from core.telegram_api import TelegramApi
+from trivia.telegram_models import Update, UpdatesResponse
+
+
+class UpdatePoller:
+    """
+    Получает update из Telegram через long polling. Следующий запрос getUpdates отправляется сразу, как только пришел
+    ответ на предыдущий, и до того, как полученные update будут переданы в `dispatch`. Поэтому один запрос всегда
+    находится в ожидании, и между пачками update нет пауз. Запрос со следующим offset подтверждает Telegram получение
+    предыдущей пачки
+    """
+    def __init__(self,
+                 telegram_api: TelegramApi,
+                 dispatch: Callable[[Update], Awaitable[None]],
+                 limit: int,
+                 timeout_sec: int,
+                 allowed_updates: Optional[List[str]]
+                 ):
+        """
+        :param telegram_api: api для запросов getUpdates
+        :param dispatch: функция, которая передает update на обработку
+        :param limit: максимальное количество update в одном ответе
+        :param timeout_sec: время ожидания новых update в одном запросе
+        :param allowed_updates: типы update, которые нужно получать
+        """
+        self.telegram_api = telegram_api
+        self.dispatch = dispatch
+        self.limit = limit
+        self.timeout_sec = timeout_sec
+        self.allowed_updates = allowed_updates
+
+    async def run(self, last_update_id: int, max_batches: Optional[int] = None) -> int:
+        """
+            Получает update и передает их в `dispatch`
+        :param last_update_id: идентификатор последнего полученного update
+        :param max_batches: сколько ответов getUpdates обработать. None - работать, пока задачу не отменят
+        :return: идентификатор последнего полученного update
+        """
+        poll = self._poll(last_update_id)
+        batch_count = 0
+        try:
+            while max_batches is None or batch_count < max_batches:
+                update_response = await poll
+                batch_count += 1
+                result = update_response.result
+                if result:
+                    last_update_id = result[-1].update_id
+                if max_batches is None or batch_count < max_batches:
+                    poll = self._poll(last_update_id)
+                    # Отдаем управление, чтобы задача начала запрос. Дальше запрос выполняется параллельно с
+                    # обработкой update: он продолжается, пока dispatch ждет ввода-вывода
+                    await asyncio.sleep(0)
+                for update in result:
+                    await self.dispatch(update)
+        finally:
+            if not poll.done():
+                poll.cancel()
+        return last_update_id
+
+    def _poll(self, last_update_id: int) -> "asyncio.Task[UpdatesResponse]":
+        return asyncio.create_task(self.telegram_api.get_updates(last_update_id + 1,
+                                                                 self.limit,
+                                                                 self.timeout_sec,
+                                                                 self.allowed_updates
+                                                                 ))
@@ -0,0 +1,85 @@
+import logging
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+from core.bot import Bot
+from core.bot_exeption import BotException, NotEnoughQuestionsException
+from core.live_redis_api import RedisException
+from core.update_dispatcher import UpdateDispatcher
+from trivia.telegram_models import Update
+from trivia.update_parser import parse_update
+
+
+def make_webhook_app(bot: Bot,
+                     path: str,
+                     dispatcher: Optional[UpdateDispatcher] = None,
+                     reject_when_full: bool = False,
+                     reply_in_webhook: bool = True,
+                     fast_update_parsing: bool = False,
+                     metrics_path: Optional[str] = None
+                     ) -> FastAPI:
+    """
+        Создает приложение, которое принимает update от Telegram по webhook
+    :param bot: бот
+    :param path: путь, на который Telegram присылает update
+    :param dispatcher: если задан, update ставятся в его очередь и обрабатываются после ответа Telegram
+    :param reject_when_full: отвечать 503, если очередь dispatcher заполнена, вместо ожидания свободного места
+    :param reply_in_webhook: возвращать один из вызовов Telegram Bot API в ответе на webhook
+    :param fast_update_parsing: разбирать тело запроса через parse_update вместо валидации pydantic
+    :param metrics_path: если задан, по этому пути метрики бота отдаются в текстовом формате Prometheus
+    :return: приложение FastAPI
+    """
+    app = FastAPI()
+
+    @app.exception_handler(BotException)
+    async def on_bot_exception(request: Request, exception: BotException):
+        if isinstance(exception, NotEnoughQuestionsException):
+            logging.exception(exception)
+            return PlainTextResponse(str(exception), status_code=503)
+        else:
+            logging.exception(exception)
+            return PlainTextResponse(str(exception), status_code=400)
+
+    @app.exception_handler(RedisException)
+    async def on_lock_chat_exception(request: Request, exception: RedisException):
+        logging.exception(exception)
+        return PlainTextResponse(str(exception), status_code=502)
+
+    @app.exception_handler(RequestValidationError)
+    async def on_invalid_request_exception(request: Request, exception: RequestValidationError):
+        logging.exception(exception)
+        return PlainTextResponse(str(exception), status_code=400)
+
+    async def handle_update(update: Update):
+        if dispatcher is not None:
+            if reject_when_full:
+                if not await dispatcher.try_dispatch(update):
+                    logging.warning("Update %s is rejected: too many pending updates", update.update_id)
+                    return PlainTextResponse("Too many pending updates", status_code=503)
+            else:
+                await dispatcher.dispatch(update)
+        elif reply_in_webhook:
+            webhook_reply = await bot.process_webhook_update(update)
+            if webhook_reply is not None:
+                return JSONResponse(webhook_reply)
+        else:
+            await bot.process_update(update)
+        return None
+
+    if fast_update_parsing:
+        @app.post(path)
+        async def on_raw_update(request: Request):
+            return await handle_update(parse_update(await request.body()))
+    else:
+        @app.post(path)
+        async def on_update(update: Update):
+            return await handle_update(update)
+
+    if metrics_path is not None:
+        @app.get(metrics_path)
+        async def on_metrics():
+            return Response(bot.metrics.generate(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    return app
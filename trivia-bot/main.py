@@ -1,27 +1,32 @@
 from uvicorn import Config, Server  # type: ignore
 from core.bot import Bot
 from core.live_telegram_api import make_live_telegram_api
+from core.rate_limited_telegram_api import make_rate_limited_telegram_api
 from core.telegram_api import TelegramApi
 from trivia.bot_state import BotStateFactory, GreetingState
 from trivia.question_storage import JsonQuestionStorage
 from core.random import RandomImpl
 from trivia.bijection import BotStateToDictBijection
 import argparse
-from fastapi import FastAPI, Request
-from trivia.telegram_models import Update
+from fastapi import FastAPI
 import asyncio
 import os
-from core.live_redis_api import make_live_redis_api, DoNothingRedisApi, RedisException
+from core.live_redis_api import make_live_redis_api
 from trivia.bot_config import BotConfig
 import json
 import logging
 from pathlib import Path
 from typing import Any, Optional
-from fastapi.exceptions import RequestValidationError
-from fastapi.responses import PlainTextResponse
 from core.chat_state_storage import DictChatStateStorage, RedisChatStateStorage
-from core.bot_exeption import BotException, NotEnoughQuestionsException
+from core.state_cache import StateCache
+from core.update_dispatcher import make_update_dispatcher
+from core.update_poller import UpdatePoller
+from core.update_deduplicator import UpdateDeduplicator, InMemoryUpdateDeduplicator, RedisUpdateDeduplicator
+from trivia.state_codec import make_state_codec
+from core.webhook_app import make_webhook_app
 from core.utils import get_sha256_hash
+from core.metrics import BotMetrics
+from core.logging_pipeline import make_logging_pipeline
 
 
 async def main():
@@ -47,35 +52,35 @@ async def main():
         else:
             file_name = None
 
-        logging.basicConfig(filename=file_name,
-                            format='%(asctime)s - %(message)s',
-                            datefmt='%d-%b-%y %H:%M:%S',
-                            level=logging.INFO
-                            )
-
-        logging.info("Starting bot")
-
-        token = os.environ["BOT_TOKEN"]
-        last_update_id = 0
-        storage = JsonQuestionStorage(config.questions_filepath)
-        random = RandomImpl()
-        state_factory = BotStateFactory(storage, random, config.game_config)
-        bot_state_to_dict_bijection = BotStateToDictBijection(state_factory)
-        async with make_live_telegram_api(token) as telegram_api:
-            if config.is_server:
-                await run_server(config,
-                                 telegram_api,
-                                 state_factory,
-                                 bot_state_to_dict_bijection,
-                                 args.server_url,
-                                 token
-                                 )
-            else:
-                await run_client(telegram_api,
-                                 state_factory,
-                                 bot_state_to_dict_bijection,
-                                 last_update_id
-                                 )
+        with make_logging_pipeline(file_name, config.logging):
+            logging.info("Starting bot")
+
+            token = os.environ["BOT_TOKEN"]
+            last_update_id = 0
+            storage = JsonQuestionStorage(config.questions_filepath)
+            random = RandomImpl()
+            state_factory = BotStateFactory(storage, random, config.game_config)
+            bot_state_to_dict_bijection = BotStateToDictBijection(state_factory)
+            metrics = BotMetrics()
+            async with make_live_telegram_api(token, config.telegram_http, metrics) as live_telegram_api, \
+                    make_rate_limited_telegram_api(live_telegram_api, config.telegram_rate_limit) as telegram_api:
+                if config.is_server:
+                    await run_server(config,
+                                     telegram_api,
+                                     state_factory,
+                                     bot_state_to_dict_bijection,
+                                     args.server_url,
+                                     token,
+                                     metrics
+                                     )
+                else:
+                    await run_client(config,
+                                     telegram_api,
+                                     state_factory,
+                                     bot_state_to_dict_bijection,
+                                     last_update_id,
+                                     metrics
+                                     )
 
 
 async def run_server(config: BotConfig,
@@ -83,84 +88,109 @@ async def run_server(config: BotConfig,
                      state_factory: BotStateFactory,
                      bot_state_to_dict_bijection: BotStateToDictBijection,
                      server_url: Optional[str],
-                     token: str
+                     token: str,
+                     metrics: BotMetrics
                      ):
-    with make_live_redis_api(config.redis) as redis_api:
-        chat_state_storage = RedisChatStateStorage(redis_api, bot_state_to_dict_bijection)
+    async with make_live_redis_api(config.redis, metrics) as redis_api:
+        state_cache = StateCache(config.state_cache.max_size, config.state_cache.ttl_sec)
+        chat_state_storage = RedisChatStateStorage(redis_api,
+                                                   bot_state_to_dict_bijection,
+                                                   state_cache,
+                                                   make_state_codec(config.state_codec),
+                                                   metrics
+                                                   )
         # Хешируем токен, чтобы он не выводился при логирования информации о работе приложения. Токен используется
         # в url, для проверки, что нас вызывает Telegram
         hashed_token = get_sha256_hash(token)
+        update_deduplicator: Optional[UpdateDeduplicator] = None
+        if config.deduplication.enabled:
+            if config.deduplication.storage == "redis":
+                update_deduplicator = RedisUpdateDeduplicator(redis_api, config.deduplication.ttl_sec)
+            else:
+                update_deduplicator = InMemoryUpdateDeduplicator(config.deduplication.window_size)
         bot = Bot(telegram_api,
-                  redis_api,
                   lambda: GreetingState(state_factory),
                   bot_state_to_dict_bijection,
-                  chat_state_storage
+                  chat_state_storage,
+                  update_deduplicator,
+                  metrics,
+                  reply_messages_in_webhook=not config.telegram_rate_limit.enabled
                   )
 
         base_server_url = next(filter(None, [server_url, os.environ["SERVER_URL"], config.server.url]))
         opt_cert_path = Path(config.server.cert) if config.server.cert else None
         await telegram_api.set_webhook(f"{base_server_url}/{hashed_token}", opt_cert_path)
 
-        app = FastAPI()
-
-        @app.exception_handler(BotException)
-        async def on_bot_exception(request: Request, exception: BotException):
-            if isinstance(exception, NotEnoughQuestionsException):
-                logging.exception(exception)
-                return PlainTextResponse(str(exception), status_code=503)
-            else:
-                logging.exception(exception)
-                return PlainTextResponse(str(exception), status_code=400)
-
-        @app.exception_handler(RedisException)
-        async def on_lock_chat_exception(request: Request, exception: RedisException):
-            logging.exception(exception)
-            return PlainTextResponse(str(exception), status_code=502)
-
-        @app.exception_handler(RequestValidationError)
-        async def on_invalid_request_exception(request: Request, exception: RequestValidationError):
-            logging.exception(exception)
-            return PlainTextResponse(str(exception), status_code=400)
-
-        @app.post(f"/{hashed_token}")
-        async def on_update(update: Update):
-            await bot.process_update(update)
-
-        conf = Config(app=app,
-                      host=config.server.host,
-                      port=config.server.port,
-                      loop=asyncio.get_running_loop()
-                      )
-        if config.server.key:
-            conf.ssl_keyfile = config.server.key
-            conf.ssl_certfile = config.server.cert
+        path = f"/{hashed_token}"
+        if config.server.process_in_background:
+            async with make_update_dispatcher(bot.process_update,
+                                              config.dispatcher.worker_count,
+                                              config.dispatcher.max_pending_updates
+                                              ) as dispatcher:
+                app = make_webhook_app(bot,
+                                       path,
+                                       dispatcher,
+                                       config.dispatcher.queue_full_policy == "reject",
+                                       fast_update_parsing=config.server.fast_update_parsing,
+                                       metrics_path=config.server.metrics_path
+                                       )
+                await serve(config, app)
+                # Telegram уже получил ответ на принятые update, поэтому дообрабатываем их перед остановкой
+                await dispatcher.join()
+        else:
+            app = make_webhook_app(bot,
+                                   path,
+                                   reply_in_webhook=config.server.reply_in_webhook,
+                                   fast_update_parsing=config.server.fast_update_parsing,
+                                   metrics_path=config.server.metrics_path
+                                   )
+            await serve(config, app)
+
+
+async def serve(config: BotConfig, app: FastAPI):
+    conf = Config(app=app,
+                  host=config.server.host,
+                  port=config.server.port,
+                  loop=asyncio.get_running_loop()
+                  )
+    if config.server.key:
+        conf.ssl_keyfile = config.server.key
+        conf.ssl_certfile = config.server.cert
 
-        server = Server(conf)
-        await server.serve()
+    server = Server(conf)
+    await server.serve()
 
 
-async def run_client(telegram_api: Any,
+async def run_client(config: BotConfig,
+                     telegram_api: Any,
                      state_factory: BotStateFactory,
                      bot_state_to_dict_bijection: BotStateToDictBijection,
-                     last_update_id: int
+                     last_update_id: int,
+                     metrics: BotMetrics
                      ):
     chat_state_storage = DictChatStateStorage()
+    update_deduplicator: Optional[UpdateDeduplicator] = None
+    if config.deduplication.enabled:
+        update_deduplicator = InMemoryUpdateDeduplicator(config.deduplication.window_size)
     bot = Bot(telegram_api,
-              DoNothingRedisApi(),
               lambda: GreetingState(state_factory),
               bot_state_to_dict_bijection,
-              chat_state_storage
+              chat_state_storage,
+              update_deduplicator,
+              metrics
               )
     await telegram_api.delete_webhook(True)
-    while True:
-        update_response = await telegram_api.get_updates(last_update_id + 1)
-        result = update_response.result
-        for update in result:
-            last_update_id = update.update_id
-            try:
-                await bot.process_update(update)
-            except Exception:
-                logging.exception("Failed to process update")
+    async with make_update_dispatcher(bot.process_update,
+                                      config.dispatcher.worker_count,
+                                      config.dispatcher.max_pending_updates
+                                      ) as dispatcher:
+        poller = UpdatePoller(telegram_api,
+                              dispatcher.dispatch,
+                              config.client.poll_limit,
+                              config.client.poll_timeout_sec,
+                              config.client.allowed_updates
+                              )
+        await poller.run(last_update_id)
 
 
 def get_log_filename(directory: str) -> str:
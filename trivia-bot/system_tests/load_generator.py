@@ -0,0 +1,210 @@
+"""
+Нагрузочный тест бота, запущенного в режиме сервера. Имитирует `-chats` чатов, каждый из которых играет `-games`
+полных игр: приветствие, /start, ответы на вопросы кнопками до конца игры. Update отправляются на webhook бота,
+одновременно выполняется не больше `-concurrency` запросов. Чаты начинают играть сразу (`-ramp none`), равномерно
+в течение `-ramp_sec` секунд (`-ramp linear`) или `-ramp_steps` группами (`-ramp step`).
+
+Вместо Telegram бот должен вызывать локальный TelegramServer, который запускает нагрузочный тест на порту
+`-telegram_port`: в настройках бота нужно указать `"telegram_http": {"base_url": "http://localhost:8081"}`. Сервер
+отвечает с задержкой `-telegram_latency_ms` и на долю вызовов `-too_many_requests_probability` отвечает 429. Из вызовов
+бота и из ответов на webhook тест узнает клавиатуры, которые бот отправил в каждый чат, и нажимает на их кнопки.
+
+В конце выводятся количество ответов webhook по статусам, гистограмма и перцентили задержки webhook по типам update.
+Запуск из директории trivia-bot, например:
+python -m system_tests.load_generator -url http://localhost:8000 -token $BOT_TOKEN -chats 200 -concurrency 50
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+import aiohttp
+from core.utils import JsonDict, get_sha256_hash
+from benchmarks.bench_game_throughput import make_message_update, make_callback_query_update, percentile
+from system_tests.telegram_server import TelegramCall, make_telegram_server
+
+
+# Верхние границы интервалов гистограммы задержки в миллисекундах
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class ChatInbox:
+    """
+    Сообщения, которые бот отправил в чат: последняя клавиатура и признак окончания игры
+    """
+    def __init__(self):
+        self.keyboard: Optional[List[str]] = None
+        self.game_over = False
+        self.changed = asyncio.Event()
+
+    def on_call(self, body: JsonDict) -> None:
+        """
+            Обрабатывает вызов sendMessage или editMessageText
+        :param body: параметры вызова
+        """
+        reply_markup = body.get("reply_markup")
+        if reply_markup is not None:
+            self.keyboard = [button["callback_data"] for row in reply_markup["inline_keyboard"] for button in row]
+        elif "/start" in body.get("text", ""):
+            # Сообщение об окончании игры предлагает начать новую игру командой /start
+            self.game_over = True
+        self.changed.set()
+
+    async def wait(self, timeout_sec: float) -> bool:
+        """
+            Ждет следующего вызова для этого чата
+        :return: False, если вызова не было `timeout_sec` секунд
+        """
+        self.changed.clear()
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout_sec)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.webhook_url = f"{args.url}/{get_sha256_hash(args.token)}"
+        self.inboxes: Dict[int, ChatInbox] = defaultdict(ChatInbox)
+        self.statuses: Counter = Counter()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.games = 0
+        self.next_update_id = args.first_update_id
+        self.rng = random.Random(args.seed)
+        # Создается в run: до Python 3.10 Semaphore привязывается к event loop, текущему при создании
+        self.requests: asyncio.Semaphore
+
+    def on_telegram_call(self, call: TelegramCall) -> None:
+        if call.method in ("sendMessage", "editMessageText"):
+            self.inboxes[call.body["chat_id"]].on_call(call.body)
+
+    async def send(self, session: aiohttp.ClientSession, update_type: str, update: JsonDict) -> None:
+        async with self.requests:
+            start = time.perf_counter()
+            try:
+                async with session.post(self.webhook_url, json=update) as response:
+                    body = await response.read()
+                    status = str(response.status)
+                    is_json = response.content_type == "application/json"
+            except asyncio.TimeoutError:
+                self.statuses["timeout"] += 1
+                return
+            except aiohttp.ClientError as e:
+                self.statuses[type(e).__name__] += 1
+                return
+            self.latencies[update_type].append(time.perf_counter() - start)
+            self.statuses[status] += 1
+
+        if is_json and body and body != b"null":
+            reply = json.loads(body)
+            if isinstance(reply, dict) and reply.get("method") in ("sendMessage", "editMessageText"):
+                self.inboxes[reply["chat_id"]].on_call(reply)
+
+    def make_update_id(self) -> int:
+        self.next_update_id += 1
+        return self.next_update_id
+
+    async def play_games(self, session: aiohttp.ClientSession, chat_id: int, start_delay_sec: float) -> None:
+        await asyncio.sleep(start_delay_sec)
+        inbox = self.inboxes[chat_id]
+        timeout_sec = self.args.reply_timeout_sec
+        await self.send(session, "message", make_message_update(self.make_update_id(), chat_id, "Привет"))
+        for _ in range(self.args.games):
+            inbox.keyboard = None
+            inbox.game_over = False
+            await self.send(session, "command", make_message_update(self.make_update_id(), chat_id, "/start"))
+            while inbox.keyboard is None:
+                if not await inbox.wait(timeout_sec):
+                    self.statuses["no reply"] += 1
+                    return
+
+            while not inbox.game_over:
+                keyboard = inbox.keyboard
+                data = self.rng.choice(keyboard)
+                await self.send(session, "callback_query",
+                                make_callback_query_update(self.make_update_id(), chat_id, data))
+                while inbox.keyboard is keyboard and not inbox.game_over:
+                    if not await inbox.wait(timeout_sec):
+                        self.statuses["no reply"] += 1
+                        return
+            self.games += 1
+
+    def start_delay(self, index: int) -> float:
+        if self.args.ramp == "linear":
+            return self.args.ramp_sec * index / self.args.chats
+        if self.args.ramp == "step":
+            step = index * self.args.ramp_steps // self.args.chats
+            return self.args.ramp_sec * step / self.args.ramp_steps
+        return 0
+
+    async def run(self) -> None:
+        async with make_telegram_server("localhost",
+                                        self.args.telegram_port,
+                                        latency_sec=self.args.telegram_latency_ms / 1000,
+                                        too_many_requests_probability=self.args.too_many_requests_probability,
+                                        record_calls=False,
+                                        on_call=self.on_telegram_call,
+                                        seed=self.args.seed
+                                        ) as telegram_server:
+            self.requests = asyncio.Semaphore(self.args.concurrency)
+            connector = aiohttp.TCPConnector(limit=self.args.concurrency)
+            timeout = aiohttp.ClientTimeout(total=self.args.request_timeout_sec)
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                start = time.perf_counter()
+                await asyncio.gather(*[
+                    self.play_games(session, self.args.first_chat_id + index, self.start_delay(index))
+                    for index in range(self.args.chats)
+                ])
+                elapsed = time.perf_counter() - start
+        self.report(elapsed, telegram_server.call_counts, telegram_server.too_many_requests_counts)
+
+    def report(self, elapsed: float, telegram_calls: Counter, too_many_requests: Counter) -> None:
+        request_count = sum(len(values) for values in self.latencies.values())
+        print(f"chats: {self.args.chats}, games: {self.games}, time: {elapsed:.2f} s, "
+              f"requests/s: {request_count / elapsed:.0f}, games/s: {self.games / elapsed:.1f}")
+        print(f"webhook responses: {dict(sorted(self.statuses.items()))}")
+        print(f"telegram calls: {dict(telegram_calls)}, 429: {dict(too_many_requests)}")
+        for update_type, latencies in self.latencies.items():
+            latencies.sort()
+            print(f"\n{update_type}: {len(latencies)} requests, p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+                  f"p95 {percentile(latencies, 95) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms")
+            histogram = Counter(bisect.bisect_left(HISTOGRAM_BOUNDS_MS, latency * 1000) for latency in latencies)
+            for index, bound in enumerate(HISTOGRAM_BOUNDS_MS + [None]):
+                label = f"<= {bound} ms" if bound is not None else f"> {HISTOGRAM_BOUNDS_MS[-1]} ms"
+                count = histogram.get(index, 0)
+                bar = "#" * round(50 * count / len(latencies))
+                print(f"{label:>12} {count:>8} {bar}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook бота")
+    parser.add_argument("-url", default="http://localhost:8000", help="Адрес сервера бота")
+    parser.add_argument("-token", required=True, help="Токен бота, из которого сервер получает путь webhook")
+    parser.add_argument("-chats", type=int, default=100, help="Количество чатов")
+    parser.add_argument("-games", type=int, default=1, help="Количество игр в каждом чате")
+    parser.add_argument("-concurrency", type=int, default=20, help="Сколько запросов к webhook выполняется сразу")
+    parser.add_argument("-ramp", choices=["none", "linear", "step"], default="none", help="Как чаты начинают играть")
+    parser.add_argument("-ramp_sec", type=float, default=10, help="За сколько секунд все чаты начинают играть")
+    parser.add_argument("-ramp_steps", type=int, default=5, help="Количество групп чатов для -ramp step")
+    parser.add_argument("-telegram_port", type=int, default=8081, help="Порт локального сервера вместо Telegram")
+    parser.add_argument("-telegram_latency_ms", type=float, default=0, help="Задержка ответа локального Telegram")
+    parser.add_argument("-too_many_requests_probability", type=float, default=0,
+                        help="Доля вызовов, на которые локальный Telegram отвечает 429")
+    parser.add_argument("-reply_timeout_sec", type=float, default=10, help="Сколько ждать ответа бота в чат")
+    parser.add_argument("-request_timeout_sec", type=float, default=30, help="Таймаут запроса к webhook")
+    parser.add_argument("-first_chat_id", type=int, default=1_000_000, help="Идентификатор первого чата")
+    parser.add_argument("-first_update_id", type=int, default=int(time.time() * 1000),
+                        help="Идентификатор первого update. По умолчанию зависит от времени, чтобы update разных "
+                             "запусков не считались повторными")
+    parser.add_argument("-seed", type=int, default=0, help="Начальное значение генератора нажатий кнопок")
+    args = parser.parse_args()
+    asyncio.run(LoadGenerator(args).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Локальный сервер, который отвечает на вызовы Telegram Bot API вместо api.telegram.org. С ним бот, тесты и нагрузочный
+тест работают без доступа к Telegram: в настройках бота нужно указать
+`"telegram_http": {"base_url": "http://localhost:8081"}`.
+
+Сервер поддерживает методы getUpdates, sendMessage, editMessageText, answerCallbackQuery, setWebhook и deleteWebhook,
+добавляет к каждому ответу задержку `-latency_ms`, отвечает 429 с `retry_after` на долю вызовов
+`-too_many_requests_probability` и считает вызовы по методам. Запуск из директории trivia-bot, например:
+python -m system_tests.telegram_server -port 8081 -latency_ms 50 -too_many_requests_probability 0.01
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+from aiohttp import web
+from core.utils import JsonDict
+
+
+@dataclass
+class TelegramCall:
+    """
+    Вызов Telegram Bot API, который получил сервер
+    """
+    token: str
+    method: str
+    body: JsonDict
+
+
+class TelegramServer:
+    """
+    Сервер Telegram Bot API в памяти. Update для getUpdates добавляются через add_update. Пока задан webhook,
+    getUpdates отвечает 409, как Telegram
+    """
+    METHODS = ["getUpdates", "sendMessage", "editMessageText", "answerCallbackQuery", "setWebhook", "deleteWebhook"]
+
+    def __init__(self,
+                 latency_sec: float = 0,
+                 too_many_requests_probability: float = 0,
+                 retry_after: int = 1,
+                 record_calls: bool = True,
+                 on_call: Optional[Callable[[TelegramCall], None]] = None,
+                 seed: int = 0
+                 ):
+        """
+        :param latency_sec: через сколько секунд сервер отвечает на вызов
+        :param too_many_requests_probability: доля вызовов, на которые сервер отвечает 429
+        :param retry_after: через сколько секунд Telegram разрешает повторить вызов после ответа 429
+        :param record_calls: сохранять ли все вызовы в `calls`. При долгой нагрузке достаточно `call_counts`
+        :param on_call: вызывается для каждого успешного вызова
+        :param seed: начальное значение генератора ответов 429
+        """
+        self.latency_sec = latency_sec
+        self.too_many_requests_probability = too_many_requests_probability
+        self.retry_after = retry_after
+        self.record_calls = record_calls
+        self.on_call = on_call
+        self.calls: List[TelegramCall] = []
+        self.call_counts: Counter = Counter()
+        self.too_many_requests_counts: Counter = Counter()
+        self.webhook_url: Optional[str] = None
+        self._rng = random.Random(seed)
+        self._forced_too_many_requests = 0
+        self._updates: List[JsonDict] = []
+        self._updates_added = asyncio.Event()
+        self._next_message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._on_method)
+        return app
+
+    async def start(self, host: str = "localhost", port: int = 8081) -> None:
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def add_update(self, update: JsonDict) -> None:
+        """
+            Добавляет update, который бот получит через getUpdates
+        """
+        self._updates.append(update)
+        self._updates_added.set()
+
+    def reject_next_calls(self, count: int) -> None:
+        """
+            Отвечает 429 на следующие `count` вызовов
+        """
+        self._forced_too_many_requests += count
+
+    def calls_of(self, method: str) -> List[TelegramCall]:
+        return [call for call in self.calls if call.method == method]
+
+    async def _on_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if method not in self.METHODS:
+            return _error(404, "Not Found")
+
+        if request.content_type == "application/json":
+            body = await request.json()
+        else:
+            body = {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+
+        if self.latency_sec > 0:
+            await asyncio.sleep(self.latency_sec)
+
+        if self._is_too_many_requests():
+            self.too_many_requests_counts[method] += 1
+            return _error(429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after)
+
+        call = TelegramCall(request.match_info["token"], method, body)
+        self.call_counts[method] += 1
+        if self.record_calls:
+            self.calls.append(call)
+        if self.on_call is not None:
+            self.on_call(call)
+
+        if method == "getUpdates":
+            return await self._get_updates(body)
+        if method in ("sendMessage", "editMessageText"):
+            return _ok(self._make_message(body))
+        if method == "setWebhook":
+            self.webhook_url = body.get("url") or None
+        elif method == "deleteWebhook":
+            self.webhook_url = None
+            if body.get("drop_pending_updates"):
+                self._updates.clear()
+        return _ok(True)
+
+    def _is_too_many_requests(self) -> bool:
+        if self._forced_too_many_requests > 0:
+            self._forced_too_many_requests -= 1
+            return True
+        return self.too_many_requests_probability > 0 and self._rng.random() < self.too_many_requests_probability
+
+    async def _get_updates(self, body: JsonDict) -> web.Response:
+        """
+            Отвечает update с номером не меньше `offset`. Если таких update нет, ждет их до `timeout` секунд
+        """
+        if self.webhook_url is not None:
+            return _error(409, "Conflict: can't use getUpdates method while webhook is active")
+
+        offset = body.get("offset", 0)
+        limit = body.get("limit", 100)
+        # Как в Telegram, offset подтверждает все update с меньшими номерами
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and body.get("timeout", 0) > 0:
+            self._updates_added.clear()
+            try:
+                await asyncio.wait_for(self._updates_added.wait(), body["timeout"])
+            except asyncio.TimeoutError:
+                pass
+        return _ok(self._updates[:limit])
+
+    def _make_message(self, body: JsonDict) -> JsonDict:
+        if "message_id" in body:
+            message_id = body["message_id"]
+        else:
+            self._next_message_id += 1
+            message_id = self._next_message_id
+        return {
+            "message_id": message_id,
+            "chat": {"id": body["chat_id"], "type": "private"},
+            "date": int(time.time()),
+            "text": body.get("text", "")
+        }
+
+
+def _ok(result) -> web.Response:
+    return web.json_response({"ok": True, "result": result})
+
+
+def _error(status: int, description: str, retry_after: Optional[int] = None) -> web.Response:
+    body: JsonDict = {"ok": False, "error_code": status, "description": description}
+    if retry_after is not None:
+        body["parameters"] = {"retry_after": retry_after}
+    return web.json_response(body, status=status)
+
+
+@asynccontextmanager
+async def make_telegram_server(host: str = "localhost", port: int = 8081, **kwargs):
+    server = TelegramServer(**kwargs)
+    await server.start(host, port)
+    try:
+        yield server
+    finally:
+        await server.close()
+
+
+async def run(args) -> None:
+    async with make_telegram_server(args.host,
+                                    args.port,
+                                    latency_sec=args.latency_ms / 1000,
+                                    too_many_requests_probability=args.too_many_requests_probability,
+                                    retry_after=args.retry_after,
+                                    record_calls=False
+                                    ) as server:
+        print(f"Telegram Bot API stand-in is listening on http://{args.host}:{args.port}")
+        while True:
+            await asyncio.sleep(args.report_interval_sec)
+            print(f"calls: {dict(server.call_counts)}, 429: {dict(server.too_many_requests_counts)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер вместо Telegram Bot API")
+    parser.add_argument("-host", default="localhost", help="Адрес, на котором слушает сервер")
+    parser.add_argument("-port", type=int, default=8081, help="Порт сервера")
+    parser.add_argument("-latency_ms", type=float, default=0, help="Задержка ответа на каждый вызов")
+    parser.add_argument("-too_many_requests_probability", type=float, default=0,
+                        help="Доля вызовов, на которые сервер отвечает 429")
+    parser.add_argument("-retry_after", type=int, default=1, help="retry_after в ответе 429")
+    parser.add_argument("-report_interval_sec", type=float, default=10, help="Как часто выводить количество вызовов")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
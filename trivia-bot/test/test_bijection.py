@@ -1,11 +1,13 @@
 from unittest import TestCase
-from trivia.bot_state import BotStateFactory, GreetingState, IdleState, InGameState
+from trivia.bot_state import BotStateFactory, GameAbortedState, GreetingState, IdleState, InGameState
 from trivia.question_storage import JsonQuestionStorage
 from test.test_utils import DoNothingRandom
 from trivia.bijection import BotStateToDictBijection
 from trivia.question_storage import Question
 from pathlib import Path
 from trivia.bot_config import GameConfig
+from test.test_utils import ReversedShuffleRandom
+import json
 
 
 TEST_QUESTIONS_PATH = Path("resources/test_questions.json")
@@ -37,6 +39,69 @@ class BijectionTest(TestCase):
         decoded = bijection.backward(encoded)
         self.assertEqual(in_game_state, decoded)
 
+    def test_in_game_state_saves_question_ids(self):
+        state_factory = BotStateFactory(JsonQuestionStorage(TEST_QUESTIONS_PATH),
+                                        ReversedShuffleRandom(),
+                                        GameConfig.make(1, 1, 1)
+                                        )
+        in_game_state = state_factory.create_in_game_state()
+        bijection = BotStateToDictBijection(state_factory)
+        encoded = bijection.forward(in_game_state)
+        bot_state_data = encoded["bot_state_data"]
+        self.assertNotIn("questions", bot_state_data)
+        self.assertEqual(["10", "10", "10"], bot_state_data["answer_orders"])
+        decoded = bijection.backward(encoded)
+        self.assertEqual(in_game_state, decoded)
+
+    def test_question_ids_state_is_smaller(self):
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        in_game_state = state_factory.create_in_game_state()
+        question_ids_data = in_game_state.save()
+        full_data = in_game_state.state.to_dict()
+        self.assertLess(len(json.dumps(question_ids_data)), len(json.dumps(full_data)))
+
+    def test_in_game_state_with_questions_not_from_catalog(self):
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        in_game_state = _make_in_game_state(state_factory)
+        bot_state_data = BotStateToDictBijection(state_factory).forward(in_game_state)["bot_state_data"]
+        self.assertIn("questions", bot_state_data)
+
+    def test_loads_in_game_state_with_full_questions(self):
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        in_game_state = _make_in_game_state(state_factory)
+        encoded = {
+            "is_logging_wrapper": False,
+            "bot_state_type": "InGameState",
+            "bot_state_data": in_game_state.state.to_dict()
+        }
+        decoded = BotStateToDictBijection(state_factory).backward(encoded)
+        self.assertEqual(in_game_state, decoded)
+
+    def test_in_game_state_restore_does_not_create_game(self):
+        state_factory = BotStateFactory(JsonQuestionStorage(TEST_QUESTIONS_PATH),
+                                        DoNothingRandom(),
+                                        GameConfig.make(5, 5, 5)
+                                        )
+        in_game_state = _make_in_game_state(state_factory)
+        bijection = BotStateToDictBijection(state_factory)
+        decoded = bijection.backward(bijection.forward(in_game_state))
+        self.assertEqual(in_game_state, decoded)
+
+    def test_unknown_question_id_ends_game(self):
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        encoded = {
+            "is_logging_wrapper": False,
+            "bot_state_type": "InGameState",
+            "bot_state_data": {
+                "question_ids": ["unknown"],
+                "answer_orders": ["01"],
+                "game_id": GAME_ID,
+                "current_question": 0,
+                "game_score": 0
+            }
+        }
+        self.assertEqual(GameAbortedState(state_factory), BotStateToDictBijection(state_factory).backward(encoded))
+
 
 def _make_state_factory(questions_file_path: Path) -> BotStateFactory:
     storage = JsonQuestionStorage(questions_file_path)
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Optional, List
 from unittest import IsolatedAsyncioTestCase
 from core.bot_state import BotState
@@ -11,15 +12,16 @@ from trivia.bot_state import BotResponse
 from core.utils import dedent_and_strip
 from enum import Enum
 from trivia.bot_state import BotStateFactory
-from test.test_utils import DoNothingRandom
+from test.test_utils import DoNothingRandom, InMemoryRedisApi
 from trivia.question_storage import JsonQuestionStorage, Question
 from trivia.bijection import BotStateToDictBijection
-from trivia.bot_state import InGameState
+from trivia.bot_state import InGameState, GreetingState, IdleState
 from trivia.telegram_models import UpdatesResponse, Update
 from pathlib import Path
-from core.live_redis_api import DoNothingRedisApi
-from core.chat_state_storage import DictChatStateStorage
+from core.chat_state_storage import DictChatStateStorage, RedisChatStateStorage
+from core.update_deduplicator import InMemoryUpdateDeduplicator
 from trivia.bot_config import GameConfig
+from core.metrics import BotMetrics
 
 
 CHAT_ID_1 = 125
@@ -108,6 +110,14 @@ class FakeState(BotState):
         return bot_response
 
 
+class FailingState(FakeState):
+    """
+        Состояние, которое падает при обработке сообщения
+    """
+    def process_message(self, message: Message) -> BotResponse:
+        raise RuntimeError("process_message failed")
+
+
 class FakeTelegramApi(TelegramApi):
     def __init__(self, response_bodies: Optional[List[UpdatesResponse]] = None):
         self.sent_messages: List[str] = []
@@ -118,7 +128,12 @@ class FakeTelegramApi(TelegramApi):
         self.edit_message_is_called = False
         self.current_response_index = 0
 
-    async def get_updates(self, offset: int) -> UpdatesResponse:
+    async def get_updates(self,
+                          offset: int,
+                          limit: int = 100,
+                          timeout: int = 10,
+                          allowed_updates: Optional[List[str]] = None
+                          ) -> UpdatesResponse:
         response = self.response_bodies[self.current_response_index]
         self.current_response_index += 1
         return response
@@ -133,7 +148,13 @@ class FakeTelegramApi(TelegramApi):
     async def answer_callback_query(self, callback_query_id: str) -> None:
         self.answer_callback_query_is_called = True
 
-    async def edit_message(self, chat_id: int, message_id: int, text: str, parse_mode: Optional[str] = None) -> None:
+    async def edit_message(self,
+                           chat_id: int,
+                           message_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
         self.edit_message_is_called = True
 
     async def set_webhook(self, url: str, cert_filepath: Optional[Path] = None) -> None:
@@ -143,6 +164,57 @@ class FakeTelegramApi(TelegramApi):
         pass
 
 
+class FailingTelegramApi(FakeTelegramApi):
+    """
+        Не может отправить ни одно сообщение
+    """
+    def __init__(self):
+        super().__init__()
+        self.send_count = 0
+
+    async def send_message(self,
+                           chat_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        self.send_count += 1
+        raise RuntimeError("send_message failed")
+
+
+class SlowTelegramApi(FakeTelegramApi):
+    """
+        Отправляет каждое сообщение 10 мс
+    """
+    async def send_message(self,
+                           chat_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        await asyncio.sleep(0.01)
+        await super().send_message(chat_id, text, parse_mode, keyboard)
+
+
+class WaitingRedisApi(InMemoryRedisApi):
+    """
+        Mutex ждет освобождения, а не бросает LockException сразу
+    """
+    def __init__(self):
+        super().__init__()
+        self.unlocked = asyncio.Event()
+
+    async def lock(self, key: str) -> str:
+        while key in self.values:
+            self.unlocked.clear()
+            await self.unlocked.wait()
+        return await super().lock(key)
+
+    async def unlock(self, key: str, token: str) -> None:
+        await super().unlock(key, token)
+        self.unlocked.set()
+
+
 class BotTest(IsolatedAsyncioTestCase):
     class CreateInitialState:
         def __init__(self):
@@ -163,10 +235,10 @@ class BotTest(IsolatedAsyncioTestCase):
         state = FakeState("bot message", next_state)
         bot_state_to_dict_bijection = BotStateToDictBijection(_make_state_factory(TEST_QUESTIONS_PATH))
         chat_storage = DictChatStateStorage()
-        bot = Bot(telegram_api, DoNothingRedisApi(), lambda: state, bot_state_to_dict_bijection, chat_storage)
+        bot = Bot(telegram_api, lambda: state, bot_state_to_dict_bijection, chat_storage)
         update = response_body
         await bot.process_update(update)
-        self.assertEqual(BotStateLoggingWrapper(next_state), bot.chat_state_storage.get_state(CHAT_ID_1))
+        self.assertEqual(BotStateLoggingWrapper(next_state), await bot.chat_state_storage.get_state(CHAT_ID_1))
         self.assertTrue(next_state.on_enter_is_called)
         self.assertEqual(["bot message", "text message on_enter"], telegram_api.sent_messages)
         if update_type == UpdateType.MESSAGE:
@@ -195,9 +267,9 @@ class BotTest(IsolatedAsyncioTestCase):
         state = FakeState("bot message")
         bot_state_to_dict_bijection = BotStateToDictBijection(_make_state_factory(TEST_QUESTIONS_PATH))
         chat_storage = DictChatStateStorage()
-        bot = Bot(telegram_api, DoNothingRedisApi(), lambda: state, bot_state_to_dict_bijection, chat_storage)
+        bot = Bot(telegram_api, lambda: state, bot_state_to_dict_bijection, chat_storage)
         await bot.process_update(update)
-        self.assertEqual(state, bot.chat_state_storage.get_state(CHAT_ID_1))
+        self.assertEqual(state, await bot.chat_state_storage.get_state(CHAT_ID_1))
         self.assertEqual(["bot message"], telegram_api.sent_messages)
         if is_command:
             self.assertTrue(state.process_command_is_called)
@@ -221,7 +293,7 @@ class BotTest(IsolatedAsyncioTestCase):
         telegram_api = FakeTelegramApi()
         bot_state_to_dict_bijection = BotStateToDictBijection(_make_state_factory(TEST_QUESTIONS_PATH))
         chat_storage = DictChatStateStorage()
-        bot = Bot(telegram_api, DoNothingRedisApi(), create_initial_state, bot_state_to_dict_bijection, chat_storage)
+        bot = Bot(telegram_api, create_initial_state, bot_state_to_dict_bijection, chat_storage)
         await bot.process_update(update1)
         await bot.process_update(update2)
 
@@ -230,6 +302,183 @@ class BotTest(IsolatedAsyncioTestCase):
                     }
         self.assertEqual(expected, bot.chat_state_storage.chat_states)
 
+    async def test_last_message_is_returned_in_webhook_reply(self):
+        telegram_api = FakeTelegramApi()
+        next_state = NewFakeState()
+        state = FakeState("bot message", next_state)
+        bot_state_to_dict_bijection = BotStateToDictBijection(_make_state_factory(TEST_QUESTIONS_PATH))
+        bot = Bot(telegram_api, lambda: state, bot_state_to_dict_bijection, DictChatStateStorage())
+        webhook_reply = await bot.process_webhook_update(make_message_update("1", CHAT_ID_1))
+        self.assertEqual(["bot message"], telegram_api.sent_messages)
+        self.assertEqual({"method": "sendMessage", "chat_id": CHAT_ID_1, "text": "text message on_enter"},
+                         webhook_reply
+                         )
+
+    async def test_message_is_not_returned_in_webhook_reply_if_disabled(self):
+        telegram_api = FakeTelegramApi()
+        state = FakeState("bot message", NewFakeState())
+        bot_state_to_dict_bijection = BotStateToDictBijection(_make_state_factory(TEST_QUESTIONS_PATH))
+        bot = Bot(telegram_api,
+                  lambda: state,
+                  bot_state_to_dict_bijection,
+                  DictChatStateStorage(),
+                  reply_messages_in_webhook=False
+                  )
+        webhook_reply = await bot.process_webhook_update(make_message_update("1", CHAT_ID_1))
+        self.assertEqual(["bot message", "text message on_enter"], telegram_api.sent_messages)
+        self.assertIsNone(webhook_reply)
+
+    async def test_callback_query_answer_is_returned_in_webhook_reply(self):
+        telegram_api = FakeTelegramApi()
+        state = FakeState("bot message")
+        bot_state_to_dict_bijection = BotStateToDictBijection(_make_state_factory(TEST_QUESTIONS_PATH))
+        bot = Bot(telegram_api, lambda: state, bot_state_to_dict_bijection, DictChatStateStorage())
+        update = make_callback_query_update("2", CHAT_ID_1)
+        webhook_reply = await bot.process_webhook_update(update)
+        self.assertEqual(["bot message"], telegram_api.sent_messages)
+        self.assertFalse(telegram_api.answer_callback_query_is_called)
+        self.assertEqual({"method": "answerCallbackQuery", "callback_query_id": update.callback_query.id},
+                         webhook_reply
+                         )
+
+    async def test_duplicate_update_is_skipped(self):
+        redis_api = InMemoryRedisApi()
+        telegram_api = FakeTelegramApi()
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        bot_state_to_dict_bijection = BotStateToDictBijection(state_factory)
+        chat_storage = RedisChatStateStorage(redis_api, bot_state_to_dict_bijection)
+        bot = Bot(telegram_api,
+                  lambda: GreetingState(state_factory),
+                  bot_state_to_dict_bijection,
+                  chat_storage,
+                  InMemoryUpdateDeduplicator(10)
+                  )
+        update = make_message_update("hi", CHAT_ID_1)
+        await bot.process_update(update)
+        await bot.process_update(update)
+        self.assertEqual(1, redis_api.lock_count)
+        self.assertEqual(1, len(telegram_api.sent_messages))
+
+    async def test_failed_update_is_processed_again(self):
+        telegram_api = FakeTelegramApi()
+        state = FailingState("bot message")
+        bot_state_to_dict_bijection = BotStateToDictBijection(_make_state_factory(TEST_QUESTIONS_PATH))
+        bot = Bot(telegram_api,
+                  lambda: state,
+                  bot_state_to_dict_bijection,
+                  DictChatStateStorage(),
+                  InMemoryUpdateDeduplicator(10)
+                  )
+        update = make_message_update("hi", CHAT_ID_1)
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                await bot.process_update(update)
+
+    async def test_update_is_not_processed_again_after_failed_send(self):
+        telegram_api = FailingTelegramApi()
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        bot = Bot(telegram_api,
+                  lambda: GreetingState(state_factory),
+                  BotStateToDictBijection(state_factory),
+                  DictChatStateStorage(),
+                  InMemoryUpdateDeduplicator(10)
+                  )
+        update = make_message_update("hi", CHAT_ID_1)
+        with self.assertRaises(RuntimeError):
+            await bot.process_update(update)
+        await bot.process_update(update)
+        self.assertEqual(1, telegram_api.send_count)
+
+    async def test_lock_is_released(self):
+        redis_api = InMemoryRedisApi()
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        bot_state_to_dict_bijection = BotStateToDictBijection(state_factory)
+        chat_storage = RedisChatStateStorage(redis_api, bot_state_to_dict_bijection)
+        bot = Bot(FakeTelegramApi(), lambda: GreetingState(state_factory), bot_state_to_dict_bijection, chat_storage)
+        await bot.process_update(make_message_update("hi", CHAT_ID_1))
+        self.assertEqual(1, redis_api.lock_count)
+        self.assertEqual([f"state_{CHAT_ID_1}", f"version_{CHAT_ID_1}"], list(redis_api.values.keys()))
+        self.assertEqual(BotStateLoggingWrapper(IdleState(state_factory)), await chat_storage.get_state(CHAT_ID_1))
+
+    async def test_updates_of_one_chat_are_answered_in_order(self):
+        redis_api = WaitingRedisApi()
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        bot_state_to_dict_bijection = BotStateToDictBijection(state_factory)
+        chat_storage = RedisChatStateStorage(redis_api, bot_state_to_dict_bijection)
+        telegram_api = SlowTelegramApi()
+        bot = Bot(telegram_api, lambda: IdleState(state_factory), bot_state_to_dict_bijection, chat_storage)
+        await asyncio.gather(bot.process_update(make_message_update("/start", CHAT_ID_1)),
+                             bot.process_update(make_message_update("/stop", CHAT_ID_1))
+                             )
+        self.assertEqual(["<i>Игра начинается</i>", "7+3", "<i>Игра окончена.</i>"],
+                         [text.split("<b>")[-1].split("</b>")[0] for text in telegram_api.sent_messages]
+                         )
+
+    async def test_unchanged_state_is_not_saved(self):
+        redis_api = InMemoryRedisApi()
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        bot_state_to_dict_bijection = BotStateToDictBijection(state_factory)
+        chat_storage = RedisChatStateStorage(redis_api, bot_state_to_dict_bijection)
+        bot = Bot(FakeTelegramApi(), lambda: GreetingState(state_factory), bot_state_to_dict_bijection, chat_storage)
+        await bot.process_update(make_message_update("hi", CHAT_ID_1))
+        set_count = redis_api.set_count
+        await bot.process_update(make_message_update("hi", CHAT_ID_1))
+        await bot.process_update(make_message_update("/help", CHAT_ID_1))
+        self.assertEqual(set_count, redis_api.set_count)
+        self.assertEqual(3, redis_api.lock_count)
+        self.assertEqual(b"1", redis_api.values[f"version_{CHAT_ID_1}"])
+
+    async def test_lock_is_released_on_exception(self):
+        redis_api = InMemoryRedisApi()
+        state = FailingState("bot message")
+        bot_state_to_dict_bijection = BotStateToDictBijection(_make_state_factory(TEST_QUESTIONS_PATH))
+        chat_storage = RedisChatStateStorage(redis_api, bot_state_to_dict_bijection)
+        bot = Bot(FakeTelegramApi(), lambda: state, bot_state_to_dict_bijection, chat_storage)
+        with self.assertRaises(RuntimeError):
+            await bot.process_update(make_message_update("hi", CHAT_ID_1))
+        self.assertEqual({}, redis_api.values)
+
+    async def test_stage_metrics(self):
+        redis_api = InMemoryRedisApi()
+        state_factory = _make_state_factory(TEST_QUESTIONS_PATH)
+        bot_state_to_dict_bijection = BotStateToDictBijection(state_factory)
+        metrics = BotMetrics()
+        chat_storage = RedisChatStateStorage(redis_api, bot_state_to_dict_bijection, metrics=metrics)
+        bot = Bot(FakeTelegramApi(),
+                  lambda: GreetingState(state_factory),
+                  bot_state_to_dict_bijection,
+                  chat_storage,
+                  metrics=metrics
+                  )
+        await bot.process_update(make_message_update("hi", CHAT_ID_1))
+        await bot.process_update(make_message_update("/help", CHAT_ID_1))
+        for stage in ["lock_and_load", "decode", "process", "send", "save"]:
+            self.assertEqual(2, metrics.registry.get_sample_value("trivia_bot_stage_seconds_count", {"stage": stage}))
+        self.assertIn(b'trivia_bot_stage_seconds_bucket{le="0.0005",stage="process"}', metrics.generate())
+
+    async def test_update_metrics(self):
+        metrics = BotMetrics()
+        bot_state_to_dict_bijection = BotStateToDictBijection(_make_state_factory(TEST_QUESTIONS_PATH))
+        bot = Bot(FakeTelegramApi(),
+                  lambda: FailingState("bot message"),
+                  bot_state_to_dict_bijection,
+                  DictChatStateStorage(),
+                  InMemoryUpdateDeduplicator(10),
+                  metrics
+                  )
+        with self.assertRaises(RuntimeError):
+            await bot.process_update(make_message_update("hi", CHAT_ID_1))
+        await bot.process_update(make_callback_query_update("2", CHAT_ID_1))
+        await bot.process_update(make_callback_query_update("2", CHAT_ID_1))
+
+        def updates(update_type: str, result: str) -> Optional[float]:
+            labels = {"type": update_type, "result": result}
+            return metrics.registry.get_sample_value("trivia_bot_updates_total", labels)
+
+        self.assertEqual(1, updates("callback_query", "ok"))
+        self.assertEqual(1, updates("callback_query", "duplicate"))
+        self.assertEqual(1, updates("message", "error"))
+
 
 def make_message_update(text: str, chat_id: int) -> Update:
     """
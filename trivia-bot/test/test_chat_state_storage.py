@@ -0,0 +1,101 @@
+from unittest import IsolatedAsyncioTestCase
+from pathlib import Path
+from core.chat_state_storage import RedisChatStateStorage
+from core.live_redis_api import LockException
+from core.state_cache import StateCache
+from test.test_utils import DoNothingRandom, InMemoryRedisApi
+from trivia.bijection import BotStateToDictBijection
+from trivia.bot_config import GameConfig
+from trivia.bot_state import BotStateFactory, GreetingState, IdleState
+from trivia.question_storage import JsonQuestionStorage
+
+
+CHAT_ID = 400
+TEST_QUESTIONS_PATH = Path("resources/test_questions.json")
+
+
+class RedisChatStateStorageTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.state_factory = BotStateFactory(JsonQuestionStorage(TEST_QUESTIONS_PATH),
+                                             DoNothingRandom(),
+                                             GameConfig.make(1, 1, 1)
+                                             )
+        self.redis_api = InMemoryRedisApi()
+        self.storage = RedisChatStateStorage(self.redis_api, BotStateToDictBijection(self.state_factory))
+
+    async def test_lock_and_get_missing_state(self):
+        lock_token, state = await self.storage.lock_and_get_state(CHAT_ID)
+        self.assertIsNone(state)
+        with self.assertRaises(LockException):
+            await self.storage.lock_and_get_state(CHAT_ID)
+        await self.storage.unlock(CHAT_ID, lock_token)
+        self.assertEqual({}, self.redis_api.values)
+
+    async def test_set_state_and_unlock(self):
+        lock_token, _ = await self.storage.lock_and_get_state(CHAT_ID)
+        await self.storage.set_state_and_unlock(CHAT_ID, IdleState(self.state_factory), lock_token)
+        lock_token, state = await self.storage.lock_and_get_state(CHAT_ID)
+        self.assertEqual(IdleState(self.state_factory), state)
+        await self.storage.unlock(CHAT_ID, lock_token)
+        self.assertEqual([f"state_{CHAT_ID}", f"version_{CHAT_ID}"], list(self.redis_api.values.keys()))
+
+    async def test_unlock_when_state_can_not_be_decoded(self):
+        await self.redis_api.set_key(f"state_{CHAT_ID}", b"{}")
+        with self.assertRaises(KeyError):
+            await self.storage.lock_and_get_state(CHAT_ID)
+        self.assertEqual([f"state_{CHAT_ID}"], list(self.redis_api.values.keys()))
+
+    async def test_cached_state_is_not_decoded_again(self):
+        storage = RedisChatStateStorage(self.redis_api,
+                                        BotStateToDictBijection(self.state_factory),
+                                        StateCache(10, 60)
+                                        )
+        lock_token, _ = await storage.lock_and_get_state(CHAT_ID)
+        await storage.set_state_and_unlock(CHAT_ID, IdleState(self.state_factory), lock_token)
+        lock_token, state = await storage.lock_and_get_state(CHAT_ID)
+        await storage.unlock(CHAT_ID, lock_token)
+        lock_token, cached_state = await storage.lock_and_get_state(CHAT_ID)
+        await storage.unlock(CHAT_ID, lock_token)
+        self.assertIs(state, cached_state)
+
+    async def test_state_is_saved_only_when_encoded_value_changes(self):
+        storage = RedisChatStateStorage(self.redis_api,
+                                        BotStateToDictBijection(self.state_factory),
+                                        StateCache(10, 60)
+                                        )
+        lock_token, _ = await storage.lock_and_get_state(CHAT_ID)
+        await storage.set_state_and_unlock(CHAT_ID, self.state_factory.create_in_game_state(), lock_token)
+        lock_token, state = await storage.lock_and_get_state(CHAT_ID)
+        await storage.set_state_and_unlock(CHAT_ID, state, lock_token)
+        self.assertEqual(b"1", self.redis_api.values[f"version_{CHAT_ID}"])
+
+        lock_token, state = await storage.lock_and_get_state(CHAT_ID)
+        # Состояние изменено на месте, без BotResponse.state_changed
+        state.state.game_score += 1
+        await storage.set_state_and_unlock(CHAT_ID, state, lock_token)
+        self.assertEqual(b"2", self.redis_api.values[f"version_{CHAT_ID}"])
+
+    async def test_cached_state_is_reloaded_when_version_changes(self):
+        storage = RedisChatStateStorage(self.redis_api,
+                                        BotStateToDictBijection(self.state_factory),
+                                        StateCache(10, 60)
+                                        )
+        await storage.set_state(CHAT_ID, IdleState(self.state_factory))
+        await self.storage.set_state(CHAT_ID, GreetingState(self.state_factory))
+        lock_token, state = await storage.lock_and_get_state(CHAT_ID)
+        await storage.unlock(CHAT_ID, lock_token)
+        self.assertEqual(GreetingState(self.state_factory), state)
+
+    async def test_discarded_state_is_reloaded(self):
+        storage = RedisChatStateStorage(self.redis_api,
+                                        BotStateToDictBijection(self.state_factory),
+                                        StateCache(10, 60)
+                                        )
+        await storage.set_state(CHAT_ID, IdleState(self.state_factory))
+        lock_token, state = await storage.lock_and_get_state(CHAT_ID)
+        storage.discard_state(CHAT_ID)
+        await storage.unlock(CHAT_ID, lock_token)
+        lock_token, reloaded_state = await storage.lock_and_get_state(CHAT_ID)
+        await storage.unlock(CHAT_ID, lock_token)
+        self.assertIsNot(state, reloaded_state)
+        self.assertEqual(state, reloaded_state)
@@ -1,5 +1,6 @@
 from unittest import TestCase
-from trivia.bot_state import BotStateFactory
+from trivia.bot_state import BotStateFactory, select_questions
+from trivia.question_catalog import QuestionCatalog
 from trivia.question_storage import Question, JsonQuestionStorage, InMemoryQuestionStorage
 from pathlib import Path
 from test.test_utils import ReversedShuffleRandom, DoNothingRandom
@@ -46,3 +47,32 @@ class BotStateFactoryTest(TestCase):
             state_factory.create_in_game_state()
 
         self.assertTrue("Not enough questions build a questions list", context.exception)
+
+    def test_select_questions_from_each_difficulty(self):
+        questions = [
+            Question("1+1", ["2", "3"], 1, Question.Difficulty.EASY, 0),
+            Question("1+2", ["3", "4"], 1, Question.Difficulty.EASY, 0),
+            Question("10*2", ["20", "30"], 3, Question.Difficulty.HARD, 0),
+            Question("1+3", ["4", "5"], 1, Question.Difficulty.EASY, 0),
+            Question("5*5", ["25", "30"], 2, Question.Difficulty.MEDIUM, 0)
+        ]
+        storage = InMemoryQuestionStorage(questions)
+        catalog = QuestionCatalog(storage)
+        actual = select_questions(catalog, ReversedShuffleRandom(), 2, 1, 1)
+        expected = [
+            Question("1+3", ["4", "5"], 1, Question.Difficulty.EASY, 0),
+            Question("1+2", ["3", "4"], 1, Question.Difficulty.EASY, 0),
+            Question("5*5", ["25", "30"], 2, Question.Difficulty.MEDIUM, 0),
+            Question("10*2", ["20", "30"], 3, Question.Difficulty.HARD, 0)
+        ]
+        self.assertEqual(expected, actual)
+
+    def test_not_enough_questions_of_one_difficulty(self):
+        questions = [
+            Question("1+1", ["2", "3"], 1, Question.Difficulty.EASY, 0),
+            Question("1+2", ["3", "4"], 1, Question.Difficulty.EASY, 0),
+            Question("1+3", ["4", "5"], 1, Question.Difficulty.EASY, 0)
+        ]
+        catalog = QuestionCatalog(InMemoryQuestionStorage(questions))
+        with self.assertRaises(NotEnoughQuestionsException):
+            select_questions(catalog, DoNothingRandom(), 1, 0, 1)
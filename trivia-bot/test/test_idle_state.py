@@ -1,7 +1,8 @@
 from unittest import TestCase
 from core.message import Message
 from core.command import Command
-from trivia.bot_state import IdleState, InGameState, BotStateFactory
+from trivia.bot_state import IdleState, InGameState, BotStateFactory, GameAbortedState
+from core.callback_query import CallbackQuery
 from trivia.question_storage import JsonQuestionStorage
 from typing import cast
 from test.test_utils import DoNothingRandom
@@ -69,3 +70,29 @@ class IdleStateTest(TestCase):
         self.assertEqual("<i>Я не понимаю команду. Введите /start или /help</i>", command_resp.message.text)
         self.assertEqual(275, command_resp.message.chat_id)
         self.assertEqual(None, command_resp.new_state)
+
+
+class GameAbortedStateTest(TestCase):
+    def setUp(self):
+        storage = JsonQuestionStorage(Path("resources/test_questions.json"))
+        self.state_factory = BotStateFactory(storage, DoNothingRandom(), GameConfig.make(1, 1, 1))
+        self.state = GameAbortedState(self.state_factory)
+
+    def test_old_keyboard_reports_aborted_game(self):
+        callback_query = CallbackQuery("1.game.0.1", Message(280, "question"), 10)
+        response = self.state.process_callback_query(callback_query)
+        self.assertEqual("<i>Игра прервана: ее вопросы больше недоступны. Введите /start, чтобы начать новую игру</i>",
+                         response.message.text
+                         )
+        self.assertEqual(280, response.message.chat_id)
+        self.assertEqual(IdleState(self.state_factory), response.new_state)
+
+    def test_message_reports_aborted_game(self):
+        response = self.state.process_message(Message(285, "Hello"))
+        self.assertEqual(285, response.message.chat_id)
+        self.assertEqual(IdleState(self.state_factory), response.new_state)
+
+    def test_start_begins_new_game(self):
+        response = self.state.process_command(Command(290, "/start"))
+        self.assertEqual("<i>Игра начинается</i>", response.message.text)
+        self.assertTrue(isinstance(response.new_state, InGameState))
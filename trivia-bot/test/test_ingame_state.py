@@ -22,13 +22,14 @@ class InGameStateTest(TestCase):
     def check_conversation(self,
                            state_factory: BotStateFactory,
                            first_bot_message: Message,
-                           conversation: List[Tuple[str, Message]],
+                           conversation: List[Tuple[str, Message, bool]],
                            expected_state: Optional[BotState] = None):
         """
             Проверяет правильность ответа бота на сообщения и команды от пользователя
             :param state_factory: факбрика состояний, служит для создания состояний бота
             :param first_bot_message: первое сообщение вбота
-            :param conversation: список пар (сообщение пользователя, ответ бота на это сообщение)
+            :param conversation: список троек (сообщение пользователя, ответ бота на это сообщение, изменилось ли
+                                 состояние игры)
             :param expected_state: ожидаемое состояние бота в конце диалога
         """
         json_file = Path("resources/test_questions.json")
@@ -39,15 +40,18 @@ class InGameStateTest(TestCase):
         message = state.on_enter(CHAT_ID)
         self.assertEqual(first_bot_message, message)
         count = 0
-        for user_msg, expected_bot_msg in conversation:
+        for user_msg, expected_bot_msg, state_changed in conversation:
             response = state.process_message(Message(CHAT_ID, user_msg))
             count += 1
 
             if len(conversation) == count:
-                expected_response = BotResponse(message=expected_bot_msg, new_state=expected_state)
+                expected_response = BotResponse(message=expected_bot_msg,
+                                                new_state=expected_state,
+                                                state_changed=state_changed
+                                                )
                 self.assertEqual(expected_response, response)
             else:
-                expected_response = BotResponse(message=expected_bot_msg, new_state=None)
+                expected_response = BotResponse(message=expected_bot_msg, new_state=None, state_changed=state_changed)
                 self.assertEqual(expected_response, response)
 
     def create_state_factory(self) -> BotStateFactory:
@@ -140,7 +144,7 @@ class InGameStateTest(TestCase):
                                             ),
                                             "HTML"
                                             )
-        expected = BotResponse(expected_message, expected_message_edit)
+        expected = BotResponse(expected_message, expected_message_edit, state_changed=True)
         self.assertEqual(expected, callback_query_response)
 
     def test_callback_query_when_game_id_is_not_correct(self):
@@ -189,7 +193,26 @@ class InGameStateTest(TestCase):
                                             ),
                                             "HTML"
                                             )
-        expected = BotResponse(expected_message, message_edit=expected_message_edit)
+        expected = BotResponse(expected_message, message_edit=expected_message_edit, state_changed=True)
+        self.assertEqual(expected, callback_query_response)
+
+    def test_callback_query_edit_in_place(self):
+        config = GameConfig(easy_question_count=1, medium_question_count=1, hard_question_count=1, edit_in_place=True)
+        state = _make_in_game_state(TEST_QUESTIONS_PATH, config)
+        prev_message_id = 750
+        callback_query = CallbackQuery(f"{GAME_ID}.0.1", Message(CHAT_ID, "1"), prev_message_id)
+        callback_query_response = state.process_callback_query(callback_query)
+
+        answer_text = format.make_message(1, 1, Question("7+3", ["10", "11"], 1, Question.Difficulty.EASY, 0))
+        next_question_text = format.make_message(1, question=Question("17+3", ["20", "21"], 2,
+                                                                      Question.Difficulty.EASY, 0))
+        expected_message_edit = MessageEdit(CHAT_ID,
+                                            prev_message_id,
+                                            f"{answer_text}\n\n{next_question_text}",
+                                            "HTML",
+                                            make_keyboard_for_question(2, GAME_ID, 1)
+                                            )
+        expected = BotResponse(message_edit=expected_message_edit, state_changed=True)
         self.assertEqual(expected, callback_query_response)
 
     def test_when_all_user_answers_is_correct(self):
@@ -213,9 +236,9 @@ class InGameStateTest(TestCase):
         text_3 = format.make_message(2, game_score=6)
         message_3 = Message(CHAT_ID, text_3, "HTML", None)
         conversation = [
-                ("1", message_1),
-                ("1", message_2),
-                ("1", message_3)
+                ("1", message_1, True),
+                ("1", message_2, True),
+                ("1", message_3, True)
             ]
 
         self.check_conversation(
@@ -247,9 +270,9 @@ class InGameStateTest(TestCase):
         message_3 = Message(CHAT_ID, text_3, "HTML", None)
 
         conversation = [
-                ("2", message_1),
-                ('2', message_2),
-                ("2", message_3)
+                ("2", message_1, True),
+                ('2', message_2, True),
+                ("2", message_3, True)
             ]
         self.check_conversation(
                                 state_factory,
@@ -268,7 +291,7 @@ class InGameStateTest(TestCase):
         first_bot_message = Message(CHAT_ID, dedent_and_strip(text), "HTML", keyboard)
         message_1 = Message(CHAT_ID, text_1, "HTML", None)
         conversation = [
-                ("foo", message_1)
+                ("foo", message_1, False)
             ]
         self.check_conversation(
                                 state_factory,
@@ -295,9 +318,9 @@ class InGameStateTest(TestCase):
         message_2 = Message(CHAT_ID, text_2, "HTML", None)
         message_3 = Message(CHAT_ID, text_3, "HTML", keyboard_2)
         conversation = [
-                ("foo", message_1),
-                ('foo', message_2),
-                ("1", message_3)
+                ("foo", message_1, False),
+                ('foo', message_2, False),
+                ("1", message_3, True)
             ]
         self.check_conversation(
                                 state_factory,
@@ -323,9 +346,9 @@ class InGameStateTest(TestCase):
         message_2 = Message(CHAT_ID, text_2, "HTML", None)
         message_3 = Message(CHAT_ID, text_3, "HTML", keyboard_2)
         conversation = [
-                ("foo", message_1),
-                ('foo', message_2),
-                ("2", message_3)
+                ("foo", message_1, False),
+                ('foo', message_2, False),
+                ("2", message_3, True)
             ]
         self.check_conversation(
                                 state_factory,
@@ -352,9 +375,9 @@ class InGameStateTest(TestCase):
         message_2 = Message(CHAT_ID, text_2, "HTML", None)
         message_3 = Message(CHAT_ID, text_3, "HTML", keyboard_2)
         conversation = [
-                ("foo", message_1),
-                ('6', message_2),
-                ("2", message_3)
+                ("foo", message_1, False),
+                ('6', message_2, False),
+                ("2", message_3, True)
             ]
         self.check_conversation(
             state_factory,
@@ -364,16 +387,17 @@ class InGameStateTest(TestCase):
         )
 
 
-def _make_in_game_state(questions_file_path: Path) -> InGameState:
+def _make_in_game_state(questions_file_path: Path, config: GameConfig = GameConfig.make(1, 1, 1)) -> InGameState:
     """
         Создает InGameState с вопросами из файла questions_file_path
     :param questions_file_path: путь к файлу json
+    :param config: настройки игры
     :return: InGameState
     """
     storage = JsonQuestionStorage(questions_file_path)
     questions = storage.load_questions()
     random = DoNothingRandom()
-    state_factory = BotStateFactory(storage, random, GameConfig.make(1, 1, 1))
+    state_factory = BotStateFactory(storage, random, config)
     game_state = InGameState.State(questions, GAME_ID)
     state = InGameState(state_factory, game_state)
     return state
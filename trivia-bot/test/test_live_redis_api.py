@@ -0,0 +1,129 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+import fakeredis
+from core.live_redis_api import LiveRedisApi, LockException, LockLostException, RELEASED_CHANNEL
+from core.metrics import BotMetrics
+from trivia.bot_config import LiveRedisApiConfig
+
+
+class LiveRedisApiTest(IsolatedAsyncioTestCase):
+    """
+    Проверяет LiveRedisApi на Redis в памяти из fakeredis. Lua скрипты выполняет fakeredis через lupa
+    """
+    async def asyncSetUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeAsyncRedis(server=self.server)
+        self.addAsyncCleanup(self.redis.close)
+        self.metrics = BotMetrics()
+
+    def make_api(self, max_attempts: int = 3, delay_ms: int = 5000, max_lock_waiters: int = 10) -> LiveRedisApi:
+        config = LiveRedisApiConfig(host="localhost",
+                                    port=6379,
+                                    expire_sec=60,
+                                    max_attempts=max_attempts,
+                                    delay_ms=delay_ms,
+                                    max_lock_waiters=max_lock_waiters
+                                    )
+        api = LiveRedisApi(config,
+                           self.metrics,
+                           connection_class=fakeredis.FakeAsyncRedisConnection,
+                           server=self.server
+                           )
+        self.addAsyncCleanup(api.close)
+        return api
+
+    async def wait_subscribers(self, count: int) -> None:
+        """
+            Ждет, пока на канал освобожденных mutex подпишутся `count` клиентов
+        """
+        for _ in range(100):
+            if dict(await self.redis.pubsub_numsub(RELEASED_CHANNEL))[RELEASED_CHANNEL.encode()] == count:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"{count} subscribers expected")
+
+    async def test_only_owner_unlocks(self):
+        api = self.make_api()
+        token = await api.lock("lock_1")
+        await api.unlock("lock_1", "other token")
+        self.assertEqual(token.encode(), await self.redis.get("lock_1"))
+        await api.unlock("lock_1", token)
+        self.assertIsNone(await self.redis.get("lock_1"))
+
+    async def test_lock_fails_after_max_attempts(self):
+        owner = self.make_api()
+        api = self.make_api(max_attempts=2, delay_ms=10)
+        await owner.lock("lock_1")
+        with self.assertRaises(LockException):
+            await api.lock("lock_1")
+        self.assertEqual(1, self.metrics.registry.get_sample_value("trivia_bot_lock_retries_total"))
+        self.assertEqual(1, self.metrics.registry.get_sample_value("trivia_bot_lock_failures_total"))
+
+    async def test_waiter_is_woken_on_release(self):
+        owner = self.make_api()
+        api = self.make_api()
+        token = await owner.lock("lock_1")
+        waiter = asyncio.create_task(api.lock("lock_1"))
+        await self.wait_subscribers(1)
+        await owner.unlock("lock_1", token)
+        # delay_ms - 5 секунд, поэтому без уведомления ожидающий не успел бы получить mutex
+        waiter_token = await asyncio.wait_for(waiter, 1)
+        self.assertEqual(waiter_token.encode(), await self.redis.get("lock_1"))
+
+    async def test_concurrent_waiters_share_one_subscription(self):
+        owner = self.make_api()
+        api = self.make_api(max_attempts=5)
+        token = await owner.lock("lock_1")
+        waiters = [asyncio.create_task(api.lock("lock_1")) for _ in range(2)]
+        await self.wait_subscribers(1)
+        await asyncio.sleep(0.05)
+        listeners = [task for task in asyncio.all_tasks() if task.get_coro().__name__ == "_listen_released"]
+        self.assertEqual(1, len(listeners))
+
+        await owner.unlock("lock_1", token)
+        done, pending = await asyncio.wait(waiters, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+        self.assertEqual(1, len(done))
+        await api.unlock("lock_1", done.pop().result())
+        await asyncio.wait_for(pending.pop(), 1)
+
+    async def test_lock_waiters_are_limited(self):
+        owner = self.make_api()
+        api = self.make_api(max_lock_waiters=1)
+        token_1 = await owner.lock("lock_1")
+        token_2 = await owner.lock("lock_2")
+        waiter_1 = asyncio.create_task(api.lock("lock_1"))
+        await self.wait_subscribers(1)
+        waiter_2 = asyncio.create_task(api.lock("lock_2"))
+        await asyncio.sleep(0.05)
+        # Второй ожидающий сделал только первую попытку и ждет своей очереди повторять попытки
+        self.assertEqual(1, self.metrics.registry.get_sample_value("trivia_bot_lock_retries_total"))
+
+        await owner.unlock("lock_2", token_2)
+        await owner.unlock("lock_1", token_1)
+        await asyncio.wait_for(waiter_1, 1)
+        await asyncio.wait_for(waiter_2, 1)
+
+    async def test_versioned_key(self):
+        api = self.make_api()
+        token, version, value = await api.lock_and_get_versioned_key("lock_1", "state_1", "version_1", None)
+        self.assertEqual((None, None), (version, value))
+        self.assertEqual("1", await api.set_versioned_key_and_unlock("state_1", b"state", "version_1", "lock_1", token))
+        self.assertIsNone(await self.redis.get("lock_1"))
+
+        token, version, value = await api.lock_and_get_versioned_key("lock_1", "state_1", "version_1", None)
+        self.assertEqual(("1", b"state"), (version, value))
+        await api.unlock("lock_1", token)
+
+        token, version, value = await api.lock_and_get_versioned_key("lock_1", "state_1", "version_1", "1")
+        self.assertEqual(("1", None), (version, value))
+        await api.unlock("lock_1", token)
+
+    async def test_lock_lost(self):
+        api = self.make_api()
+        token, _, _ = await api.lock_and_get_versioned_key("lock_1", "state_1", "version_1", None)
+        # mutex истек, и его получил другой владелец
+        await self.redis.set("lock_1", "other token")
+        with self.assertRaises(LockLostException):
+            await api.set_versioned_key_and_unlock("state_1", b"state", "version_1", "lock_1", token)
+        self.assertIsNone(await self.redis.get("state_1"))
+        self.assertEqual(b"other token", await self.redis.get("lock_1"))
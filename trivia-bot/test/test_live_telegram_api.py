@@ -0,0 +1,73 @@
+import asyncio
+from aiohttp.test_utils import TestServer
+from unittest import IsolatedAsyncioTestCase
+from core.button import Button
+from core.keyboard import Keyboard
+from core.live_telegram_api import LiveTelegramApi
+from core.metrics import BotMetrics
+from core.telegram_api import TooManyRequestsException
+from trivia.bot_config import TelegramHttpConfig
+from system_tests.telegram_server import TelegramServer
+
+
+class LiveTelegramApiTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.telegram = TelegramServer(retry_after=3)
+        self.server = TestServer(self.telegram.make_app())
+        await self.server.start_server()
+        self.addAsyncCleanup(self.server.close)
+
+        self.metrics = BotMetrics()
+        config = TelegramHttpConfig(base_url=str(self.server.make_url("")).rstrip("/"), pool_size=1)
+        self.api = LiveTelegramApi("token", config, self.metrics)
+        self.addAsyncCleanup(self.api.close)
+
+    def calls(self):
+        return [(call.method, call.body) for call in self.telegram.calls]
+
+    async def test_connection_is_reused(self):
+        await self.api.send_message(1, "first")
+        await self.api.edit_message(1, 2, "second")
+        await self.api.answer_callback_query("3")
+        self.assertEqual(["sendMessage", "editMessageText", "answerCallbackQuery"],
+                         [method for method, _ in self.calls()]
+                         )
+        self.assertEqual(1, self.api.pool_stats.created)
+        self.assertEqual(2, self.api.pool_stats.reused)
+
+    async def test_edit_message_with_keyboard(self):
+        keyboard = Keyboard([[Button("1", "data")]])
+        await self.api.edit_message(1, 2, "text", "HTML", keyboard)
+        self.assertEqual([("editMessageText", {
+            "chat_id": 1,
+            "message_id": 2,
+            "text": "text",
+            "parse_mode": "HTML",
+            "reply_markup": {"inline_keyboard": keyboard.as_json()}
+        })], self.calls())
+
+    async def test_too_many_requests(self):
+        self.telegram.reject_next_calls(1)
+        with self.assertRaises(TooManyRequestsException) as context:
+            await self.api.send_message(1, "first")
+        self.assertEqual(3, context.exception.retry_after)
+        await self.api.send_message(1, "second")
+        self.assertEqual(1, self.api.pool_stats.created)
+        for status in ["429", "200"]:
+            labels = {"method": "sendMessage", "status": status}
+            self.assertEqual(1, self.metrics.registry.get_sample_value("trivia_bot_telegram_calls_total", labels))
+
+    async def test_get_updates_waits_for_update(self):
+        update = {"update_id": 5, "message": {"message_id": 1, "chat": {"id": 1, "type": "private"}, "date": 0}}
+        asyncio.get_running_loop().call_later(0.05, self.telegram.add_update, update)
+        response = await self.api.get_updates(5, timeout=5)
+        self.assertEqual([5], [update.update_id for update in response.result])
+        response = await self.api.get_updates(6, timeout=0)
+        self.assertEqual([], response.result)
+
+    async def test_webhook(self):
+        await self.api.set_webhook("https://example.com/hook")
+        self.assertEqual("https://example.com/hook", self.telegram.webhook_url)
+        await self.api.delete_webhook(True)
+        self.assertIsNone(self.telegram.webhook_url)
+        self.assertEqual(["setWebhook", "deleteWebhook"], [method for method, _ in self.calls()])
@@ -0,0 +1,59 @@
+import logging
+import queue
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from core.logging_pipeline import SamplingFilter, LazyQueueHandler, make_logging_pipeline
+from trivia.bot_config import LoggingConfig
+
+
+def make_record(module: str, level: int) -> logging.LogRecord:
+    return logging.LogRecord("root", level, f"/trivia-bot/core/{module}.py", 1, "message %s", (1,), None)
+
+
+class LoggingPipelineTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_path = Path(directory.name) / "trivia_bot.log"
+
+    def test_sampling_filter(self):
+        sampling_filter = SamplingFilter({"bot_state_logging_wrapper": 5})
+        sampled = [sampling_filter.filter(make_record("bot_state_logging_wrapper", logging.INFO)) for _ in range(10)]
+        self.assertEqual(2, sum(sampled))
+        self.assertTrue(sampling_filter.filter(make_record("bot_state_logging_wrapper", logging.ERROR)))
+        self.assertTrue(all(sampling_filter.filter(make_record("bot", logging.INFO)) for _ in range(10)))
+
+    def test_record_is_formatted_by_listener(self):
+        record = make_record("bot", logging.INFO)
+        LazyQueueHandler(queue.SimpleQueue()).handle(record)
+        self.assertEqual("message %s", record.msg)
+        self.assertEqual((1,), record.args)
+
+    def test_mutable_args_are_formatted_before_queueing(self):
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        state = {"game_score": 1}
+        record = logging.LogRecord("root", logging.INFO, "/trivia-bot/core/bot.py", 1, "state %s, chat %s",
+                                   (state, 400), None)
+        LazyQueueHandler(records).handle(record)
+        state["game_score"] = 2
+        queued = records.get_nowait()
+        self.assertEqual("state {'game_score': 1}, chat 400", queued.getMessage())
+        self.assertEqual("state %s, chat %s", record.msg)
+
+    def test_records_are_written_to_file(self):
+        config = LoggingConfig(sample_every={"test_logging_pipeline": 2})
+        with make_logging_pipeline(str(self.log_path), config):
+            for index in range(4):
+                logging.info("message %s", index)
+            logging.error("error %s", 1)
+        lines = self.log_path.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(["message 0", "message 2", "error 1"], [line.split(" - ", 1)[1] for line in lines])
+
+    def test_file_is_rotated_by_size(self):
+        with make_logging_pipeline(str(self.log_path), LoggingConfig(max_bytes=1000, backup_count=2)):
+            for index in range(100):
+                logging.info("message %s", index)
+        self.assertTrue(Path(f"{self.log_path}.1").exists())
+        self.assertTrue(Path(f"{self.log_path}.2").exists())
+        self.assertFalse(Path(f"{self.log_path}.3").exists())
@@ -0,0 +1,48 @@
+from unittest import TestCase
+from typing import List
+from trivia.question_storage import Question, QuestionStorage, JsonQuestionStorage
+from trivia.question_catalog import QuestionCatalog
+from trivia.bot_state import BotStateFactory
+from test.test_utils import DoNothingRandom
+from trivia.bot_config import GameConfig
+from pathlib import Path
+
+
+class CountingQuestionStorage(QuestionStorage):
+    """
+        Хранилище, которое считает количество чтений вопросов
+    """
+    def __init__(self, inner: QuestionStorage):
+        self.inner = inner
+        self.load_count = 0
+
+    def load_questions(self) -> List[Question]:
+        self.load_count += 1
+        return self.inner.load_questions()
+
+
+class QuestionCatalogTest(TestCase):
+    def test_questions_by_difficulty(self):
+        catalog = QuestionCatalog(JsonQuestionStorage(Path("resources/test_questions.json")))
+        self.assertEqual([Question("7+3", ["10", "11"], 1, Question.Difficulty.EASY, 0)],
+                         list(catalog.get_questions(Question.Difficulty.EASY))
+                         )
+        self.assertEqual([Question("17+3", ["20", "21"], 2, Question.Difficulty.MEDIUM, 0)],
+                         list(catalog.get_questions(Question.Difficulty.MEDIUM))
+                         )
+        self.assertEqual([Question("27+3", ["30", "31"], 3, Question.Difficulty.HARD, 0)],
+                         list(catalog.get_questions(Question.Difficulty.HARD))
+                         )
+
+    def test_load_questions_returns_copy(self):
+        catalog = QuestionCatalog(JsonQuestionStorage(Path("resources/test_questions.json")))
+        questions = catalog.load_questions()
+        questions.clear()
+        self.assertEqual(3, len(catalog.load_questions()))
+
+    def test_storage_is_read_once(self):
+        storage = CountingQuestionStorage(JsonQuestionStorage(Path("resources/test_questions.json")))
+        state_factory = BotStateFactory(storage, DoNothingRandom(), GameConfig.make(1, 1, 1))
+        for _ in range(5):
+            state_factory.create_in_game_state()
+        self.assertEqual(1, storage.load_count)
@@ -0,0 +1,240 @@
+import asyncio
+from pathlib import Path
+from typing import Awaitable, List, Optional
+from unittest import IsolatedAsyncioTestCase, TestCase
+from core.keyboard import Keyboard
+from core.rate_limited_telegram_api import RateLimitedTelegramApi, TokenBucket
+from core.telegram_api import SendTimeoutException, TelegramApi, TooManyRequestsException
+from trivia.telegram_models import UpdatesResponse
+
+
+class RecordingTelegramApi(TelegramApi):
+    """
+    Запоминает успешно отправленные вызовы. Первые `too_many_requests` вызовов отвечают 429
+    """
+    def __init__(self, too_many_requests: int = 0, retry_after: float = 0.05):
+        self.calls: List[str] = []
+        self.too_many_requests = too_many_requests
+        self.retry_after = retry_after
+
+    def _call(self, name: str) -> None:
+        if self.too_many_requests > 0:
+            self.too_many_requests -= 1
+            raise TooManyRequestsException(name, self.retry_after)
+        self.calls.append(name)
+
+    async def get_updates(self,
+                          offset: int,
+                          limit: int = 100,
+                          timeout: int = 10,
+                          allowed_updates: Optional[List[str]] = None
+                          ) -> UpdatesResponse:
+        return UpdatesResponse(ok=True, result=[])
+
+    async def send_message(self,
+                           chat_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        self._call(text)
+
+    async def answer_callback_query(self, callback_query_id: str) -> None:
+        self._call(callback_query_id)
+
+    async def edit_message(self,
+                           chat_id: int,
+                           message_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        self._call(text)
+
+    async def set_webhook(self, url: str, cert_filepath: Optional[Path] = None) -> None:
+        pass
+
+    async def delete_webhook(self, drop_pending_updates: bool) -> None:
+        pass
+
+
+class TokenBucketTest(TestCase):
+    def test_bucket(self):
+        bucket = TokenBucket(2, 2, 0)
+        self.assertEqual(0, bucket.delay(0))
+        bucket.take(0)
+        bucket.take(0)
+        self.assertAlmostEqual(0.5, bucket.delay(0))
+        self.assertAlmostEqual(0.25, bucket.delay(0.25))
+        self.assertEqual(0, bucket.delay(0.5))
+        self.assertFalse(bucket.is_full(0.5))
+        self.assertTrue(bucket.is_full(1))
+
+    def test_paused_bucket(self):
+        bucket = TokenBucket(2, 2, 0)
+        bucket.pause(1)
+        self.assertEqual(1, bucket.delay(0))
+        self.assertFalse(bucket.is_full(0.5))
+        self.assertEqual(0, bucket.delay(1))
+        self.assertTrue(bucket.is_full(1))
+
+
+class RateLimitedTelegramApiTest(IsolatedAsyncioTestCase):
+    """
+    Проверяет выбор вызовов из очереди по времени `now`, не запуская цикл отправки
+    """
+    async def asyncSetUp(self):
+        self.telegram_api = RecordingTelegramApi()
+        self.now = 0.0
+
+    def make_api(self,
+                 global_rate: float = 1000,
+                 chat_rate: float = 1000,
+                 chat_burst: int = 1,
+                 max_retries: int = 3,
+                 max_wait_sec: float = 10
+                 ):
+        api = RateLimitedTelegramApi(self.telegram_api,
+                                     global_rate,
+                                     chat_rate,
+                                     chat_burst,
+                                     max_retries,
+                                     max_wait_sec,
+                                     lambda: self.now
+                                     )
+        self.addAsyncCleanup(api.close)
+        return api
+
+    async def enqueue(self, *calls: Awaitable[None]) -> "asyncio.Future[List[None]]":
+        results = asyncio.gather(*calls)
+        await asyncio.sleep(0)
+        return results
+
+    async def send_next(self, api: RateLimitedTelegramApi, now: float) -> Optional[float]:
+        """
+            Отправляет вызов, который очередь выбрала в момент `now`
+        :return: 0, если вызов отправлен, иначе через сколько секунд стоит проверить очередь еще раз
+        """
+        self.now = now
+        request, delay = api._take_next_request(now)
+        if request is not None:
+            await api._send(request)
+        return delay
+
+    async def test_chat_rate(self):
+        api = self.make_api(chat_rate=20)
+        results = await self.enqueue(*[api.send_message(1, f"{i}") for i in range(3)])
+        self.assertEqual(0, await self.send_next(api, 0))
+        self.assertAlmostEqual(0.04, await self.send_next(api, 0.01))
+        self.assertEqual(0, await self.send_next(api, 0.05))
+        self.assertEqual(0, await self.send_next(api, 0.1))
+        await results
+        self.assertEqual(["0", "1", "2"], self.telegram_api.calls)
+
+    async def test_different_chats_are_not_limited_by_chat_rate(self):
+        api = self.make_api(chat_rate=1)
+        results = await self.enqueue(*[api.send_message(i, f"{i}") for i in range(3)])
+        for now in [0, 0.001, 0.002]:
+            self.assertEqual(0, await self.send_next(api, now))
+        await results
+        self.assertEqual(["0", "1", "2"], self.telegram_api.calls)
+
+    async def test_global_rate(self):
+        api = self.make_api(global_rate=20)
+        results = await self.enqueue(*[api.send_message(i, f"{i}") for i in range(2)])
+        self.assertEqual(0, await self.send_next(api, 0))
+        self.assertAlmostEqual(0.05, await self.send_next(api, 0))
+        self.assertEqual(0, await self.send_next(api, 0.05))
+        await results
+        self.assertEqual(["0", "1"], self.telegram_api.calls)
+
+    async def test_answer_callback_query_priority(self):
+        api = self.make_api()
+        results = await self.enqueue(api.send_message(1, "message 1"),
+                                     api.send_message(2, "message 2"),
+                                     api.answer_callback_query("answer")
+                                     )
+        for now in [0, 0.001, 0.002]:
+            self.assertEqual(0, await self.send_next(api, now))
+        await results
+        self.assertEqual(["answer", "message 1", "message 2"], self.telegram_api.calls)
+
+    async def test_too_many_requests_to_chat_pauses_only_this_chat(self):
+        self.telegram_api.too_many_requests = 1
+        self.telegram_api.retry_after = 0.5
+        api = self.make_api()
+        results = await self.enqueue(api.send_message(1, "message 1"),
+                                     api.send_message(1, "message 2"),
+                                     api.send_message(2, "other chat")
+                                     )
+        await self.send_next(api, 0)
+        self.assertEqual(0, await self.send_next(api, 0.001))
+        self.assertAlmostEqual(0.498, await self.send_next(api, 0.002))
+        self.assertEqual(0, await self.send_next(api, 0.5))
+        self.assertEqual(0, await self.send_next(api, 0.501))
+        await results
+        self.assertEqual(["other chat", "message 1", "message 2"], self.telegram_api.calls)
+
+    async def test_one_call_per_chat_is_sent_at_a_time(self):
+        api = self.make_api(chat_burst=3)
+        results = await self.enqueue(api.send_message(1, "message 1"),
+                                     api.send_message(1, "message 2"),
+                                     api.send_message(2, "other chat")
+                                     )
+        request, _ = api._take_next_request(0)
+        # Второе сообщение чата 1 ждет ответа на первое, хотя токены чата есть
+        self.assertEqual(0, await self.send_next(api, 0.001))
+        self.assertEqual(["other chat"], self.telegram_api.calls)
+        # Очередь ждет только срока вызова: ответ на первое сообщение сам разбудит цикл отправки
+        self.assertAlmostEqual(9.998, await self.send_next(api, 0.002))
+        await api._send(request)
+        self.assertEqual(0, await self.send_next(api, 0.003))
+        await results
+        self.assertEqual(["other chat", "message 1", "message 2"], self.telegram_api.calls)
+
+    async def test_too_many_requests_without_chat_pauses_all_calls(self):
+        self.telegram_api.too_many_requests = 1
+        self.telegram_api.retry_after = 0.5
+        api = self.make_api()
+        results = await self.enqueue(api.answer_callback_query("answer"), api.send_message(1, "message"))
+        await self.send_next(api, 0)
+        self.assertAlmostEqual(0.499, await self.send_next(api, 0.001))
+        self.assertEqual(0, await self.send_next(api, 0.5))
+        self.assertEqual(0, await self.send_next(api, 0.501))
+        await results
+        self.assertEqual(["answer", "message"], self.telegram_api.calls)
+
+    async def test_too_many_retries(self):
+        self.telegram_api.too_many_requests = 3
+        api = self.make_api(max_retries=2)
+        results = await self.enqueue(api.edit_message(1, 2, "message"))
+        for now in [0, 0.05, 0.1]:
+            await self.send_next(api, now)
+        with self.assertRaises(TooManyRequestsException):
+            await results
+        results = await self.enqueue(api.send_message(1, "next message"))
+        self.assertEqual(0, await self.send_next(api, 0.2))
+        await results
+        self.assertEqual(["next message"], self.telegram_api.calls)
+
+    async def test_call_fails_after_max_wait(self):
+        self.telegram_api.too_many_requests = 1
+        self.telegram_api.retry_after = 5
+        api = self.make_api(max_wait_sec=2)
+        results = await self.enqueue(api.send_message(1, "message"), api.send_message(2, "other chat"))
+        await self.send_next(api, 0)
+        self.assertEqual(0, await self.send_next(api, 0.5))
+        self.assertAlmostEqual(1.4, await self.send_next(api, 0.6))
+        self.assertIsNone(await self.send_next(api, 2))
+        with self.assertRaises(SendTimeoutException):
+            await results
+        self.assertEqual(["other chat"], self.telegram_api.calls)
+
+    async def test_send_loop(self):
+        self.telegram_api.too_many_requests = 1
+        self.telegram_api.retry_after = 0.01
+        api = RateLimitedTelegramApi(self.telegram_api, 1000, 1000, 1, 3, 10)
+        api.start()
+        self.addAsyncCleanup(api.close)
+        await asyncio.gather(api.send_message(1, "message 1"), api.send_message(1, "message 2"))
+        self.assertEqual(["message 1", "message 2"], self.telegram_api.calls)
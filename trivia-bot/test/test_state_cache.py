@@ -0,0 +1,48 @@
+from unittest import TestCase
+from core.state_cache import StateCache
+from trivia.bot_state import EchoState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StateCacheTest(TestCase):
+    def test_least_recently_used_state_is_evicted(self):
+        cache = StateCache(2, 60, FakeClock())
+        state_1, state_2, state_3 = EchoState(), EchoState(), EchoState()
+        cache.put(1, "1", state_1, b"1")
+        cache.put(2, "1", state_2, b"2")
+        self.assertEqual(("1", state_1, b"1"), cache.get(1))
+        cache.put(3, "1", state_3, b"3")
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(("1", state_1, b"1"), cache.get(1))
+        self.assertEqual(("1", state_3, b"3"), cache.get(3))
+
+    def test_state_expires(self):
+        clock = FakeClock()
+        cache = StateCache(2, 60, clock)
+        state = EchoState()
+        cache.put(1, "5", state, b"1")
+        clock.now = 59
+        self.assertEqual(("5", state, b"1"), cache.get(1))
+        clock.now = 60
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(0, len(cache))
+
+    def test_discard(self):
+        cache = StateCache(2, 60, FakeClock())
+        cache.put(1, "1", EchoState(), b"1")
+        cache.discard(1)
+        cache.discard(2)
+        self.assertIsNone(cache.get(1))
+
+    def test_zero_size_cache_stores_nothing(self):
+        cache = StateCache(0, 60, FakeClock())
+        cache.put(1, "1", EchoState(), b"1")
+        self.assertIsNone(cache.get(1))
@@ -0,0 +1,46 @@
+from unittest import TestCase
+from trivia.question_storage import Question
+from trivia.state_codec import JsonStateCodec, MsgpackStateCodec, StateCodecException
+
+
+STATE = {
+    "is_logging_wrapper": True,
+    "bot_state_type": "InGameState",
+    "bot_state_data": {
+        "questions": [
+            {
+                "text": "Сколько будет 7+3?",
+                "answers": ["10", "11"],
+                "correct_answer": 0,
+                "difficulty": Question.Difficulty.HARD,
+                "points": 3
+            }
+        ],
+        "game_id": "125",
+        "current_question": 0,
+        "game_score": 0
+    }
+}
+
+
+class StateCodecTest(TestCase):
+    def test_json_codec(self):
+        codec = JsonStateCodec()
+        self.assertEqual(STATE, codec.decode(codec.encode(STATE)))
+
+    def test_msgpack_codec(self):
+        codec = MsgpackStateCodec()
+        data = codec.encode(STATE)
+        decoded = codec.decode(data)
+        self.assertEqual(STATE, decoded)
+        self.assertIs(Question.Difficulty.HARD, decoded["bot_state_data"]["questions"][0]["difficulty"])
+        self.assertLess(len(data), len(JsonStateCodec().encode(STATE)))
+
+    def test_msgpack_codec_reads_json(self):
+        self.assertEqual(STATE, MsgpackStateCodec().decode(JsonStateCodec().encode(STATE)))
+
+    def test_unknown_format_version(self):
+        data = bytearray(MsgpackStateCodec().encode(STATE))
+        data[1] = MsgpackStateCodec.VERSION + 1
+        with self.assertRaises(StateCodecException):
+            MsgpackStateCodec().decode(bytes(data))
@@ -0,0 +1,90 @@
+import asyncio
+from pathlib import Path
+from typing import List, Optional
+from unittest import IsolatedAsyncioTestCase
+from core.keyboard import Keyboard
+from core.telegram_action import send_actions, SendMessageAction, EditMessageAction, AnswerCallbackQueryAction
+from core.telegram_api import TelegramApi
+from trivia.telegram_models import UpdatesResponse
+
+
+class SlowTelegramApi(TelegramApi):
+    """
+    Каждый вызов занимает `delay_sec` секунд. Запоминает порядок завершения вызовов и наибольшее число вызовов,
+    выполнявшихся одновременно
+    """
+    def __init__(self, delay_sec: float, failing_call: Optional[str] = None):
+        self.delay_sec = delay_sec
+        self.failing_call = failing_call
+        self.calls: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _call(self, name: str) -> None:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay_sec)
+        finally:
+            self.in_flight -= 1
+        if name == self.failing_call:
+            raise ValueError(name)
+        self.calls.append(name)
+
+    async def get_updates(self,
+                          offset: int,
+                          limit: int = 100,
+                          timeout: int = 10,
+                          allowed_updates: Optional[List[str]] = None
+                          ) -> UpdatesResponse:
+        return UpdatesResponse(ok=True, result=[])
+
+    async def send_message(self,
+                           chat_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        await self._call(text)
+
+    async def answer_callback_query(self, callback_query_id: str) -> None:
+        await self._call(callback_query_id)
+
+    async def edit_message(self,
+                           chat_id: int,
+                           message_id: int,
+                           text: str,
+                           parse_mode: Optional[str] = None,
+                           keyboard: Optional[Keyboard] = None
+                           ) -> None:
+        await self._call(text)
+
+    async def set_webhook(self, url: str, cert_filepath: Optional[Path] = None) -> None:
+        pass
+
+    async def delete_webhook(self, drop_pending_updates: bool) -> None:
+        pass
+
+
+ACTIONS = [
+    AnswerCallbackQueryAction("answer"),
+    EditMessageAction(1, 2, "edit"),
+    SendMessageAction(1, "message"),
+    SendMessageAction(1, "on enter")
+]
+
+
+class SendActionsTest(IsolatedAsyncioTestCase):
+    async def test_independent_actions_are_sent_concurrently(self):
+        telegram_api = SlowTelegramApi(0.01)
+        await send_actions(telegram_api, ACTIONS)
+        self.assertEqual({"answer", "edit", "message", "on enter"}, set(telegram_api.calls))
+        self.assertLess(telegram_api.calls.index("message"), telegram_api.calls.index("on enter"))
+        # answer, edit и message отправляются одновременно, on enter - только после message
+        self.assertEqual(3, telegram_api.max_in_flight)
+
+    async def test_error_is_raised_after_all_actions(self):
+        telegram_api = SlowTelegramApi(0.01, "edit")
+        with self.assertRaises(ValueError):
+            await send_actions(telegram_api, ACTIONS)
+        self.assertEqual({"answer", "message", "on enter"}, set(telegram_api.calls))
@@ -0,0 +1,33 @@
+from unittest import IsolatedAsyncioTestCase
+from core.update_deduplicator import InMemoryUpdateDeduplicator, RedisUpdateDeduplicator
+from test.test_utils import InMemoryRedisApi
+
+
+class InMemoryUpdateDeduplicatorTest(IsolatedAsyncioTestCase):
+    async def test_duplicate_is_detected(self):
+        deduplicator = InMemoryUpdateDeduplicator(2)
+        self.assertTrue(await deduplicator.mark_seen(1))
+        self.assertFalse(await deduplicator.mark_seen(1))
+
+    async def test_old_updates_leave_window(self):
+        deduplicator = InMemoryUpdateDeduplicator(2)
+        for update_id in [1, 2, 3]:
+            self.assertTrue(await deduplicator.mark_seen(update_id))
+        self.assertTrue(await deduplicator.mark_seen(1))
+        self.assertFalse(await deduplicator.mark_seen(3))
+
+    async def test_forgotten_update_is_processed_again(self):
+        deduplicator = InMemoryUpdateDeduplicator(2)
+        await deduplicator.mark_seen(1)
+        await deduplicator.forget(1)
+        self.assertTrue(await deduplicator.mark_seen(1))
+
+
+class RedisUpdateDeduplicatorTest(IsolatedAsyncioTestCase):
+    async def test_duplicate_is_detected(self):
+        redis_api = InMemoryRedisApi()
+        deduplicator = RedisUpdateDeduplicator(redis_api, 60)
+        self.assertTrue(await deduplicator.mark_seen(1))
+        self.assertFalse(await RedisUpdateDeduplicator(redis_api, 60).mark_seen(1))
+        await deduplicator.forget(1)
+        self.assertTrue(await deduplicator.mark_seen(1))
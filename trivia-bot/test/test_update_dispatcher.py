@@ -0,0 +1,104 @@
+import asyncio
+from typing import List, Tuple
+from unittest import IsolatedAsyncioTestCase
+from core.update_dispatcher import make_update_dispatcher
+from test.test_bot import make_message_update
+from trivia.telegram_models import Update
+
+
+CHAT_ID_1 = 125
+CHAT_ID_2 = 150
+
+
+class RecordingProcessor:
+    """
+    Обрабатывает update с задержкой и запоминает порядок начала и окончания обработки
+    """
+    def __init__(self, delay_sec: float):
+        self.delay_sec = delay_sec
+        self.events: List[Tuple[str, int, str]] = []
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, update: Update) -> None:
+        chat_id = update.get_chat_id(update)
+        text = update.message.text if update.message and update.message.text else ""
+        self.events.append(("start", chat_id, text))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay_sec)
+        self.active -= 1
+        if text == "fail":
+            raise RuntimeError("failed to process update")
+        self.events.append(("end", chat_id, text))
+
+
+class UpdateDispatcherTest(IsolatedAsyncioTestCase):
+    async def test_updates_of_one_chat_are_processed_in_order(self):
+        processor = RecordingProcessor(0.01)
+        async with make_update_dispatcher(processor, 4, 100) as dispatcher:
+            for text in ["1", "2", "3"]:
+                await dispatcher.dispatch(make_message_update(text, CHAT_ID_1))
+            await dispatcher.join()
+
+        expected = [
+            ("start", CHAT_ID_1, "1"), ("end", CHAT_ID_1, "1"),
+            ("start", CHAT_ID_1, "2"), ("end", CHAT_ID_1, "2"),
+            ("start", CHAT_ID_1, "3"), ("end", CHAT_ID_1, "3"),
+        ]
+        self.assertEqual(expected, processor.events)
+        self.assertEqual(1, processor.max_active)
+
+    async def test_chats_are_processed_concurrently(self):
+        processor = RecordingProcessor(0.01)
+        async with make_update_dispatcher(processor, 4, 100) as dispatcher:
+            await dispatcher.dispatch(make_message_update("1", CHAT_ID_1))
+            await dispatcher.dispatch(make_message_update("1", CHAT_ID_2))
+            await dispatcher.join()
+
+        self.assertEqual(2, processor.max_active)
+        self.assertEqual([("start", CHAT_ID_1, "1"), ("start", CHAT_ID_2, "1")], processor.events[:2])
+
+    async def test_worker_count_is_bounded(self):
+        processor = RecordingProcessor(0.01)
+        async with make_update_dispatcher(processor, 2, 100) as dispatcher:
+            for chat_id in range(5):
+                await dispatcher.dispatch(make_message_update("1", chat_id))
+            await dispatcher.join()
+
+        self.assertEqual(2, processor.max_active)
+        self.assertEqual(10, len(processor.events))
+
+    async def test_failed_update_does_not_stop_chat(self):
+        processor = RecordingProcessor(0)
+        async with make_update_dispatcher(processor, 1, 100) as dispatcher:
+            await dispatcher.dispatch(make_message_update("fail", CHAT_ID_1))
+            await dispatcher.dispatch(make_message_update("2", CHAT_ID_1))
+            await dispatcher.join()
+
+        self.assertEqual([("start", CHAT_ID_1, "fail"), ("start", CHAT_ID_1, "2"), ("end", CHAT_ID_1, "2")],
+                         processor.events
+                         )
+
+    async def test_dispatch_waits_when_too_many_updates_are_pending(self):
+        processor = RecordingProcessor(0.05)
+        async with make_update_dispatcher(processor, 1, 2) as dispatcher:
+            await dispatcher.dispatch(make_message_update("1", CHAT_ID_1))
+            await dispatcher.dispatch(make_message_update("2", CHAT_ID_1))
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(dispatcher.dispatch(make_message_update("3", CHAT_ID_1)), 0.01)
+            await dispatcher.join()
+
+    async def test_try_dispatch_rejects_when_too_many_updates_are_pending(self):
+        processor = RecordingProcessor(0.01)
+        async with make_update_dispatcher(processor, 1, 1) as dispatcher:
+            self.assertTrue(await dispatcher.try_dispatch(make_message_update("1", CHAT_ID_1)))
+            self.assertFalse(await dispatcher.try_dispatch(make_message_update("2", CHAT_ID_2)))
+            await dispatcher.join()
+            self.assertTrue(await dispatcher.try_dispatch(make_message_update("3", CHAT_ID_2)))
+            await dispatcher.join()
+
+        self.assertEqual([("start", CHAT_ID_1, "1"), ("end", CHAT_ID_1, "1"),
+                          ("start", CHAT_ID_2, "3"), ("end", CHAT_ID_2, "3")],
+                         processor.events
+                         )
@@ -0,0 +1,59 @@
+import json
+from unittest import TestCase
+from core.bot_exeption import InvalidUpdateException
+from trivia.telegram_models import Update
+from trivia.update_parser import parse_update
+
+
+USER = {"id": 7, "is_bot": False, "first_name": "Ivan"}
+CHAT = {"id": 125, "first_name": "Ivan", "type": "private"}
+
+
+class UpdateParserTest(TestCase):
+    def test_message(self):
+        data = {
+            "update_id": 1,
+            "message": {"message_id": 2, "from": USER, "chat": CHAT, "date": 1600000000, "text": "/start"}
+        }
+        update = parse_update(json.dumps(data).encode())
+        self.assertEqual(1, update.update_id)
+        self.assertEqual(2, update.message.message_id)
+        self.assertEqual(125, update.message.chat.id)
+        self.assertEqual("/start", update.message.text)
+        self.assertIsNone(update.callback_query)
+        self.assertEqual(125, update.get_chat_id(update))
+
+    def test_callback_query(self):
+        data = {
+            "update_id": 1,
+            "callback_query": {
+                "id": "15",
+                "from": USER,
+                "message": {"message_id": 2, "from": USER, "chat": CHAT, "date": 1600000000, "text": "Вопрос"},
+                "data": "1"
+            }
+        }
+        update = parse_update(json.dumps(data).encode())
+        expected = Update.parse_obj(data)
+        self.assertEqual(expected.callback_query.id, update.callback_query.id)
+        self.assertEqual(expected.callback_query.data, update.callback_query.data)
+        self.assertEqual(expected.callback_query.message.message_id, update.callback_query.message.message_id)
+        self.assertEqual(125, update.get_chat_id(update))
+
+    def test_invalid_json(self):
+        with self.assertRaises(InvalidUpdateException):
+            parse_update(b"{\"update_id\": 1,")
+
+    def test_not_an_object(self):
+        with self.assertRaises(InvalidUpdateException):
+            parse_update(b"[1]")
+
+    def test_missing_chat(self):
+        data = {"update_id": 1, "message": {"message_id": 2, "date": 1600000000, "text": "/start"}}
+        with self.assertRaises(InvalidUpdateException):
+            parse_update(json.dumps(data).encode())
+
+    def test_wrong_field_type(self):
+        data = {"update_id": "1", "message": {"message_id": 2, "chat": CHAT, "text": "/start"}}
+        with self.assertRaises(InvalidUpdateException):
+            parse_update(json.dumps(data).encode())
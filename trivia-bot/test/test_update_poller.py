@@ -0,0 +1,56 @@
+from typing import List, Optional
+from unittest import IsolatedAsyncioTestCase
+from core.update_poller import UpdatePoller
+from test.test_bot import FakeTelegramApi, make_message_update
+from trivia.telegram_models import Update, UpdatesResponse
+
+
+CHAT_ID = 125
+
+
+def make_updates_response(*update_ids: int) -> UpdatesResponse:
+    result = []
+    for update_id in update_ids:
+        update = make_message_update(str(update_id), CHAT_ID)
+        update.update_id = update_id
+        result.append(update)
+    return UpdatesResponse(ok=True, result=result)
+
+
+class RecordingTelegramApi(FakeTelegramApi):
+    """
+    Запоминает параметры запросов getUpdates и порядок запросов и обработки update
+    """
+    def __init__(self, response_bodies: List[UpdatesResponse], events: List[str]):
+        super().__init__(response_bodies)
+        self.events = events
+        self.polls: List[tuple] = []
+
+    async def get_updates(self,
+                          offset: int,
+                          limit: int = 100,
+                          timeout: int = 10,
+                          allowed_updates: Optional[List[str]] = None
+                          ) -> UpdatesResponse:
+        self.events.append(f"poll {offset}")
+        self.polls.append((offset, limit, timeout, allowed_updates))
+        return await super().get_updates(offset, limit, timeout, allowed_updates)
+
+
+class UpdatePollerTest(IsolatedAsyncioTestCase):
+    async def test_next_poll_is_sent_before_batch_is_dispatched(self):
+        events: List[str] = []
+        responses = [make_updates_response(10, 11), make_updates_response(), make_updates_response(12)]
+        telegram_api = RecordingTelegramApi(responses, events)
+
+        async def dispatch(update: Update) -> None:
+            events.append(f"dispatch {update.update_id}")
+
+        poller = UpdatePoller(telegram_api, dispatch, 50, 30, ["message"])
+        last_update_id = await poller.run(9, max_batches=3)
+
+        self.assertEqual(12, last_update_id)
+        self.assertEqual([(10, 50, 30, ["message"]), (12, 50, 30, ["message"]), (12, 50, 30, ["message"])],
+                         telegram_api.polls
+                         )
+        self.assertEqual(["poll 10", "poll 12", "dispatch 10", "dispatch 11", "poll 12", "dispatch 12"], events)
@@ -1,11 +1,59 @@
-from core.random import Random
+from core.random import Random, T
+from core.redis_api import RedisApi
+from core.live_redis_api import LockException
+from typing import Sequence, List, Dict, Optional
 
 
 class DoNothingRandom(Random):
     def shuffle(self, data: list) -> None:
         pass
 
+    def sample(self, data: Sequence[T], k: int) -> List[T]:
+        return list(data[:k])
+
 
 class ReversedShuffleRandom(Random):
     def shuffle(self, data: list) -> None:
         data.reverse()
+
+    def sample(self, data: Sequence[T], k: int) -> List[T]:
+        return list(reversed(data))[:k]
+
+
+class InMemoryRedisApi(RedisApi):
+    """
+    RedisApi, который хранит значения в словаре. Mutex не ждет освобождения: если он занят, сразу бросается
+    LockException
+    """
+    def __init__(self):
+        self.values: Dict[str, bytes] = {}
+        self.lock_count = 0
+        self.set_count = 0
+
+    async def lock(self, key: str) -> str:
+        if key in self.values:
+            raise LockException(key, 1)
+        self.lock_count += 1
+        token = f"token_{self.lock_count}"
+        self.values[key] = token.encode()
+        return token
+
+    async def unlock(self, key: str, token: str) -> None:
+        if self.values.get(key) == token.encode():
+            del self.values[key]
+
+    async def set_key(self, key: str, value: bytes):
+        self.set_count += 1
+        self.values[key] = value
+
+    async def get_key(self, key: str) -> Optional[bytes]:
+        return self.values.get(key)
+
+    async def set_key_if_absent(self, key: str, value: bytes, expire_sec: int) -> bool:
+        if key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    async def delete_key(self, key: str) -> None:
+        self.values.pop(key, None)
@@ -1,6 +1,8 @@
+import logging
 from core.bot_state_to_dict_bijection import Bijection
 from core.bot_state import BotState
 from trivia.bot_state import GreetingState, IdleState, InGameState, BotStateFactory
+from trivia.question_catalog import QuestionNotFoundException
 from core.utils import JsonDict
 from core.bot_state_logging_wrapper import BotStateLoggingWrapper
 
@@ -47,16 +49,24 @@ class BotStateToDictBijection(Bijection[BotState, JsonDict]):
         bot_state_data = obj["bot_state_data"]
         is_logging_wrapper = obj["is_logging_wrapper"]
 
+        bot_state: BotState
         if bot_state_type == "GreetingState":
             bot_state = GreetingState(self.bot_state_factory)
+            bot_state.load(bot_state_data)
         elif bot_state_type == "IdleState":
             bot_state = self.bot_state_factory.create_idle_state()
+            bot_state.load(bot_state_data)
         elif bot_state_type == "InGameState":
-            bot_state = self.bot_state_factory.create_in_game_state()
+            try:
+                bot_state = self.bot_state_factory.restore_in_game_state(bot_state_data)
+            except QuestionNotFoundException as e:
+                # Вопрос игры удалили или изменили в каталоге. Продолжить игру нельзя, поэтому чат выходит из игры и
+                # на следующий update сообщает об этом игроку
+                logging.warning("Game can't be restored: %s", e)
+                bot_state = self.bot_state_factory.create_game_aborted_state()
         else:
             raise StateSaveException(f"Unknown bot_state type: {bot_state_type}")
 
-        bot_state.load(bot_state_data)
         if is_logging_wrapper:
             return BotStateLoggingWrapper(bot_state)
 
@@ -1,39 +1,152 @@
 from pydantic import BaseModel
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Literal
 
 
 class ServerConfig(BaseModel):
     """
     Настройки работы бота в режиме сервера.
     Url можно передать в бота разными способами, поэтому он опциональный. Бота можно запустить в режиме сервера
-    локально без парамметров key и cert, поэтому они тоже опциональны
+    локально без парамметров key и cert, поэтому они тоже опциональны.
+    process_in_background - webhook сразу отвечает Telegram и передает update в фоновую обработку. Ошибки обработки
+    при этом только логируются и не возвращаются Telegram
+    reply_in_webhook - без фоновой обработки передавать один из исходящих вызовов Telegram в ответе на webhook. Такой
+    вызов обходит ограничения telegram_rate_limit, а его ошибки Telegram не возвращает, поэтому, если ограничения
+    включены, в ответе на webhook передается только ответ на callback query, а сообщения отправляются через очередь
+    fast_update_parsing - разбирать update через orjson, проверяя только поля, которые использует бот, вместо полной
+    валидации моделей pydantic
+    metrics_path - путь, по которому метрики обработки update отдаются в формате Prometheus, например "/metrics".
+    None - не отдавать. По умолчанию выключено: путь не защищен и не должен быть доступен из интернета
     """
     host: str
     port: int
     url: Optional[str]
     key: Optional[str]
     cert: Optional[Path]
+    process_in_background: bool = False
+    reply_in_webhook: bool = True
+    fast_update_parsing: bool = False
+    metrics_path: Optional[str] = None
+
+
+class DispatcherConfig(BaseModel):
+    """
+    Настройки параллельной обработки update.
+    worker_count - сколько update обрабатывается одновременно. Update одного чата всегда обрабатываются по очереди
+    max_pending_updates - сколько полученных update может ожидать обработки
+    queue_full_policy - что делает webhook, если очередь заполнена: "wait" - ждет свободного места, "reject" - отвечает
+    Telegram 503, чтобы он повторил update позже. В режиме клиента бот всегда ждет
+    """
+    worker_count: int = 8
+    max_pending_updates: int = 100
+    queue_full_policy: Literal["wait", "reject"] = "wait"
+
+
+class ClientConfig(BaseModel):
+    """
+    Настройки работы бота в режиме клиента.
+    poll_limit - максимальное количество update в одном ответе getUpdates
+    poll_timeout_sec - сколько секунд Telegram ждет новые update в одном запросе getUpdates
+    allowed_updates - типы update, которые запрашиваются у Telegram. None - не менять настройку Telegram
+    """
+    poll_limit: int = 100
+    poll_timeout_sec: int = 10
+    allowed_updates: Optional[List[str]] = ["message", "callback_query"]
+
+
+class TelegramHttpConfig(BaseModel):
+    """
+    Настройки HTTP клиента для вызовов Telegram.
+    base_url - адрес Telegram Bot API. Можно заменить на локальный сервер для нагрузочного тестирования
+    pool_size - максимальное количество одновременно открытых соединений
+    keepalive_timeout_sec - сколько секунд неиспользуемое соединение остается открытым
+    dns_cache_ttl_sec - сколько секунд хранить результат DNS запроса
+    connect_timeout_sec - сколько секунд ждать свободное соединение и подключение к Telegram
+    request_timeout_sec - сколько секунд может занять весь вызов. Для getUpdates к нему добавляется время long polling
+    """
+    base_url: str = "https://api.telegram.org"
+    pool_size: int = 100
+    keepalive_timeout_sec: float = 30
+    dns_cache_ttl_sec: int = 300
+    connect_timeout_sec: float = 5
+    request_timeout_sec: float = 10
+
+
+class TelegramRateLimitConfig(BaseModel):
+    """
+    Ограничения исходящих вызовов Telegram, чтобы не превышать лимиты Telegram и не получать ответы 429.
+    enabled - отправлять сообщения через очередь с ограничениями
+    global_rate_per_sec - сколько сообщений в секунду бот отправляет во все чаты
+    chat_rate_per_sec - сколько сообщений в секунду бот отправляет в один чат
+    chat_burst - сколько сообщений подряд можно отправить в один чат без ожидания
+    max_retries - сколько раз повторять вызов после ответа 429
+    max_wait_sec - сколько секунд вызов может ждать в очереди. Вызовы отправляются под mutex чата, поэтому вместе с
+    таймаутом HTTP запроса это время должно быть меньше `redis.expire_sec`
+    """
+    enabled: bool = True
+    global_rate_per_sec: float = 30
+    chat_rate_per_sec: float = 1
+    chat_burst: int = 3
+    max_retries: int = 5
+    max_wait_sec: float = 2
 
 
 class LiveRedisApiConfig(BaseModel):
     """
-    Настройки Redis клиента
+    Настройки Redis клиента.
+    max_connections - максимальное количество соединений в пуле
+    pool_timeout_sec - сколько секунд команда ждет свободное соединение, если все соединения пула заняты
+    max_lock_waiters - сколько ожидающих mutex одновременно повторяют попытки его получить. Должно быть меньше
+    max_connections, чтобы владельцы mutex всегда могли его освободить
     """
     host: str
     port: int
     expire_sec: int
     max_attempts: int
     delay_ms: int
+    max_connections: int = 20
+    pool_timeout_sec: int = 5
+    max_lock_waiters: int = 10
+
+
+class StateCacheConfig(BaseModel):
+    """
+    Настройки кеша декодированных состояний чатов.
+    max_size - максимальное количество состояний в кеше, 0 выключает кеш
+    ttl_sec - сколько секунд состояние хранится в кеше
+    """
+    max_size: int = 10000
+    ttl_sec: float = 300
+
+
+class DeduplicationConfig(BaseModel):
+    """
+    Настройки пропуска повторно доставленных update.
+    storage - где хранить идентификаторы полученных update: "memory" - в памяти бота, "redis" - в Redis, чтобы
+    повторы отсекались для всех экземпляров бота. В режиме клиента идентификаторы всегда хранятся в памяти
+    window_size - сколько последних идентификаторов хранить в памяти
+    ttl_sec - сколько секунд хранить идентификатор в Redis
+    """
+    enabled: bool = True
+    storage: Literal["memory", "redis"] = "redis"
+    window_size: int = 10000
+    ttl_sec: int = 3600
 
 
 class GameConfig(BaseModel):
     """
-    Настройки количествао вопросов разной сложности
+    Настройки количествао вопросов разной сложности.
+    save_question_ids - сохранять в состоянии игры только идентификаторы вопросов из каталога вместо полного текста.
+    Если вопрос игры удалят из каталога, игру нельзя будет продолжить: на следующее сообщение или нажатие кнопки бот
+    ответит, что игра прервана, и чат выйдет из игры
+    edit_in_place - после ответа на кнопке показывать результат и следующий вопрос в том же сообщении вместо отправки
+    нового сообщения. Ответ обходится одним вызовом Telegram меньше
     """
     easy_question_count: int
     medium_question_count: int
     hard_question_count: int
+    save_question_ids: bool = True
+    edit_in_place: bool = False
 
     @staticmethod
     def make(easy_question_count: int,
@@ -47,13 +160,40 @@ class GameConfig(BaseModel):
                           )
 
 
+class LoggingConfig(BaseModel):
+    """
+    Настройки логирования. Записи передаются через очередь в отдельный поток, который форматирует их и пишет в файл.
+    rotation - когда начинать новый файл лога: "size" - когда файл вырос до `max_bytes`, "time" - каждый интервал
+    `when` (значения как у logging.handlers.TimedRotatingFileHandler: "H", "midnight" и т.д.)
+    backup_count - сколько старых файлов лога хранить
+    sample_every - для модулей из словаря записывается только каждая N-я запись уровня INFO и ниже, например
+    {"bot_state_logging_wrapper": 100}. Предупреждения и ошибки записываются всегда
+    """
+    level: str = "INFO"
+    rotation: Literal["size", "time"] = "size"
+    max_bytes: int = 50 * 1024 * 1024
+    when: str = "midnight"
+    backup_count: int = 5
+    sample_every: Dict[str, int] = {}
+
+
 class BotConfig(BaseModel):
     """
-    Настройки бота
+    Настройки бота.
+    state_codec - формат, в котором состояния чатов сохраняются в Redis. Состояния в JSON читаются при любом значении,
+    поэтому "json" нужен, только пока работают боты, не умеющие читать "msgpack"
     """
     questions_filepath: Path
     game_config: GameConfig
     is_server: bool
     server: ServerConfig
+    client: ClientConfig = ClientConfig()
+    telegram_http: TelegramHttpConfig = TelegramHttpConfig()
+    telegram_rate_limit: TelegramRateLimitConfig = TelegramRateLimitConfig()
+    dispatcher: DispatcherConfig = DispatcherConfig()
+    deduplication: DeduplicationConfig = DeduplicationConfig()
     redis: LiveRedisApiConfig
+    state_cache: StateCacheConfig = StateCacheConfig()
+    state_codec: Literal["json", "msgpack"] = "msgpack"
+    logging: LoggingConfig = LoggingConfig()
     out_path: Optional[str]
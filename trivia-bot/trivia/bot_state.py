@@ -1,10 +1,11 @@
-from typing import List, Tuple
+from typing import List
 from core.keyboard import Keyboard
 from core.message import Message
 from core.command import Command
 from core.callback_query import CallbackQuery
 from core.message_edit import MessageEdit
 from trivia.question_storage import Question, QuestionStorage
+from trivia.question_catalog import QuestionCatalog, QuestionNotFoundException
 from typing import Optional
 from core.button import Button
 import uuid
@@ -18,13 +19,23 @@ from trivia.bot_config import GameConfig
 from core.bot_exeption import NotEnoughQuestionsException
 
 
+# Символы для компактной записи порядка ответов в сохраненном состоянии игры. Индекс ответа записывается одним
+# символом в системе счисления с основанием 36
+ANSWER_ORDER_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
 class BotStateFactory:
     """
         Служит для создания состояний бота
     """
 
     def __init__(self, questions_storage: QuestionStorage, random: Random, config: GameConfig):
-        self.questions_storage = questions_storage
+        """
+        :param questions_storage: хранилище вопросов. Вопросы считываются из него один раз при создании фабрики
+        :param random: интерфейс для работы с random
+        :param config: настройки количества вопросов в игре
+        """
+        self.question_catalog = QuestionCatalog(questions_storage)
         self.random = random
         self.config = config
 
@@ -39,7 +50,7 @@ class BotStateFactory:
     def __repr__(self):
         return f"""
                     BotStateFactory: 
-                        questions_storage = {self.questions_storage}
+                        question_catalog = {self.question_catalog}
                         random = {self.random} 
                 """
 
@@ -58,9 +69,8 @@ class BotStateFactory:
         :return: InGameState
         """
 
-        all_questions = self.questions_storage.load_questions()
-        self.random.shuffle(all_questions)
-        game_questions = select_questions(all_questions,
+        game_questions = select_questions(self.question_catalog,
+                                          self.random,
                                           self.config.easy_question_count,
                                           self.config.medium_question_count,
                                           self.config.hard_question_count
@@ -69,29 +79,32 @@ class BotStateFactory:
         game_id = str(uuid.uuid4())
 
         for question in game_questions:
-            indexed_answers = list(enumerate(question.answers))
-            self.random.shuffle(indexed_answers)
-            original_correct_answer = question.correct_answer
-            correct_answer = 0
-            answers = []
-
-            for (index, (original_index, answer)) in enumerate(indexed_answers):
-                if original_index == original_correct_answer:
-                    correct_answer = index
-                answers.append(answer)
-
-            new_game_questions.append(Question(question.text,
-                                               answers,
-                                               question.points,
-                                               question.difficulty,
-                                               correct_answer
-                                               )
-                                      )
+            answer_order = list(range(len(question.answers)))
+            self.random.shuffle(answer_order)
+            new_game_questions.append(reorder_answers(question, answer_order))
 
         game_state = InGameState.State(new_game_questions, game_id)
         in_game_state = InGameState(self, game_state)
         return in_game_state
 
+    def create_game_aborted_state(self) -> "GameAbortedState":
+        """
+            Создает GameAbortedState
+        :return: GameAbortedState
+        """
+        return GameAbortedState(self)
+
+    def restore_in_game_state(self, data: JsonDict) -> "InGameState":
+        """
+            Восстанавливает InGameState из сохраненного ранее словаря. Новая игра при этом не создается, поэтому
+            восстановление не выбирает вопросы и не перемешивает ответы
+        :param data: словарь, полученный из InGameState.save()
+        :return: InGameState
+        """
+        in_game_state = InGameState(self, InGameState.State([], ""))
+        in_game_state.load(data)
+        return in_game_state
+
 
 class TestState(BotState):
     """
@@ -249,11 +262,10 @@ class IdleState(BotState):
             :return: ответ бота
         """
         new_state = None
-        in_game_state = self.state_factory.create_in_game_state()
         user_command = command.text
         if user_command == "/start":
             response_message = Message(command.chat_id, "<i>Игра начинается</i>", "HTML")
-            new_state = in_game_state
+            new_state = self.state_factory.create_in_game_state()
         elif user_command == "/help":
             response_message = Message(command.chat_id, "<i>Введите /start или /help</i>", "HTML")
         else:
@@ -275,6 +287,36 @@ class IdleState(BotState):
         return None
 
 
+class GameAbortedState(IdleState):
+    """
+        Состояние чата, игру которого нельзя продолжить, потому что ее вопросов больше нет в каталоге. На следующее
+        сообщение, команду или нажатие кнопки старой игры бот сообщает, что игра прервана, и переходит в IdleState.
+        Команда /start сразу начинает новую игру. Сохраняется как IdleState
+    """
+
+    def __str__(self):
+        return f"GameAbortedState.state_factory = {self.state_factory}"
+
+    def process_message(self, message: Message) -> BotResponse:
+        return self._abort_game(message.chat_id)
+
+    def process_command(self, command: Command) -> BotResponse:
+        if command.text == "/start":
+            return super().process_command(command)
+        return self._abort_game(command.chat_id)
+
+    def process_callback_query(self, callback_query: CallbackQuery) -> Optional[BotResponse]:
+        return self._abort_game(callback_query.message.chat_id)
+
+    def _abort_game(self, chat_id: int) -> BotResponse:
+        response_message = Message(chat_id,
+                                   "<i>Игра прервана: ее вопросы больше недоступны. Введите /start, чтобы начать новую "
+                                   "игру</i>",
+                                   "HTML"
+                                   )
+        return BotResponse(message=response_message, new_state=self.state_factory.create_idle_state())
+
+
 class InGameState(BotState):
     """
     Состояние бота в котором происходит игра
@@ -321,8 +363,7 @@ class InGameState(BotState):
         """
         correct_answer = self.state.questions[self.state.current_question].correct_answer
         user_message = message.text
-        message, new_state = self._process_answer(user_message, message.chat_id, correct_answer)
-        return BotResponse(message, new_state=new_state)
+        return self._process_answer(user_message, message.chat_id, correct_answer)
 
     def process_command(self, command: Command) -> BotResponse:
         """
@@ -360,9 +401,12 @@ class InGameState(BotState):
             correct_answer = self.state.questions[quest_id].correct_answer
 
             if game_id == self.state.game_id and quest_id == self.state.current_question:
-                message, new_state = self._process_answer(answer_id, chat_id, correct_answer)
-                message_edit = self._get_message_edit(quest_id, answer_id, correct_answer, chat_id, message_id)
-                return BotResponse(message, message_edit=message_edit, new_state=new_state)
+                response = self._process_answer(answer_id, chat_id, correct_answer)
+                response.message_edit = self._get_message_edit(quest_id, answer_id, correct_answer, chat_id, message_id)
+                if self.state_factory.config.edit_in_place and response.state_changed and response.message is not None:
+                    response.message_edit = append_message_to_edit(response.message_edit, response.message)
+                    response.message = None
+                return response
         return None
 
     def on_enter(self, chat_id: int) -> Optional[Message]:
@@ -386,10 +430,25 @@ class InGameState(BotState):
         return response_message
 
     def save(self) -> JsonDict:
+        """
+            Сохраняет состояние игры. Если включена настройка `save_question_ids` и все вопросы игры есть в каталоге,
+            то сохраняются только идентификаторы вопросов и порядок ответов, иначе сохраняются вопросы целиком
+        """
+        if self.state_factory.config.save_question_ids:
+            data = self._save_question_ids()
+            if data is not None:
+                return data
+
         return self.state.to_dict()    # type: ignore
 
     def load(self, data: JsonDict) -> None:
-        self.state = InGameState.State.from_dict(data)   # type: ignore
+        """
+            Загружает состояние игры. Поддерживает оба формата: с идентификаторами вопросов и с вопросами целиком
+        """
+        if "question_ids" in data:
+            self.state = self._load_question_ids(data)
+        else:
+            self.state = InGameState.State.from_dict(data)   # type: ignore
 
     def parse_int(self, s: str) -> Optional[int]:
         if s.isdigit():
@@ -400,8 +459,9 @@ class InGameState(BotState):
                         answer: str,
                         chat_id: int,
                         correct_answer: int
-                        ) -> Tuple[Message, Optional[BotState]]:
+                        ) -> BotResponse:
         new_state: Optional[BotState] = None
+        state_changed = False
         num_of_resp = len(self.state.questions[self.state.current_question].answers)
         answer_id = self.parse_int(answer)
 
@@ -418,6 +478,7 @@ class InGameState(BotState):
                 "HTML"
             )
         else:
+            state_changed = True
             if correct_answer == answer_id - 1:
                 self.state.game_score += self.state.questions[self.state.current_question].points
 
@@ -435,7 +496,46 @@ class InGameState(BotState):
                 message_text = format.make_message(1, game_score=self.state.game_score)
                 response_message = Message(chat_id, message_text, "HTML")
 
-        return response_message, new_state
+        return BotResponse(response_message, new_state=new_state, state_changed=state_changed)
+
+    def _save_question_ids(self) -> Optional[JsonDict]:
+        catalog = self.state_factory.question_catalog
+        question_ids = []
+        answer_orders = []
+        for question in self.state.questions:
+            question_id = catalog.get_question_id(question)
+            catalog_question = catalog.get_question(question_id)
+            if catalog_question is None:
+                return None
+
+            answer_order = get_answer_order(catalog_question.answers, question.answers)
+            if answer_order is None or len(answer_order) > len(ANSWER_ORDER_DIGITS):
+                return None
+
+            if reorder_answers(catalog_question, answer_order) != question:
+                return None
+
+            question_ids.append(question_id)
+            answer_orders.append("".join(ANSWER_ORDER_DIGITS[index] for index in answer_order))
+
+        return {
+            "question_ids": question_ids,
+            "answer_orders": answer_orders,
+            "game_id": self.state.game_id,
+            "current_question": self.state.current_question,
+            "game_score": self.state.game_score
+        }
+
+    def _load_question_ids(self, data: JsonDict) -> "InGameState.State":
+        catalog = self.state_factory.question_catalog
+        questions = []
+        for question_id, answer_order in zip(data["question_ids"], data["answer_orders"]):
+            catalog_question = catalog.get_question(question_id)
+            if catalog_question is None:
+                raise QuestionNotFoundException(f"Question {question_id} is not found in the catalog")
+            questions.append(reorder_answers(catalog_question, [int(digit, 36) for digit in answer_order]))
+
+        return InGameState.State(questions, data["game_id"], data["current_question"], data["game_score"])
 
     def _get_message_edit(self, question_id: int,
                           answer_text: Optional[str],
@@ -460,6 +560,21 @@ class InGameState(BotState):
                            )
 
 
+def append_message_to_edit(message_edit: MessageEdit, message: Message) -> MessageEdit:
+    """
+        Дописывает текст сообщения в конец редактируемого сообщения и заменяет клавиатуру на клавиатуру сообщения
+    :param message_edit: редактирование сообщения
+    :param message: сообщение, которое нужно было бы отправить после редактирования
+    :return: редактирование, заменяющее оба вызова
+    """
+    return MessageEdit(message_edit.chat_id,
+                       message_edit.message_id,
+                       f"{message_edit.text}\n\n{message.text}",
+                       message_edit.parse_mode,
+                       message.keyboard
+                       )
+
+
 def make_keyboard_for_question(num_answers: int, game_id: str, question_id: int) -> Keyboard:
     def button(answer_id: int):
         callback_data = f"{game_id}.{question_id}.{answer_id}"
@@ -474,34 +589,61 @@ def make_keyboard_for_question(num_answers: int, game_id: str, question_id: int)
         return Keyboard([row])
 
 
-def select_questions(questions: List[Question], easy: int, medium: int, hard: int) -> List[Question]:
+def reorder_answers(question: Question, answer_order: List[int]) -> Question:
     """
-        Создает List[Questions] из вопросов
-        :param questions: вопросы
-        :param easy: количество легких вопросов
-        :param medium: количество средних вопросов
-        :param hard: количество сложных вопросов
-        :return: Список вопросов
+        Создает вопрос с переставленными ответами
+        :param question: исходный вопрос
+        :param answer_order: индексы ответов исходного вопроса в новом порядке
+        :return: вопрос с ответами в новом порядке и соответствующим индексом правильного ответа
     """
-    new_questions = []
-    for question in questions:
-        if question.difficulty == Question.Difficulty.EASY and easy != 0:
-            new_questions.append(question)
-            easy -= 1
+    answers = [question.answers[index] for index in answer_order]
+    correct_answer = answer_order.index(question.correct_answer)
+    return Question(question.text, answers, question.points, question.difficulty, correct_answer)
 
-        if question.difficulty == Question.Difficulty.MEDIUM and medium != 0:
-            new_questions.append(question)
-            medium -= 1
 
-        if question.difficulty == Question.Difficulty.HARD and hard != 0:
-            new_questions.append(question)
-            hard -= 1
+def get_answer_order(original_answers: List[str], answers: List[str]) -> Optional[List[int]]:
+    """
+        Находит перестановку, которая переводит `original_answers` в `answers`
+        :param original_answers: исходные ответы
+        :param answers: переставленные ответы
+        :return: индексы исходных ответов в новом порядке. Вернет None, если `answers` не перестановка
+                 `original_answers` или если перестановку нельзя определить однозначно из-за одинаковых ответов
+    """
+    if len(original_answers) != len(answers) or not set(answers).issubset(original_answers):
+        return None
 
-        if easy == medium == hard == 0:
-            break
+    answer_order = [original_answers.index(answer) for answer in answers]
+    if len(set(answer_order)) != len(answer_order):
+        return None
+    return answer_order
 
-    if easy != 0 or medium != 0 or hard != 0:
-        raise NotEnoughQuestionsException("Not enough questions build a questions list")
 
-    sort_questions = sorted(new_questions, key=lambda k: k.difficulty)
-    return sort_questions
+def select_questions(catalog: QuestionCatalog,
+                     random: Random,
+                     easy: int,
+                     medium: int,
+                     hard: int
+                     ) -> List[Question]:
+    """
+        Создает List[Questions] из вопросов каталога. Вопросы каждой сложности выбираются случайно напрямую из
+        соответствующей группы каталога, поэтому время выбора не зависит от размера каталога
+        :param catalog: каталог вопросов
+        :param random: интерфейс для работы с random
+        :param easy: количество легких вопросов
+        :param medium: количество средних вопросов
+        :param hard: количество сложных вопросов
+        :return: Список вопросов, отсортированный по сложности
+    """
+    counts = [
+        (Question.Difficulty.EASY, easy),
+        (Question.Difficulty.MEDIUM, medium),
+        (Question.Difficulty.HARD, hard)
+    ]
+    for difficulty, count in counts:
+        if len(catalog.get_questions(difficulty)) < count:
+            raise NotEnoughQuestionsException("Not enough questions build a questions list")
+
+    new_questions: List[Question] = []
+    for difficulty, count in counts:
+        new_questions.extend(random.sample(catalog.get_questions(difficulty), count))
+    return new_questions
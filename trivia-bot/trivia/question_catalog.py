@@ -0,0 +1,68 @@
+from typing import List, Dict, Sequence, Optional
+from trivia.question_storage import Question, QuestionStorage
+from core.utils import get_sha256_hash
+
+
+class QuestionNotFoundException(Exception):
+    """
+    Ошибка поиска вопроса в каталоге по идентификатору
+    """
+    pass
+
+
+class QuestionCatalog(QuestionStorage):
+    """
+        Каталог вопросов в памяти. Считывает вопросы из хранилища один раз при создании и раскладывает их по
+        сложности, чтобы новые игры создавались без повторного чтения и разбора хранилища
+    """
+
+    def __init__(self, questions_storage: QuestionStorage):
+        """
+        :param questions_storage: хранилище, из которого вопросы будут считаны один раз
+        """
+        self.questions = questions_storage.load_questions()
+        self.questions_by_difficulty: Dict[Question.Difficulty, List[Question]] = {
+            difficulty: [] for difficulty in Question.Difficulty
+        }
+        self.questions_by_id: Dict[str, Question] = {}
+        for question in self.questions:
+            self.questions_by_difficulty[question.difficulty].append(question)
+            self.questions_by_id.setdefault(QuestionCatalog.get_question_id(question), question)
+
+    def __repr__(self):
+        sizes = {difficulty.name: len(questions) for difficulty, questions in self.questions_by_difficulty.items()}
+        return f"QuestionCatalog: {sizes}"
+
+    def load_questions(self) -> List[Question]:
+        """
+            Возвращает копию списка всех вопросов каталога. Копию можно изменять, каталог при этом не меняется
+        :return: список вопросов
+        """
+        return list(self.questions)
+
+    def get_questions(self, difficulty: Question.Difficulty) -> Sequence[Question]:
+        """
+            Возвращает вопросы переданной сложности. Возвращаемую последовательность нельзя изменять
+        :param difficulty: сложность вопросов
+        :return: последовательность вопросов
+        """
+        return self.questions_by_difficulty[difficulty]
+
+    def get_question(self, question_id: str) -> Optional[Question]:
+        """
+            Возвращает вопрос по его идентификатору
+        :param question_id: идентификатор вопроса
+        :return: вернет None, если вопроса с таким идентификатором нет в каталоге
+        """
+        return self.questions_by_id.get(question_id)
+
+    @staticmethod
+    def get_question_id(question: Question) -> str:
+        """
+            Возвращает идентификатор вопроса. Идентификатор вычисляется из текста вопроса и вариантов ответа и
+            не зависит от порядка ответов и от порядка вопросов в хранилище
+        :param question: вопрос
+        :return: идентификатор вопроса
+        """
+        content = "\n".join([question.text, *sorted(question.answers)])
+        return get_sha256_hash(content)[:12]
@@ -0,0 +1,105 @@
+import json
+import msgpack   # type: ignore
+from abc import ABCMeta, abstractmethod
+from typing import Any
+from core.utils import JsonDict
+from trivia.question_storage import Question, JSONEncoder, JSONDecoder
+
+
+class StateCodecException(Exception):
+    """
+    Ошибка декодирования сохраненного состояния бота
+    """
+    pass
+
+
+class StateCodec(metaclass=ABCMeta):
+    """
+    Интерфейс для преобразования словаря с состоянием бота в байты для хранения и обратно
+    """
+
+    @abstractmethod
+    def encode(self, data: JsonDict) -> bytes:
+        """
+        Кодирует словарь с состоянием бота
+        :param data: словарь, полученный из BotStateToDictBijection
+        :return: байты для хранения
+        """
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> JsonDict:
+        """
+        Декодирует словарь с состоянием бота
+        :param data: байты, полученные из encode
+        :return: словарь для BotStateToDictBijection
+        """
+        pass
+
+
+class JsonStateCodec(StateCodec):
+    """
+    Хранит состояние в виде JSON в кодировке UTF-8
+    """
+
+    def encode(self, data: JsonDict) -> bytes:
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode()
+
+    def decode(self, data: bytes) -> JsonDict:
+        return json.loads(data, cls=JSONDecoder)
+
+
+class MsgpackStateCodec(StateCodec):
+    """
+    Хранит состояние в бинарном формате: заголовок из байта MAGIC и номера версии формата, за которым следует
+    состояние, закодированное в msgpack. JSON не может начинаться с байта MAGIC, поэтому данные без заголовка
+    декодируются через `fallback`, что позволяет читать состояния, сохраненные раньше в JSON
+    """
+    # 0xc1 никогда не используется в msgpack и не может быть первым байтом JSON в UTF-8
+    MAGIC = 0xc1
+    VERSION = 1
+    HEADER = bytes([MAGIC, VERSION])
+    DIFFICULTY_EXT_TYPE = 1
+
+    def __init__(self, fallback: StateCodec = JsonStateCodec()):
+        """
+        :param fallback: кодек для данных без заголовка
+        """
+        self.fallback = fallback
+
+    def encode(self, data: JsonDict) -> bytes:
+        return MsgpackStateCodec.HEADER + msgpack.packb(data, default=_encode_ext, use_bin_type=True, strict_types=True)
+
+    def decode(self, data: bytes) -> JsonDict:
+        if data[:1] != MsgpackStateCodec.HEADER[:1]:
+            return self.fallback.decode(data)
+
+        if data[1:2] != MsgpackStateCodec.HEADER[1:2]:
+            raise StateCodecException(f"Unknown state format version: {data[1:2].hex()}")
+
+        return msgpack.unpackb(data[len(MsgpackStateCodec.HEADER):], ext_hook=_decode_ext, raw=False)
+
+
+def make_state_codec(name: str) -> StateCodec:
+    """
+    Создает кодек по названию из настроек
+    :param name: json или msgpack
+    :return: кодек
+    """
+    if name == "json":
+        return JsonStateCodec()
+    elif name == "msgpack":
+        return MsgpackStateCodec()
+    raise StateCodecException(f"Unknown state codec: {name}")
+
+
+def _encode_ext(obj: Any) -> msgpack.ExtType:
+    if isinstance(obj, Question.Difficulty):
+        return msgpack.ExtType(MsgpackStateCodec.DIFFICULTY_EXT_TYPE, bytes([obj.value]))
+    raise TypeError(f"Can not encode {type(obj).__name__}")
+
+
+def _decode_ext(code: int, data: bytes) -> Any:
+    if code == MsgpackStateCodec.DIFFICULTY_EXT_TYPE:
+        return Question.Difficulty(data[0])
+    return msgpack.ExtType(code, data)
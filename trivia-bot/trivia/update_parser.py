@@ -0,0 +1,71 @@
+import orjson
+from typing import Any, Optional
+from core.bot_exeption import InvalidUpdateException
+from trivia.telegram_models import Update, Message, CallBackQuery, Chat
+
+
+def parse_update(body: bytes) -> Update:
+    """
+        Быстрый разбор тела webhook запроса. В отличие от Update.parse_obj, проверяет и заполняет только поля, которые
+        использует бот: идентификаторы update, чата, сообщения и callback query, текст сообщения и данные
+        callback query. Модели создаются через construct без валидации pydantic, остальные поля в них не заполняются
+    :param body: тело запроса
+    :return: update
+    """
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise InvalidUpdateException("Update is not a valid JSON")
+
+    if not isinstance(data, dict):
+        raise InvalidUpdateException("Update is not a JSON object")
+
+    message = data.get("message")
+    callback_query = data.get("callback_query")
+    return Update.construct(update_id=_get_int(data, "update_id"),
+                            message=_parse_message(message) if message is not None else None,
+                            callback_query=_parse_callback_query(callback_query) if callback_query is not None else None
+                            )
+
+
+def _parse_message(data: Any) -> Message:
+    if not isinstance(data, dict):
+        raise InvalidUpdateException("Message is not a JSON object")
+
+    chat = data.get("chat")
+    if not isinstance(chat, dict):
+        raise InvalidUpdateException("Message chat is not found")
+
+    return Message.construct(message_id=_get_int(data, "message_id"),
+                             chat=Chat.construct(id=_get_int(chat, "id")),
+                             text=_get_optional_str(data, "text")
+                             )
+
+
+def _parse_callback_query(data: Any) -> CallBackQuery:
+    if not isinstance(data, dict):
+        raise InvalidUpdateException("CallbackQuery is not a JSON object")
+
+    callback_query_id = data.get("id")
+    if not isinstance(callback_query_id, str):
+        raise InvalidUpdateException("CallbackQuery id is not found")
+
+    message = data.get("message")
+    return CallBackQuery.construct(id=callback_query_id,
+                                   message=_parse_message(message) if message is not None else None,
+                                   data=_get_optional_str(data, "data")
+                                   )
+
+
+def _get_int(data: dict, key: str) -> int:
+    value = data.get(key)
+    if type(value) is not int:
+        raise InvalidUpdateException(f"Field {key} is not an integer")
+    return value
+
+
+def _get_optional_str(data: dict, key: str) -> Optional[str]:
+    value = data.get(key)
+    if value is not None and not isinstance(value, str):
+        raise InvalidUpdateException(f"Field {key} is not a string")
+    return value